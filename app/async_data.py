@@ -0,0 +1,242 @@
+"""
+async_data.py
+-------------
+Coroutine versions of the handle_data read functions, over the async MongoDB
+client (see db.async_collection), for async_server.py.
+
+Queries, projections and serializers are handle_data's own, so both servers
+return the same documents; only the I/O differs. Writes stay in handle_data:
+they update counters, rollups and caches together, and async_server runs them
+in a thread. Conversations stored in the bucketed layout (sentence_store.py)
+get their buckets through the async client too, except for windowed sentence
+pages, which run sentence_store.page in a thread.
+"""
+import asyncio
+from datetime import datetime
+
+from bson import ObjectId
+
+import handle_data
+import rollups
+import sentence_store
+from db import async_collection
+from handle_data import (
+    STREAM_BATCH_SIZE,
+    SentenceSearch,
+    conversation_serializer,
+    person_serializer,
+)
+
+people_reads = async_collection("People", read_only=True)
+conversations = async_collection("Conversations")
+conversations_reads = async_collection("Conversations", read_only=True)
+buckets_reads = async_collection("SentenceBuckets", read_only=True)
+recordings_reads = async_collection("Recordings", read_only=True)
+rollups_reads = async_collection("Rollups", read_only=True)
+
+
+async def _with_sentences(docs: list, summary: bool = False) -> list:
+    """handle_data._with_sentences: load the buckets of the bucketed documents among docs in one query."""
+    pending = {d["_id"]: d for d in docs if sentence_store.is_bucketed(d) and "sentences" not in d}
+    if summary or not pending:
+        return docs
+    for d in pending.values():
+        d["sentences"] = []
+    cursor = buckets_reads.find({"conversation": {"$in": list(pending)}}, {"conversation": 1, "sentences": 1})
+    async for bucket in cursor.sort([("conversation", 1), ("index", 1)]):
+        pending[bucket["conversation"]]["sentences"].extend(bucket["sentences"])
+    for d in pending.values():
+        # Sentences of a live append still in progress are not counted yet
+        del d["sentences"][d.get("sentence_count", 0):]
+    return docs
+
+
+# -----------------------------
+# People
+# -----------------------------
+async def iter_people(fast: bool = False):
+    serialize = person_serializer(fast)
+    async for p in people_reads.find().batch_size(STREAM_BATCH_SIZE):
+        yield serialize(p)
+
+
+async def get_all_people(fast: bool = False):
+    return [p async for p in iter_people(fast)]
+
+
+async def get_people_page(limit: int, after: str = None, fast: bool = False):
+    docs = await people_reads.find(handle_data.people_page_query(after)).sort("_id", 1).limit(limit + 1).to_list()
+    next_cursor = handle_data.encode_cursor(docs[limit - 1]["_id"]) if len(docs) > limit else None
+    serialize = person_serializer(fast)
+    return [serialize(p) for p in docs[:limit]], next_cursor
+
+
+async def get_person_by_name(name: str, fast: bool = False):
+    p_doc = await people_reads.find_one({"name": name})
+    if not p_doc:
+        return None
+    return person_serializer(fast)(p_doc)
+
+
+async def get_flag_counts(names: list) -> dict:
+    docs = people_reads.find({"name": {"$in": list(names)}}, {"name": 1, "flag_count": 1})
+    return {d["name"]: d.get("flag_count", 0) async for d in docs}
+
+
+async def get_person_ids(names: list) -> dict:
+    return {d["name"]: d["_id"] async for d in people_reads.find({"name": {"$in": list(names)}}, {"name": 1})}
+
+
+# -----------------------------
+# Conversations
+# -----------------------------
+async def iter_conversations(summary: bool = False, fast: bool = False):
+    projection, serialize = conversation_serializer(summary, fast)
+    cursor = conversations_reads.find({}, projection).batch_size(STREAM_BATCH_SIZE)
+    while True:
+        batch = await cursor.to_list(STREAM_BATCH_SIZE)
+        if not batch:
+            return
+        for c in await _with_sentences(batch, summary):
+            yield serialize(c)
+
+
+async def get_all_conversations(summary: bool = False, fast: bool = False):
+    return [c async for c in iter_conversations(summary, fast)]
+
+
+async def get_conversations_page(limit: int, after: str = None, summary: bool = False, fast: bool = False):
+    query = handle_data.conversations_page_query(after)
+    projection, serialize = conversation_serializer(summary, fast)
+    cursor = conversations_reads.find(query, projection).sort([("start_time", 1), ("_id", 1)]).limit(limit + 1)
+    docs = await cursor.to_list()
+    next_cursor = handle_data.conversations_page_cursor(docs, limit)
+    return [serialize(c) for c in await _with_sentences(docs[:limit], summary)], next_cursor
+
+
+async def get_conversation_by_id(conv_id: str, summary: bool = False, fast: bool = False):
+    if not ObjectId.is_valid(conv_id):
+        return None
+    projection, serialize = conversation_serializer(summary, fast)
+    c_doc = await conversations_reads.find_one({"_id": ObjectId(conv_id)}, projection)
+    if not c_doc:
+        return None
+    # The model path would load a bucketed conversation lazily, with the sync client
+    await _with_sentences([c_doc], summary)
+    return serialize(c_doc)
+
+
+async def get_conversation_sentences(conv_id: str, offset: int = 0, limit: int = 50,
+                                     start: datetime = None, end: datetime = None):
+    if not ObjectId.is_valid(conv_id):
+        return None
+    cursor = await conversations_reads.aggregate(handle_data.sentences_page_pipeline(conv_id, offset, limit, start, end))
+    rows = await cursor.to_list()
+    if not rows:
+        return None
+    total, docs = rows[0]["total"], rows[0]["sentences"]
+    if sentence_store.is_bucketed(rows[0]):
+        total, docs = await asyncio.to_thread(sentence_store.page, rows[0], offset, limit, start, end)
+    return handle_data.sentences_page(conv_id, offset, total, docs)
+
+
+async def get_flagged_sentences(conv_id: str):
+    if not ObjectId.is_valid(conv_id):
+        return None
+    cursor = await conversations_reads.aggregate(handle_data.flagged_sentences_pipeline(conv_id))
+    rows = await cursor.to_list()
+    if not rows:
+        return None
+    docs = rows[0]["sentences"]
+    if sentence_store.is_bucketed(rows[0]):
+        docs = await asyncio.to_thread(sentence_store.find_flagged, rows[0])
+    return handle_data.flagged_page(conv_id, docs)
+
+
+async def get_sentence(conv_id: str, sentence_id: str):
+    if not ObjectId.is_valid(conv_id) or not ObjectId.is_valid(sentence_id):
+        return None
+    c_doc = await conversations_reads.find_one({"_id": ObjectId(conv_id)}, handle_data.sentence_projection(sentence_id))
+    if c_doc and sentence_store.is_bucketed(c_doc):
+        bucket = await buckets_reads.find_one({"conversation": c_doc["_id"], "sentences._id": ObjectId(sentence_id)},
+                                              {"sentences": {"$elemMatch": {"_id": ObjectId(sentence_id)}}})
+        c_doc = bucket
+    if not c_doc or not c_doc.get("sentences"):
+        return None
+    return c_doc["sentences"][0]
+
+
+async def get_conversations_by_person(name: str, summary: bool = False, fast: bool = False):
+    person_doc = await people_reads.find_one({"name": name}, {"conversations": 1})
+    if not person_doc:
+        return []
+    return await get_conversations_by_ids(person_doc.get("conversations", []), summary, fast)
+
+
+async def get_conversations_by_ids(convo_ids: list, summary: bool = False, fast: bool = False):
+    convo_ids = [ObjectId(c) for c in convo_ids]
+    if not convo_ids:
+        return []
+    projection, serialize = conversation_serializer(summary, fast)
+    docs = await conversations_reads.find({"_id": {"$in": convo_ids}}, projection).to_list()
+    return [serialize(c) for c in await _with_sentences(docs, summary)]
+
+
+async def get_person_overview(name: str, summary: bool = True):
+    """handle_data.get_person_overview: the person document, then their conversations."""
+    person_doc = await people_reads.find_one({"name": name})
+    if not person_doc:
+        return None
+    return handle_data.overview(person_doc, await get_conversations_by_ids(person_doc.get("conversations", []),
+                                                                          summary, fast=True))
+
+
+async def find_duplicate_conversation(content_hash: str = None, idempotency_key: str = None):
+    clauses = []
+    if idempotency_key:
+        clauses.append({"idempotency_key": idempotency_key})
+    if content_hash:
+        clauses.append({"content_hash": content_hash})
+    if not clauses:
+        return None
+    doc = await conversations.find_one({"$or": clauses}, {"_id": 1, "ingest_step": 1})
+    if doc and "ingest_step" in doc:
+        # Left half-written by a failed upload: finish it with the sync writes
+        await asyncio.to_thread(handle_data.finish_conversation, doc["_id"])
+    return doc["_id"] if doc else None
+
+
+# -----------------------------
+# Search, trends, recordings
+# -----------------------------
+async def search_sentences(query: str, person_id=None, speaker_id=None, start: datetime = None, end: datetime = None,
+                           min_compound: float = None, max_compound: float = None, limit: int = 50, offset: int = 0):
+    search = SentenceSearch(query, person_id, speaker_id, start, end, min_compound, max_compound, limit, offset)
+    if await buckets_reads.find_one({}, {"_id": 1}) is None:
+        cursor = await conversations_reads.aggregate(search.conversations_pipeline())
+        return search.results(await cursor.to_list())
+
+    person_conversations = None
+    if person_id is not None:
+        person = await people_reads.find_one({"_id": ObjectId(person_id)}, {"conversations": 1}) or {}
+        person_conversations = person.get("conversations", [])
+
+    async def run(collection, pipeline):
+        return await (await collection.aggregate(pipeline)).to_list()
+
+    rows, bucket_rows = await asyncio.gather(
+        run(conversations_reads, search.conversations_pipeline(merged=True)),
+        run(buckets_reads, search.buckets_pipeline(person_conversations)),
+    )
+    return search.results(rows, bucket_rows)
+
+
+async def get_trend(person_id, period: str = "week", start: datetime = None, end: datetime = None, other_id=None):
+    query = rollups.trend_query(person_id, period, start, end, other_id)
+    return [rollups.trend_bucket(doc)
+            async for doc in rollups_reads.find(query, rollups.TREND_PROJECTION).sort("start", 1)]
+
+
+async def get_recording(recording_id: str):
+    return await recordings_reads.find_one({"_id": recording_id})
+
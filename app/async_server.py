@@ -0,0 +1,395 @@
+"""
+async_server.py
+---------------
+ASGI variant of server.py: the same routes, served by Quart, with reads going
+through the async MongoDB client (async_data.py).
+
+The Flask app holds a worker thread for every MongoDB round-trip, so
+concurrent dashboards are limited to workers x threads requests in flight.
+Here a request waiting on the database, or an idle /events stream, only
+holds a coroutine. That is the whole point of this variant: the concurrency
+is between requests. Within a request the reads mostly depend on each other
+and run in the same order as in server.py; the one exception is /search,
+which runs its embedded and bucketed pipelines together. Routes differ from
+server.py only in their I/O; request parsing and validation are shared
+(request_args.py).
+
+What is not I/O-bound is kept off the event loop:
+  * sentiment scoring and SRT parsing (live appends, upload hashing) run in
+    cpu_executor (ASYNC_CPU_WORKERS threads). VADER is pure Python, so these
+    threads do not score in parallel, but the loop keeps serving reads while
+    they work; a process pool would lose the in-process event bus and caches.
+  * writes go through handle_data in a thread (asyncio.to_thread), since they
+    update counters, rollups and cache versions together.
+  * uploads are still parsed, scored and stored by server.ingest_queue.
+
+Run from the app directory:
+    hypercorn async_server:app --bind 127.0.0.1:5000 --workers 2
+(benchmarks/bench_async_server.py compares it with `gunicorn server:app`.)
+"""
+import asyncio
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+
+from pymongo.errors import PyMongoError
+from quart import Blueprint, Quart, Response, jsonify, request
+from quart_cors import cors
+
+import async_data as data
+import metrics
+import request_args
+import server
+from audio_store import clip_wav
+from cache import async_cached, response_cache
+from db import async_ping, close_async_client, pool_stats
+from events import bus as event_bus
+from handle_data import encode_json
+from jobs import QueueFull
+from live import ConversationNotOpen, append_segments, close_live_conversation, open_live_conversation
+from parse import srt_hash
+from sentiment import sentiment_cache_stats
+from server import EVENT_KEEPALIVE, SAMPLE_SRT, ingest_queue
+from speakers import DEFAULT_DEVICE
+
+# Threads for CPU-bound work (sentiment scoring, SRT parsing)
+ASYNC_CPU_WORKERS = int(os.getenv("ASYNC_CPU_WORKERS", "2"))
+
+cpu_executor = ThreadPoolExecutor(max_workers=ASYNC_CPU_WORKERS, thread_name_prefix="cpu")
+
+api = Blueprint("api", __name__)
+
+def create_app() -> Quart:
+    """Build the Quart app. No database or model work happens here (see warm_up)."""
+    app = Quart(__name__)
+    app = cors(app, allow_origin="*")
+    metrics.init_async_app(app)
+    app.register_blueprint(api)
+
+    @app.before_serving
+    async def _warm_up():
+        timings = await warm_up(app)
+        app.logger.info("Warmed up: %s", ", ".join(f"{step} {s * 1000:.0f}ms" for step, s in timings.items()))
+
+    @app.after_serving
+    async def _close_client():
+        await close_async_client()
+
+    return app
+
+async def warm_up(app: Quart = None) -> dict:
+    """server.warm_up (in a thread, for the sync client used by writes) plus a ping over the async client."""
+    timings = await asyncio.to_thread(server.warm_up, app)
+    start = time.perf_counter()
+    try:
+        await async_ping()
+    except PyMongoError as e:
+        if app is not None:
+            app.logger.warning("MongoDB async warm-up failed: %s", e)
+    timings["async_database"] = time.perf_counter() - start
+    return timings
+
+async def run_cpu(fn, *args, **kwargs):
+    """Run CPU-bound fn in cpu_executor."""
+    return await asyncio.get_running_loop().run_in_executor(cpu_executor, partial(fn, *args, **kwargs))
+
+def wants_summary() -> bool:
+    return request.args.get("view") == "summary"
+
+def json_response(obj, status: int = 200):
+    return Response(encode_json(obj), status=status, mimetype="application/json")
+
+def ndjson_response(docs):
+    """Stream an async iterable of fast-path (fast=True) documents as newline-delimited JSON."""
+    async def generate():
+        async for doc in docs:
+            yield encode_json(doc)
+    response = Response(generate(), mimetype="application/x-ndjson")
+    response.timeout = None  # whole collections can take longer than Quart's default response timeout
+    return response
+
+async def list_response(iter_all, get_page):
+    """server.list_response for coroutine fetch functions."""
+    if request.args.get("format") == "ndjson":
+        return ndjson_response(iter_all())
+
+    try:
+        page = request_args.page_args(request.args)
+        if page is None:
+            return None
+        items, next_cursor = await get_page(*page)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    return json_response({"items": items, "next": next_cursor})
+
+@api.route('/new-audio', methods=['GET', 'POST'])
+async def handle():
+    # POST an SRT body; GET ingests the sample transcript
+    srt = await request.get_data(as_text=True) if request.method == 'POST' else SAMPLE_SRT
+    device = request.args.get("device", DEFAULT_DEVICE)
+    try:
+        key = request_args.idempotency_key(request.headers)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    content_hash = await run_cpu(srt_hash, srt)
+    existing = await data.find_duplicate_conversation(content_hash, key)
+    if existing:
+        return (jsonify({"status": "done", "result": str(existing), "duplicate": True}), 200,
+                {"Location": f"/conversation/{existing}"})
+
+    try:
+        job = ingest_queue.submit((srt, device, content_hash, key), key=key or content_hash)
+    except QueueFull as e:
+        return jsonify({"error": str(e)}), 503, {"Retry-After": "5"}
+
+    return jsonify(job.to_dict()), 202, {"Location": f"/jobs/{job.id}"}
+
+# /jobs/<job_id> endpoint to return the status, stage timings and error of an ingestion job
+@api.route('/jobs/<job_id>')
+async def job_status(job_id):
+    job = ingest_queue.get(job_id)
+    if not job:
+        return jsonify({"error": f"Job '{job_id}' not found"}), 404
+    return jsonify(job.to_dict())
+
+# /live/conversations endpoint to open a conversation that transcript segments are appended to
+@api.route('/live/conversations', methods=['POST'])
+async def live_open():
+    conv_id = await asyncio.to_thread(open_live_conversation, request.args.get("device", DEFAULT_DEVICE))
+    return jsonify({"_id": conv_id}), 201, {"Location": f"/conversation/{conv_id}"}
+
+# /live/conversations/<conv_id>/segments endpoint to score and append segments as they arrive
+# (JSON segment or list of segments, or an SRT snippet as the body)
+@api.route('/live/conversations/<conv_id>/segments', methods=['POST'])
+async def live_append(conv_id):
+    try:
+        if request.is_json:
+            segments = request_args.segments_body(await request.get_json())
+            result = await run_cpu(append_segments, conv_id, segments=segments)
+        else:
+            result = await run_cpu(append_segments, conv_id, srt_text=await request.get_data(as_text=True))
+    except ConversationNotOpen:
+        return jsonify({"error": f"Conversation '{conv_id}' not found or already closed"}), 409
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    return jsonify(result)
+
+# /live/conversations/<conv_id>/close endpoint to finalize a conversation's sentiment
+@api.route('/live/conversations/<conv_id>/close', methods=['POST'])
+async def live_close(conv_id):
+    sentiment = await asyncio.to_thread(close_live_conversation, conv_id)
+    if sentiment is None:
+        return jsonify({"error": f"Conversation '{conv_id}' not found or already closed"}), 409
+    return jsonify({"_id": conv_id, "sentiment": sentiment})
+
+# /events endpoint to stream flag alerts as Server-Sent Events
+# (?person=a,b limits the stream to those people; Last-Event-ID resumes after a reconnect)
+@api.route('/events')
+async def events():
+    person_ids = None
+    if request.args.get("person"):
+        names = request_args.split_names(request.args["person"])
+        found = await data.get_person_ids(names)
+        missing = request_args.first_missing(names, found)
+        if missing:
+            return jsonify(request_args.person_not_found(missing)), 404
+        person_ids = list(found.values())
+
+    subscription = event_bus.subscribe(person_ids, request_args.last_event_id(request.headers, request.args))
+
+    # Idle streams wait on the event loop (Subscription.get_async), not in a thread each
+    async def stream():
+        try:
+            yield b"retry: 3000\n\n"
+            while True:
+                pending = await subscription.get_async(timeout=EVENT_KEEPALIVE)
+                if not pending:
+                    yield b": keep-alive\n\n"
+                for event in pending:
+                    yield request_args.sse_message(event).encode()
+        finally:
+            subscription.close()
+
+    response = Response(stream(), mimetype="text/event-stream",
+                        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+    response.timeout = None
+    return response
+
+# /people endpoint to return all people and data attached directly to their objects (name, role, conversations)
+@api.route('/people')
+@async_cached("people")
+async def people():
+    paged = await list_response(partial(data.iter_people, fast=True), partial(data.get_people_page, fast=True))
+    return paged if paged is not None else json_response(await data.get_all_people(fast=True))
+
+# /conversations endpoint to return all conversations and data attached directly to their objects (participants, sentences, flags)
+@api.route('/conversations')
+@async_cached("conversations")
+async def conversations():
+    summary = wants_summary()
+    paged = await list_response(partial(data.iter_conversations, summary=summary, fast=True),
+                                partial(data.get_conversations_page, summary=summary, fast=True))
+    return paged if paged is not None else json_response(await data.get_all_conversations(summary, fast=True))
+
+# /person/<person_name> endpoint to return a single person by name
+@api.route('/person/<person_name>')
+@async_cached("person:{person_name}")
+async def person_detail(person_name):
+    person = await data.get_person_by_name(person_name, fast=True)
+    if not person:
+        return jsonify({"error": f"Person '{person_name}' not found"}), 404
+    return json_response(person)
+
+# /person/<person_name>/overview endpoint to return what the person page shows in one request
+# (the person, their flag total and their conversations; sentences only with ?view=full)
+@api.route('/person/<person_name>/overview')
+@async_cached("person:{person_name}")
+async def person_overview(person_name):
+    overview = await data.get_person_overview(person_name, summary=request.args.get("view") != "full")
+    if not overview:
+        return jsonify({"error": f"Person '{person_name}' not found"}), 404
+    return json_response(overview)
+
+# /conversation/<conv_id> endpoint to return a single conversation by ID
+@api.route('/conversation/<conv_id>')
+@async_cached("conversations")
+async def conversation_detail(conv_id):
+    conv = await data.get_conversation_by_id(conv_id, wants_summary(), fast=True)
+    if not conv:
+        return jsonify({"error": f"Conversation '{conv_id}' not found"}), 404
+    return json_response(conv)
+
+# /conversation/<conv_id>/sentences endpoint to return a page of a conversation's sentences
+# (?offset=&limit=, optionally restricted to an ISO ?start=/?end= window)
+@api.route('/conversation/<conv_id>/sentences')
+async def conversation_sentences(conv_id):
+    try:
+        page = await data.get_conversation_sentences(conv_id, **request_args.sentences_args(request.args))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    if page is None:
+        return jsonify({"error": f"Conversation '{conv_id}' not found"}), 404
+    return jsonify(page)
+
+# /conversation/<conv_id>/flagged endpoint to return every flagged sentence of a conversation
+# (however much of the transcript the client has paged in)
+@api.route('/conversation/<conv_id>/flagged')
+@async_cached("conversations")
+async def conversation_flagged(conv_id):
+    flagged = await data.get_flagged_sentences(conv_id)
+    if flagged is None:
+        return jsonify({"error": f"Conversation '{conv_id}' not found"}), 404
+    return jsonify(flagged)
+
+async def _read_in_thread(chunks):
+    """Iterate a blocking iterator (file reads) without blocking the event loop."""
+    chunks = iter(chunks)
+    while True:
+        chunk = await asyncio.to_thread(next, chunks, None)
+        if chunk is None:
+            return
+        yield chunk
+
+# /conversation/<conv_id>/audio/<sentence_id> endpoint to play the audio behind one sentence
+# (a WAV clip; Range requests are answered from the stored segments without loading the recording)
+@api.route('/conversation/<conv_id>/audio/<sentence_id>')
+async def sentence_audio(conv_id, sentence_id):
+    sentence = await data.get_sentence(conv_id, sentence_id)
+    if sentence is None:
+        return jsonify({"error": f"Sentence '{sentence_id}' not found"}), 404
+    recording = await data.get_recording(sentence["audio_ref"]) if sentence.get("audio_ref") else None
+    if recording is None:
+        return jsonify({"error": f"No audio stored for sentence '{sentence_id}'"}), 404
+
+    status, headers, clip = request_args.audio_clip(recording, sentence, request.range)
+    if clip is None:
+        return Response(b"", status=status, headers=headers)
+    return Response(_read_in_thread(clip_wav(recording, *clip)), status=status,
+                    mimetype="audio/wav", headers=headers)
+
+# /search endpoint to find sentences by text, newest first
+# (?q= words and "phrases"; optional ?person= participant, ?speaker=, ISO ?start=/?end=,
+#  ?min_compound=/?max_compound= sentiment bounds, ?limit=/?offset=)
+@api.route('/search')
+@async_cached("conversations", "people")
+async def search():
+    try:
+        query = request_args.search_query(request.args)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    names = request_args.search_names(request.args)
+    found = await data.get_person_ids(names) if names else {}
+    missing = request_args.first_missing(names, found)
+    if missing:
+        return jsonify(request_args.person_not_found(missing)), 404
+
+    try:
+        page = await data.search_sentences(query, **request_args.search_args(request.args, found))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    return jsonify({"query": query, **page})
+
+# /trends/<person_name> endpoint to return a person's daily or weekly sentiment buckets from the rollups
+# (?period=day|week, ISO ?start=/?end=, ?with=<name> for the buckets shared with another person)
+@api.route('/trends/<person_name>')
+@async_cached("person:{person_name}")
+async def trends(person_name):
+    names = request_args.trend_names(person_name, request.args)
+    found = await data.get_person_ids(names)
+    missing = request_args.first_missing(names, found)
+    if missing:
+        return jsonify(request_args.person_not_found(missing)), 404
+
+    try:
+        buckets = await data.get_trend(**request_args.trend_args(person_name, request.args, found))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    return jsonify(request_args.trend_body(person_name, request.args, buckets))
+
+# /conversations/<person_name> endpoint to return all conversations for a given person
+@api.route('/conversations/<person_name>')
+@async_cached("person:{person_name}")
+async def conversations_by_person(person_name):
+    return json_response(await data.get_conversations_by_person(person_name, wants_summary(), fast=True))
+
+# /flags/<person_name> endpoint to return total number of flags across all conversations for a given person
+@api.route('/flags/<person_name>', methods=['GET'])
+async def flags_endpoint(person_name):
+    counts = await data.get_flag_counts([person_name])
+    if person_name not in counts:
+        return jsonify(request_args.person_not_found(person_name)), 404
+    return jsonify({"person": person_name, "total_flags": counts[person_name]})
+
+# /flags?names=a,b,c endpoint to return flag totals for several people in one round trip
+@api.route('/flags', methods=['GET'])
+async def flags_batch_endpoint():
+    names = request_args.split_names(request.args.get("names"))
+    counts = await data.get_flag_counts(names)
+    return jsonify({
+        "total_flags": counts,
+        "not_found": [n for n in names if n not in counts]
+    })
+
+# /stats endpoint to return this worker process's MongoDB pool and cache statistics, for sizing workers
+@api.route('/stats')
+async def stats():
+    return jsonify({
+        "mongo_pool": pool_stats.to_dict(),
+        "response_cache": response_cache.stats(),
+        "sentiment_cache": sentiment_cache_stats(),
+        "ingest_pending": ingest_queue.pending(),
+    })
+
+# /metrics endpoint to return request/stage latency histograms and counters in Prometheus text format
+@api.route('/metrics')
+async def metrics_endpoint():
+    return Response(metrics.registry.render(), mimetype="text/plain; version=0.0.4")
+
+
+# ASGI entry point, e.g. `hypercorn async_server:app`
+app = create_app()
+
+if __name__ == '__main__':
+    app.run(debug=True)
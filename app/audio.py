@@ -0,0 +1,496 @@
+"""
+audio.py
+--------
+In-process pipeline from a recording to a scored Conversation.
+
+The recording is decoded into fixed-length chunks of 16 kHz mono PCM and
+every chunk goes through
+
+    decode -> transcribe/diarize -> parse -> score
+
+Each stage runs in its own thread (transcription in AUDIO_TRANSCRIBE_WORKERS
+threads) and hands its output to the next through a bounded queue of
+AUDIO_QUEUE_SIZE items. The decoder reads ahead while the backend transcribes
+and earlier chunks are parsed and scored, and a slow stage holds the earlier
+ones back instead of the whole recording piling up in memory. Decoding
+(ffmpeg) and transcription (whisper/torch, external processes) run outside
+the GIL, so they overlap with everything else. Parsing and scoring (VADER is
+pure Python) hold the GIL and take turns with each other; they are cheap next
+to transcription, so overlapping them with it is what matters.
+
+Transcription sits behind TranscriptionBackend (see BACKENDS):
+
+    fake:     deterministic text derived from the audio bytes; offline tests and benchmarks
+    whisper:  openai-whisper, everything attributed to "Speaker 0"
+    diarize:  an external whisper-diarization command writing an SRT per chunk
+              (AUDIO_DIARIZE_COMMAND, e.g. "python diarize.py -a {audio}")
+
+Backends return segments in the shape /live/<id>/segments accepts,
+{"speaker": "Speaker 0", "text": "...", "start": 1.5, "end": 3.0}, with
+times relative to the start of the chunk. Diarization labels come from each
+chunk on its own, so chunks should be long enough for the diarizer to tell
+the voices apart.
+
+With an AudioStore, the decoder also writes the PCM to the content-addressed
+store (see audio_store.py) and every sentence gets an audio_ref/audio_offset
+pointing at its clip.
+
+    python manage.py ingest-audio ../files/audio/Recording.mp3 --backend diarize
+"""
+import abc
+import os
+import queue
+import random
+import shlex
+import shutil
+import subprocess
+import tempfile
+import threading
+import time
+import wave
+import zlib
+from contextlib import closing
+from datetime import datetime, timedelta
+from typing import Callable, Dict, Iterator, List, NamedTuple, Optional
+
+from bson import ObjectId
+
+from audio_store import SAMPLE_RATE, AudioStore, attach_audio
+from flag_rules import get_engine as get_flag_rules
+from live import segments_to_sentences
+from metrics import stage
+from models import Conversation, Sentence
+from parse import SPEAKER_RE, iter_srt_cues, score_sentences
+from sentiment import analyze_conversation
+
+AUDIO_CHUNK_SECONDS = float(os.getenv("AUDIO_CHUNK_SECONDS", "30"))
+AUDIO_QUEUE_SIZE = int(os.getenv("AUDIO_QUEUE_SIZE", "4"))
+AUDIO_TRANSCRIBE_WORKERS = int(os.getenv("AUDIO_TRANSCRIBE_WORKERS", "1"))
+AUDIO_BACKEND = os.getenv("AUDIO_BACKEND", "whisper")
+WHISPER_MODEL = os.getenv("WHISPER_MODEL", "base")
+AUDIO_DIARIZE_COMMAND = os.getenv("AUDIO_DIARIZE_COMMAND", "")
+FFMPEG = os.getenv("FFMPEG", "ffmpeg")
+
+
+class AudioChunk(NamedTuple):
+    """A slice of a recording: position in the recording, offset in seconds, raw PCM."""
+    index: int
+    offset: float
+    pcm: bytes
+
+    @property
+    def duration(self) -> float:
+        return len(self.pcm) / (2 * SAMPLE_RATE)
+
+
+# -----------------------------
+# Decoding
+# -----------------------------
+def _pcm_blocks(path: str, block_size: int = 1 << 16) -> Iterator[bytes]:
+    """Yield the recording as raw 16 kHz mono s16le PCM, without reading it into memory."""
+    if path.lower().endswith(".wav"):
+        with wave.open(path, "rb") as w:
+            native = (w.getframerate(), w.getnchannels(), w.getsampwidth()) == (SAMPLE_RATE, 1, 2)
+            while native:
+                block = w.readframes(block_size // 2)
+                if not block:
+                    return
+                yield block
+        # Other WAV layouts are resampled by ffmpeg like any other format
+
+    if shutil.which(FFMPEG) is None:
+        raise RuntimeError(f"Decoding {os.path.basename(path)} needs ffmpeg (set FFMPEG to its path)")
+    proc = subprocess.Popen(
+        [FFMPEG, "-nostdin", "-loglevel", "error", "-i", path,
+         "-f", "s16le", "-ac", "1", "-ar", str(SAMPLE_RATE), "-"],
+        stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+    )
+    finished = False
+    try:
+        while True:
+            block = proc.stdout.read(block_size)
+            if not block:
+                break
+            yield block
+        finished = True
+    finally:
+        if proc.poll() is None:
+            proc.kill()
+        _, stderr = proc.communicate()
+        if finished and proc.returncode != 0:
+            raise RuntimeError(f"ffmpeg failed on {path}: {stderr.decode(errors='replace').strip()}")
+
+
+def decode_chunks(path: str, chunk_seconds: float = AUDIO_CHUNK_SECONDS) -> Iterator[AudioChunk]:
+    """Yield a recording as consecutive chunks of chunk_seconds (the last one may be shorter)."""
+    chunk_size = int(chunk_seconds * SAMPLE_RATE) * 2
+    if chunk_size <= 0:
+        raise ValueError("chunk_seconds must be positive")
+    buffer = bytearray()
+    index = 0
+    for block in _pcm_blocks(path):
+        buffer += block
+        while len(buffer) >= chunk_size:
+            yield AudioChunk(index, index * chunk_seconds, bytes(buffer[:chunk_size]))
+            del buffer[:chunk_size]
+            index += 1
+    if buffer:
+        yield AudioChunk(index, index * chunk_seconds, bytes(buffer))
+
+
+# -----------------------------
+# Transcription backends
+# -----------------------------
+class TranscriptionBackend(abc.ABC):
+    """Turns one chunk of audio into diarized segments (see the module docstring)."""
+
+    @abc.abstractmethod
+    def transcribe(self, chunk: AudioChunk) -> List[dict]:
+        ...
+
+
+FAKE_WORDS = [
+    "I", "you", "need", "help", "please", "stop", "fine", "today", "medicine", "doctor",
+    "water", "cold", "hurts", "thank", "love", "hate", "never", "again", "good", "bad",
+    "scared", "happy", "tired", "alone", "family", "call", "now", "later", "stupid", "sorry",
+]
+
+
+class FakeBackend(TranscriptionBackend):
+    """
+    Deterministic stand-in for a speech model: the same audio always gives the
+    same segments. With realtime_factor > 0 it sleeps that many seconds per
+    second of audio, like a model that releases the GIL while it runs.
+    """
+
+    def __init__(self, realtime_factor: float = 0.0, speakers: int = 2):
+        self.realtime_factor = realtime_factor
+        self.speakers = speakers
+
+    def transcribe(self, chunk: AudioChunk) -> List[dict]:
+        if self.realtime_factor:
+            time.sleep(chunk.duration * self.realtime_factor)
+        rng = random.Random(zlib.crc32(chunk.pcm) ^ chunk.index)
+        segments = []
+        t = rng.uniform(0.0, 1.0)
+        while t < chunk.duration - 0.5:
+            end = min(chunk.duration, t + rng.uniform(1.0, 5.0))
+            segments.append({
+                "speaker": f"Speaker {rng.randrange(self.speakers)}",
+                "text": " ".join(rng.choice(FAKE_WORDS) for _ in range(rng.randint(3, 12))),
+                "start": round(t, 3),
+                "end": round(end, 3),
+            })
+            t = end + rng.uniform(0.1, 1.0)
+        return segments
+
+
+class WhisperBackend(TranscriptionBackend):
+    """openai-whisper transcription without diarization (one speaker)."""
+
+    def __init__(self, model: str = WHISPER_MODEL):
+        try:
+            import numpy
+            import whisper
+        except ImportError as e:
+            raise RuntimeError("The whisper backend needs openai-whisper (pip install openai-whisper)") from e
+        self._np = numpy
+        self._model = whisper.load_model(model)
+        self._lock = threading.Lock()  # one model instance, so one chunk at a time
+
+    def transcribe(self, chunk: AudioChunk) -> List[dict]:
+        audio = self._np.frombuffer(chunk.pcm, self._np.int16).astype(self._np.float32) / 32768.0
+        with self._lock:
+            result = self._model.transcribe(audio, fp16=False)
+        return [
+            {"speaker": "Speaker 0", "text": s["text"].strip(), "start": s["start"], "end": s["end"]}
+            for s in result["segments"] if s["text"].strip()
+        ]
+
+
+def split_command(command: str) -> List[str]:
+    """shlex.split, except that on Windows backslashes in paths are kept and only quotes are removed."""
+    if os.name != "nt":
+        return shlex.split(command)
+    return [arg[1:-1] if len(arg) > 1 and arg[0] == arg[-1] == '"' else arg
+            for arg in shlex.split(command, posix=False)]
+
+
+class DiarizeBackend(TranscriptionBackend):
+    """
+    Runs an external diarization command on each chunk. The command gets the
+    chunk as a WAV file through its {audio} placeholder and must write the
+    transcript to the same path with an .srt extension (as whisper-diarization does).
+    """
+
+    def __init__(self, command: str = AUDIO_DIARIZE_COMMAND):
+        if not command or "{audio}" not in command:
+            raise RuntimeError("The diarize backend needs AUDIO_DIARIZE_COMMAND with an {audio} placeholder")
+        self.command = split_command(command)
+
+    def transcribe(self, chunk: AudioChunk) -> List[dict]:
+        with tempfile.TemporaryDirectory() as tmp:
+            audio_path = os.path.join(tmp, f"chunk{chunk.index}.wav")
+            with wave.open(audio_path, "wb") as w:
+                w.setnchannels(1)
+                w.setsampwidth(2)
+                w.setframerate(SAMPLE_RATE)
+                w.writeframes(chunk.pcm)
+            subprocess.run([arg.replace("{audio}", audio_path) for arg in self.command],
+                           check=True, capture_output=True)
+            srt_path = os.path.splitext(audio_path)[0] + ".srt"
+            if not os.path.exists(srt_path):
+                return []
+            with open(srt_path, encoding="utf-8") as f:
+                segments = []
+                for cue in iter_srt_cues(f):
+                    match = SPEAKER_RE.match(cue.lines[0])
+                    speaker, text = match.groups() if match else ("Unknown", cue.lines[0])
+                    segments.append({
+                        "speaker": speaker,
+                        "text": " ".join([text] + cue.lines[1:]),
+                        "start": cue.start.total_seconds(),
+                        "end": cue.end.total_seconds(),
+                    })
+                return segments
+
+
+BACKENDS: Dict[str, Callable[..., TranscriptionBackend]] = {
+    "fake": FakeBackend,
+    "whisper": WhisperBackend,
+    "diarize": DiarizeBackend,
+}
+
+
+def get_backend(name: str = AUDIO_BACKEND, **options) -> TranscriptionBackend:
+    """Build a transcription backend by name (see BACKENDS)."""
+    if name not in BACKENDS:
+        raise ValueError(f"Unknown transcription backend '{name}' (expected one of {', '.join(BACKENDS)})")
+    return BACKENDS[name](**options)
+
+
+# -----------------------------
+# Per-chunk stages
+# -----------------------------
+def chunk_sentences(chunk: AudioChunk, segments: List[dict], speaker_map: dict,
+                    recording_start: datetime) -> List[Sentence]:
+    """Build unscored sentences from a chunk's segments, with times relative to the recording."""
+    shifted = [dict(seg, start=chunk.offset + float(seg["start"]), end=chunk.offset + float(seg["end"]))
+               for seg in segments if str(seg.get("text", "")).strip()]
+    return segments_to_sentences(shifted, speaker_map, recording_start)
+
+
+class ChunkScorer:
+    """Scores chunks in order, keeping the recent sentences window flag rules need from earlier chunks."""
+
+    def __init__(self, roles: dict = None):
+        self.roles = roles
+        self.window = timedelta(seconds=get_flag_rules().max_window)
+        self.sentences: List[Sentence] = []
+        self.flags: List[ObjectId] = []
+        self._recent = 0  # index of the first sentence still inside the window
+
+    def add(self, sentences: List[Sentence]):
+        if not sentences:
+            return
+        cutoff = sentences[0].start_time - self.window
+        while self._recent < len(self.sentences) and self.sentences[self._recent].start_time < cutoff:
+            self._recent += 1
+        self.flags += score_sentences(sentences, self.roles, self.sentences[self._recent:])
+        self.sentences += sentences
+
+
+def build_conversation(sentences: List[Sentence], flags: List[ObjectId], speaker_map: dict,
+                       recording_start: datetime) -> Conversation:
+    """Wrap scored sentences in a Conversation, with the same metadata parse_conversation sets."""
+    conversation_start = sentences[0].start_time if sentences else recording_start
+    conversation_end = max((s.start_time + timedelta(seconds=s.total_time) for s in sentences),
+                           default=conversation_start)
+    known = set(speaker_map.values())
+    return Conversation(
+        participants=[p for p in dict.fromkeys(s.speaker for s in sentences) if p in known],
+        start_time=conversation_start,
+        total_time=(conversation_end - conversation_start).total_seconds(),
+        sentences=sentences,
+        flags=flags,
+        sentiment=analyze_conversation(sentences),
+    )
+
+
+# -----------------------------
+# Pipeline
+# -----------------------------
+class _Stopped(Exception):
+    """Raised inside a stage thread when another stage failed."""
+
+
+_DONE = object()
+
+
+class AudioPipeline:
+    """
+    Runs recordings through the overlapped stages, optionally keeping the audio
+    in an AudioStore. After run(), stats holds the chunk count, seconds of
+    audio, wall time, busy seconds per stage and the stored recording id.
+    A pipeline runs one recording at a time.
+    """
+
+    def __init__(self, backend: TranscriptionBackend, chunk_seconds: float = AUDIO_CHUNK_SECONDS,
+                 queue_size: int = AUDIO_QUEUE_SIZE, transcribe_workers: int = AUDIO_TRANSCRIBE_WORKERS,
+                 store: Optional[AudioStore] = None):
+        self.backend = backend
+        self.store = store
+        self.chunk_seconds = chunk_seconds
+        self.queue_size = max(queue_size, 1)
+        self.transcribe_workers = max(transcribe_workers, 1)
+        self.stats: dict = {}
+
+    def run(self, path: str, speaker_map: dict, recording_start: datetime = None,
+            roles: dict = None) -> Conversation:
+        """
+        Transcribe, parse and score a recording.
+
+        Args:
+            path (str): Audio file (WAV is read directly, anything else through ffmpeg).
+            speaker_map (dict): Diarized label ("Speaker 0") -> Person._id.
+            recording_start (datetime): Wall-clock start of the recording (default: now).
+            roles (dict): Person._id -> role, for flag rules restricted to a role.
+
+        Raises:
+            The first exception raised by any stage; the other stages are stopped.
+        """
+        recording_start = recording_start or datetime.now()
+        chunks = queue.Queue(self.queue_size)       # decode -> transcribe
+        transcribed = queue.Queue(self.queue_size)  # transcribe -> parse
+        parsed = queue.Queue(self.queue_size)       # parse -> score
+        stop = threading.Event()
+        errors = []
+        busy = {"decode": 0.0, "transcribe": 0.0, "parse": 0.0, "score": 0.0}
+        busy_lock = threading.Lock()
+        audio_seconds = [0.0]
+        recording_id = [None]
+
+        def put(q, item):
+            while True:
+                if stop.is_set():
+                    raise _Stopped()
+                try:
+                    return q.put(item, timeout=0.1)
+                except queue.Full:
+                    pass
+
+        def get(q):
+            while True:
+                if stop.is_set():
+                    raise _Stopped()
+                try:
+                    return q.get(timeout=0.1)
+                except queue.Empty:
+                    pass
+
+        def timed(name, fn, *args):
+            start = time.perf_counter()
+            try:
+                with stage(name):
+                    return fn(*args)
+            finally:
+                with busy_lock:
+                    busy[name] += time.perf_counter() - start
+
+        def guarded(fn):
+            def target():
+                try:
+                    fn()
+                except _Stopped:
+                    pass
+                except BaseException as e:
+                    errors.append(e)
+                    stop.set()
+            return target
+
+        def decode():
+            writer = self.store.writer() if self.store else None
+            with closing(decode_chunks(path, self.chunk_seconds)) as source:
+                while True:
+                    chunk = timed("decode", next, source, None)
+                    if chunk is None:
+                        break
+                    if writer:
+                        timed("decode", writer.write, chunk.pcm)
+                    audio_seconds[0] += chunk.duration
+                    put(chunks, chunk)
+            if writer:
+                recording_id[0] = timed("decode", writer.close)
+            for _ in range(self.transcribe_workers):
+                put(chunks, _DONE)
+
+        def transcribe():
+            while True:
+                chunk = get(chunks)
+                if chunk is _DONE:
+                    put(transcribed, _DONE)
+                    return
+                put(transcribed, (chunk, timed("transcribe", self.backend.transcribe, chunk)))
+
+        def parse():
+            # Transcription workers may finish out of order; chunks are parsed in recording order
+            pending, next_index, done = {}, 0, 0
+            while done < self.transcribe_workers:
+                item = get(transcribed)
+                if item is _DONE:
+                    done += 1
+                    continue
+                pending[item[0].index] = item
+                while next_index in pending:
+                    chunk, segments = pending.pop(next_index)
+                    put(parsed, timed("parse", chunk_sentences, chunk, segments, speaker_map, recording_start))
+                    next_index += 1
+            put(parsed, _DONE)
+
+        threads = [threading.Thread(target=guarded(decode), name="audio-decode", daemon=True)]
+        threads += [threading.Thread(target=guarded(transcribe), name=f"audio-transcribe-{i}", daemon=True)
+                    for i in range(self.transcribe_workers)]
+        threads.append(threading.Thread(target=guarded(parse), name="audio-parse", daemon=True))
+
+        started = time.perf_counter()
+        for t in threads:
+            t.start()
+        scorer = ChunkScorer(roles)
+        chunk_count = 0
+        try:
+            while True:
+                sentences = get(parsed)
+                if sentences is _DONE:
+                    break
+                timed("score", scorer.add, sentences)
+                chunk_count += 1
+        except _Stopped:
+            pass
+        except BaseException:
+            stop.set()
+            raise
+        finally:
+            for t in threads:
+                t.join()
+        if errors:
+            raise errors[0]
+
+        conversation = timed("score", build_conversation, scorer.sentences, scorer.flags,
+                             speaker_map, recording_start)
+        if recording_id[0]:
+            attach_audio(conversation.sentences, recording_id[0], recording_start)
+        self.stats = {
+            "recording": recording_id[0],
+            "chunks": chunk_count,
+            "audio_seconds": audio_seconds[0],
+            "elapsed": time.perf_counter() - started,
+            "stages": busy,
+        }
+        return conversation
+
+
+def transcribe_recording(path: str, speaker_map: dict, recording_start: datetime = None,
+                         roles: dict = None, backend: Optional[TranscriptionBackend] = None,
+                         **options) -> Conversation:
+    """One-shot helper: run a recording through a new AudioPipeline (default backend: AUDIO_BACKEND)."""
+    return AudioPipeline(backend or get_backend(), **options).run(path, speaker_map, recording_start, roles)
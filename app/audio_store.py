@@ -0,0 +1,181 @@
+"""
+audio_store.py
+--------------
+Content-addressed storage for recordings, so reviewers can play the audio
+behind a single sentence.
+
+A recording is stored as decoded 16 kHz mono 16-bit PCM (see audio.py), cut
+into fixed-size segments of AUDIO_SEGMENT_BYTES. Each segment is a file
+named after its SHA-256 under AUDIO_STORE_DIR, so identical segments (and
+re-ingested recordings) are stored once. The Recordings collection keeps a
+manifest per recording, whose id is the hash of its segment list:
+
+    {_id: "<sha256>", segments: ["<sha256>", ...], segment_bytes, sample_rate,
+     bytes, duration, created_at}
+
+Sentences point at a recording with audio_ref and audio_offset (seconds from
+the start of the recording); their clip runs for total_time seconds. Since
+PCM has a fixed byte rate, a clip is a byte range of the recording: reading
+it touches only the one or two segments it overlaps, through mmap, in
+blocks of AUDIO_READ_BLOCK bytes.
+"""
+import hashlib
+import mmap
+import os
+import struct
+import tempfile
+from datetime import datetime
+from typing import Iterator, List, Optional, Tuple
+
+from db import collection
+
+SAMPLE_RATE = 16000  # what whisper expects; PCM is 16-bit mono throughout
+BYTES_PER_SECOND = SAMPLE_RATE * 2
+AUDIO_STORE_DIR = os.getenv("AUDIO_STORE_DIR", os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), "..", "files", "audio_store"))
+# 1 MiB is about 33 seconds of audio
+AUDIO_SEGMENT_BYTES = int(os.getenv("AUDIO_SEGMENT_BYTES", str(1 << 20)))
+AUDIO_READ_BLOCK = 64 * 1024
+# Audio played before and after a sentence's own span
+AUDIO_CLIP_PADDING = float(os.getenv("AUDIO_CLIP_PADDING", "0.25"))
+WAV_HEADER_BYTES = 44
+
+recordings = collection("Recordings")
+recordings_reads = collection("Recordings", read_only=True)
+
+
+def wav_header(data_bytes: int, sample_rate: int = SAMPLE_RATE) -> bytes:
+    """Header of a mono 16-bit PCM WAV file holding data_bytes of samples."""
+    return struct.pack("<4sI4s4sIHHIIHH4sI", b"RIFF", 36 + data_bytes, b"WAVE", b"fmt ", 16, 1, 1,
+                       sample_rate, sample_rate * 2, 2, 16, b"data", data_bytes)
+
+
+class RecordingWriter:
+    """Cuts a stream of PCM into segments as it is written; close() stores the manifest."""
+
+    def __init__(self, store: "AudioStore"):
+        self.store = store
+        self.segments: List[str] = []
+        self.bytes = 0
+        self._buffer = bytearray()
+
+    def write(self, pcm: bytes):
+        self._buffer += pcm
+        self.bytes += len(pcm)
+        size = self.store.segment_bytes
+        while len(self._buffer) >= size:
+            self.segments.append(self.store.put_segment(bytes(self._buffer[:size])))
+            del self._buffer[:size]
+
+    def close(self) -> str:
+        """Flush the last segment and save the manifest. Returns the recording id."""
+        if self._buffer:
+            self.segments.append(self.store.put_segment(bytes(self._buffer)))
+            self._buffer = bytearray()
+        return self.store.save_manifest(self.segments, self.bytes)
+
+
+class AudioStore:
+    """Segment files on disk plus manifests in the Recordings collection."""
+
+    def __init__(self, root: str = AUDIO_STORE_DIR, segment_bytes: int = AUDIO_SEGMENT_BYTES):
+        if segment_bytes <= 0 or segment_bytes % 2:
+            raise ValueError("segment_bytes must be a positive, even number of bytes")
+        self.root = root
+        self.segment_bytes = segment_bytes
+
+    def segment_path(self, digest: str) -> str:
+        return os.path.join(self.root, digest[:2], digest)
+
+    def put_segment(self, data: bytes) -> str:
+        """Store one segment (if it isn't stored already) and return its hash."""
+        digest = hashlib.sha256(data).hexdigest()
+        path = self.segment_path(digest)
+        if not os.path.exists(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            # Write then rename, so readers never see a partial segment
+            fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path))
+            try:
+                with os.fdopen(fd, "wb") as f:
+                    f.write(data)
+                os.replace(tmp, path)
+            except BaseException:
+                if os.path.exists(tmp):
+                    os.remove(tmp)
+                raise
+        return digest
+
+    def writer(self) -> RecordingWriter:
+        return RecordingWriter(self)
+
+    def save_manifest(self, segments: List[str], total_bytes: int) -> str:
+        recording_id = hashlib.sha256(f"{SAMPLE_RATE}:{self.segment_bytes}:{','.join(segments)}".encode()).hexdigest()
+        recordings.update_one({"_id": recording_id}, {"$setOnInsert": {
+            "segments": segments,
+            "segment_bytes": self.segment_bytes,
+            "sample_rate": SAMPLE_RATE,
+            "bytes": total_bytes,
+            "duration": total_bytes / BYTES_PER_SECOND,
+            "created_at": datetime.now(),
+        }}, upsert=True)
+        return recording_id
+
+    def store_file(self, path: str) -> str:
+        """Decode an audio file into the store and return its recording id."""
+        from audio import decode_chunks
+
+        writer = self.writer()
+        for chunk in decode_chunks(path):
+            writer.write(chunk.pcm)
+        return writer.close()
+
+    def read(self, recording: dict, start: int, stop: int) -> Iterator[bytes]:
+        """Yield bytes [start, stop) of a recording's PCM, memory-mapping only the segments involved."""
+        size = recording["segment_bytes"]
+        while start < stop:
+            index, offset = divmod(start, size)
+            end = min(stop - index * size, size)
+            with open(self.segment_path(recording["segments"][index]), "rb") as f, \
+                    mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+                end = min(end, len(data))
+                if end <= offset:
+                    raise ValueError(f"Segment {index} of recording {recording['_id']} is truncated")
+                for pos in range(offset, end, AUDIO_READ_BLOCK):
+                    yield data[pos:min(pos + AUDIO_READ_BLOCK, end)]
+            start = index * size + end
+
+
+store = AudioStore()
+
+
+def get_recording(recording_id: str) -> Optional[dict]:
+    return recordings_reads.find_one({"_id": recording_id})
+
+
+def clip_bounds(recording: dict, offset: float, duration: float,
+                padding: float = AUDIO_CLIP_PADDING) -> Tuple[int, int]:
+    """PCM byte range [start, stop) of a clip, padded and clamped to the recording (sample aligned)."""
+    start = max(int((offset - padding) * SAMPLE_RATE), 0) * 2
+    stop = min(int((offset + duration + padding) * SAMPLE_RATE) * 2, recording["bytes"])
+    return start, max(stop, start)
+
+
+def clip_wav(recording: dict, pcm_start: int, pcm_stop: int, start: int, stop: int) -> Iterator[bytes]:
+    """
+    Yield bytes [start, stop) of the WAV file made of the clip [pcm_start, pcm_stop)
+    (a header followed by the samples), for answering Range requests.
+    """
+    header = wav_header(pcm_stop - pcm_start)
+    if start < WAV_HEADER_BYTES:
+        yield header[start:min(stop, WAV_HEADER_BYTES)]
+    first, last = max(start - WAV_HEADER_BYTES, 0), stop - WAV_HEADER_BYTES
+    if last > first:
+        yield from store.read(recording, pcm_start + first, pcm_start + last)
+
+
+def attach_audio(sentences: list, recording_id: str, recording_start: datetime):
+    """Point sentences at a stored recording that started at recording_start."""
+    for s in sentences:
+        if s.start_time is not None:
+            s.audio_ref = recording_id
+            s.audio_offset = (s.start_time - recording_start).total_seconds()
@@ -0,0 +1,181 @@
+"""
+cache.py
+--------
+Versioned HTTP response cache for the read endpoints.
+
+handle_data bumps version counters on every write: per collection
+("people", "conversations") and per person ("person:<name>"). A cached
+response remembers the versions of the keys it depends on and is served only
+while they are unchanged, so there is no explicit invalidation to forget.
+Responses carry an ETag and conditional GETs are answered with 304.
+
+The counters live in the CacheVersions collection ({_id: key, v: n}) and are
+read from the primary on every cached request, so a write made by any worker
+process or by manage.py invalidates the responses cached everywhere; a hit
+costs that one small _id lookup instead of the view's queries. Misses run the
+view under db.primary_reads(), so an entry is never filled from a secondary
+that has not caught up with the versions it is stored under.
+RESPONSE_CACHE_TTL is a backstop for writes made outside handle_data.
+"""
+import hashlib
+import os
+import threading
+import time
+from collections import OrderedDict
+from functools import wraps
+from typing import Callable, Iterable
+
+from flask import Response, current_app, request
+from pymongo.errors import DuplicateKeyError
+
+from db import async_collection, collection, primary_reads
+
+# Memory cap for cached response bodies, and maximum age of an entry in seconds (0 = no limit)
+RESPONSE_CACHE_BYTES = int(os.getenv("RESPONSE_CACHE_BYTES", str(64 * 1024 * 1024)))
+RESPONSE_CACHE_TTL = float(os.getenv("RESPONSE_CACHE_TTL", "30"))
+
+
+class VersionCounters:
+    """Monotonic counters, shared by all processes, bumped whenever the data behind a key changes."""
+
+    def __init__(self, name: str = "CacheVersions"):
+        self._counters = collection(name)
+        self._async_counters = async_collection(name)
+
+    def bump(self, *keys: str):
+        # Writes bump a few keys at a time, so one small upsert each
+        for key in dict.fromkeys(keys):
+            try:
+                self._counters.update_one({"_id": key}, {"$inc": {"v": 1}}, upsert=True)
+            except DuplicateKeyError:
+                # Two processes creating the same counter: the loser retries as a plain update
+                self._counters.update_one({"_id": key}, {"$inc": {"v": 1}})
+
+    def snapshot(self, keys: Iterable[str]) -> tuple:
+        keys = list(keys)
+        found = {d["_id"]: d["v"] for d in self._counters.find({"_id": {"$in": keys}})}
+        return tuple(found.get(key, 0) for key in keys)
+
+    async def snapshot_async(self, keys: Iterable[str]) -> tuple:
+        """snapshot() over the async client."""
+        keys = list(keys)
+        found = {d["_id"]: d["v"] async for d in self._async_counters.find({"_id": {"$in": keys}})}
+        return tuple(found.get(key, 0) for key in keys)
+
+
+versions = VersionCounters()
+
+
+class ResponseCache:
+    """LRU cache of response bodies bounded by total body size."""
+
+    def __init__(self, max_bytes: int = RESPONSE_CACHE_BYTES, ttl: float = RESPONSE_CACHE_TTL):
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()  # key -> (versions, stored_at, etag, body, mimetype)
+        self._size = 0
+        self._lock = threading.Lock()
+
+    def get(self, key, snapshot: tuple):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry and entry[0] == snapshot and (not self.ttl or time.monotonic() - entry[1] < self.ttl):
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry
+            self.misses += 1
+            return None
+
+    def put(self, key, snapshot: tuple, body: bytes, mimetype: str):
+        etag = hashlib.blake2b(body, digest_size=16).hexdigest()
+        entry = (snapshot, time.monotonic(), etag, body, mimetype)
+        if len(body) > self.max_bytes:
+            return entry
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old:
+                self._size -= len(old[3])
+            self._entries[key] = entry
+            self._size += len(body)
+            while self._size > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self._size -= len(evicted[3])
+        return entry
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses, "entries": len(self._entries), "bytes": self._size}
+
+
+response_cache = ResponseCache()
+
+
+def _respond(entry, response_class=Response, req=request) -> Response:
+    etag, body, mimetype = entry[2], entry[3], entry[4]
+    if req.if_none_match.contains(etag):
+        response = response_class(status=304)
+    else:
+        response = response_class(body, mimetype=mimetype)
+    response.set_etag(etag)
+    return response
+
+
+def _cache_key(req) -> tuple:
+    return (req.path, tuple(sorted(req.args.items(multi=True))))
+
+
+def cached(*deps: str) -> Callable:
+    """
+    Cache a GET view's 200 responses until one of its version keys is bumped.
+    deps are version keys, formatted with the view's URL arguments,
+    e.g. cached("person:{person_name}").
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(**kwargs):
+            keys = [d.format(**kwargs) for d in deps]
+            cache_key = _cache_key(request)
+            # Taken before running the view so a concurrent write makes this entry stale
+            snapshot = versions.snapshot(keys)
+
+            entry = response_cache.get(cache_key, snapshot)
+            if entry:
+                return _respond(entry)
+
+            with primary_reads():
+                response = current_app.make_response(view(**kwargs))
+            if response.status_code != 200 or response.is_streamed:
+                return response
+            entry = response_cache.put(cache_key, snapshot, response.get_data(), response.mimetype)
+            return _respond(entry)
+        return wrapper
+    return decorator
+
+
+def async_cached(*deps: str) -> Callable:
+    """cached() for the async views of async_server.py (Quart)."""
+    from quart import Response as AsyncResponse, current_app as async_app, request as async_request
+    from quart.wrappers.response import DataBody
+
+    def decorator(view):
+        @wraps(view)
+        async def wrapper(**kwargs):
+            keys = [d.format(**kwargs) for d in deps]
+            cache_key = _cache_key(async_request)
+            snapshot = await versions.snapshot_async(keys)
+
+            entry = response_cache.get(cache_key, snapshot)
+            if entry:
+                return _respond(entry, AsyncResponse, async_request)
+
+            with primary_reads():
+                response = await async_app.make_response(await view(**kwargs))
+            # Only complete bodies are cached, not streams
+            if response.status_code != 200 or not isinstance(response.response, DataBody):
+                return response
+            entry = response_cache.put(cache_key, snapshot, await response.get_data(), response.mimetype)
+            return _respond(entry, AsyncResponse, async_request)
+        return wrapper
+    return decorator
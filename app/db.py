@@ -0,0 +1,312 @@
+"""
+db.py
+-----
+Per-process MongoDB client and lazily resolved collections.
+
+Nothing here touches the network at import time: the client is built on the
+first query, so importing the app (e.g. in a gunicorn worker) stays cheap and
+does not fail when the database is briefly unavailable.
+
+PyMongo clients must not be shared across fork(). The client remembers the
+pid that created it and a forked worker (gunicorn --preload, multiprocessing)
+builds its own on first use, with a pool sized by the MONGO_* settings below.
+Collections opened with read_only=True use MONGO_READ_PREFERENCE, so
+dashboard queries can go to secondaries when the deployment has them; inside
+primary_reads() they read from the primary like the others (the response
+cache fills entries that way, see cache.py).
+
+async_collection() is the same for the asyncio server (async_server.py): an
+AsyncMongoClient with the same settings, built on first use in the running
+event loop.
+"""
+import asyncio
+import contextvars
+import os
+import threading
+import weakref
+from contextlib import contextmanager
+
+from dotenv import load_dotenv
+from pymongo import AsyncMongoClient, MongoClient
+from pymongo.monitoring import ConnectionPoolListener
+from pymongo.read_preferences import read_pref_mode_from_name, make_read_preference
+from pymongo.server_api import ServerApi
+
+from metrics import command_timer
+
+load_dotenv()
+
+DATABASE_NAME = os.getenv("MONGO_DB_NAME", "ElderData")
+
+# Connection pool sizing and timeouts (milliseconds), passed straight to MongoClient
+MONGO_MAX_POOL_SIZE = int(os.getenv("MONGO_MAX_POOL_SIZE", "100"))
+MONGO_MIN_POOL_SIZE = int(os.getenv("MONGO_MIN_POOL_SIZE", "0"))
+MONGO_MAX_IDLE_TIME_MS = int(os.getenv("MONGO_MAX_IDLE_TIME_MS", "0")) or None
+MONGO_CONNECT_TIMEOUT_MS = int(os.getenv("MONGO_CONNECT_TIMEOUT_MS", "20000"))
+MONGO_SOCKET_TIMEOUT_MS = int(os.getenv("MONGO_SOCKET_TIMEOUT_MS", "0")) or None
+MONGO_SERVER_SELECTION_TIMEOUT_MS = int(os.getenv("MONGO_SERVER_SELECTION_TIMEOUT_MS", "30000"))
+MONGO_WAIT_QUEUE_TIMEOUT_MS = int(os.getenv("MONGO_WAIT_QUEUE_TIMEOUT_MS", "0")) or None
+
+# Read preference of read_only collections (the dashboard's queries).
+# Writes and read-before-write lookups always go to the primary.
+MONGO_READ_PREFERENCE = os.getenv("MONGO_READ_PREFERENCE", "secondaryPreferred")
+
+
+class PoolStats(ConnectionPoolListener):
+    """Connection pool counters for the current process, fed by PyMongo's pool events."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.created = 0
+            self.closed = 0
+            self.checked_out = 0
+            self.max_checked_out = 0
+            self.checkouts = 0
+            self.checkout_failures = 0
+            self.wait_seconds = 0.0
+            self.max_wait_seconds = 0.0
+
+    def pool_created(self, event): pass
+    def pool_ready(self, event): pass
+    def pool_cleared(self, event): pass
+    def pool_closed(self, event): pass
+    def connection_ready(self, event): pass
+    def connection_check_out_started(self, event): pass
+
+    def connection_created(self, event):
+        with self._lock:
+            self.created += 1
+
+    def connection_closed(self, event):
+        with self._lock:
+            self.closed += 1
+
+    def connection_checked_out(self, event):
+        # duration covers the whole checkout, including waiting for a free connection
+        wait = getattr(event, "duration", 0.0) or 0.0
+        with self._lock:
+            self.checkouts += 1
+            self.checked_out += 1
+            self.max_checked_out = max(self.max_checked_out, self.checked_out)
+            self.wait_seconds += wait
+            self.max_wait_seconds = max(self.max_wait_seconds, wait)
+
+    def connection_check_out_failed(self, event):
+        with self._lock:
+            self.checkout_failures += 1
+
+    def connection_checked_in(self, event):
+        with self._lock:
+            self.checked_out -= 1
+
+    def to_dict(self) -> dict:
+        with self._lock:
+            return {
+                "pid": os.getpid(),
+                "max_pool_size": MONGO_MAX_POOL_SIZE,
+                "open": self.created - self.closed,
+                "checked_out": self.checked_out,
+                "max_checked_out": self.max_checked_out,
+                "checkouts": self.checkouts,
+                "checkout_failures": self.checkout_failures,
+                "wait_ms_total": round(self.wait_seconds * 1000, 3),
+                "wait_ms_avg": round(self.wait_seconds * 1000 / self.checkouts, 3) if self.checkouts else 0.0,
+                "wait_ms_max": round(self.max_wait_seconds * 1000, 3),
+            }
+
+
+pool_stats = PoolStats()
+
+_client = None
+_client_pid = None
+_client_database = None
+_database = None
+_lock = threading.Lock()
+_async_clients = weakref.WeakKeyDictionary()  # event loop -> its AsyncMongoClient
+
+
+def _reset_after_fork():
+    # The parent's client (and its sockets) must not be used by the child
+    global _client, _client_pid, _client_database, _lock, _async_clients
+    _client, _client_pid, _client_database = None, None, None
+    _async_clients = weakref.WeakKeyDictionary()
+    _lock = threading.Lock()
+    pool_stats.reset()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+def client_options() -> dict:
+    """MongoClient keyword arguments built from the MONGO_* settings."""
+    return {
+        "server_api": ServerApi('1'),
+        "maxPoolSize": MONGO_MAX_POOL_SIZE,
+        "minPoolSize": MONGO_MIN_POOL_SIZE,
+        "maxIdleTimeMS": MONGO_MAX_IDLE_TIME_MS,
+        "connectTimeoutMS": MONGO_CONNECT_TIMEOUT_MS,
+        "socketTimeoutMS": MONGO_SOCKET_TIMEOUT_MS,
+        "serverSelectionTimeoutMS": MONGO_SERVER_SELECTION_TIMEOUT_MS,
+        "waitQueueTimeoutMS": MONGO_WAIT_QUEUE_TIMEOUT_MS,
+        "event_listeners": [pool_stats, command_timer],
+    }
+
+
+def get_client() -> MongoClient:
+    """Return this process's MongoClient, creating it on first use (and again after a fork)."""
+    global _client, _client_pid, _client_database
+    pid = os.getpid()
+    if _client is None or _client_pid != pid:
+        with _lock:
+            if _client is None or _client_pid != pid:
+                _client = MongoClient(os.getenv("MONGO_DB_KEY"), **client_options())
+                _client_database = _client[DATABASE_NAME]
+                _client_pid = pid
+    return _client
+
+
+def get_database():
+    """Return the application database (or the one set with use_database)."""
+    if _database is not None:
+        return _database
+    get_client()
+    return _client_database
+
+
+def use_database(database):
+    """Point every collection at another database object, e.g. a benchmark database."""
+    global _database
+    _database = database
+
+
+def ping():
+    """Round-trip to the server; raises a PyMongoError if it is unreachable."""
+    get_database().command("ping")
+
+
+def read_preference():
+    """The read preference used for read_only collections."""
+    mode = read_pref_mode_from_name(MONGO_READ_PREFERENCE)
+    return make_read_preference(mode, None)
+
+
+# Set while the current thread or task must not read from secondaries
+_primary_reads = contextvars.ContextVar("primary_reads", default=False)
+
+
+@contextmanager
+def primary_reads():
+    """Make read_only collections read from the primary in this thread or task (and tasks it starts)."""
+    token = _primary_reads.set(True)
+    try:
+        yield
+    finally:
+        _primary_reads.reset(token)
+
+
+class LazyCollection:
+    """
+    Stand-in for a pymongo Collection that resolves it against the current
+    process's database, re-resolving after a fork or use_database().
+    """
+
+    def __init__(self, name: str, read_only: bool = False):
+        self.name = name
+        self.read_only = read_only
+        self._resolved = (None, None, None, None)  # (pid, database, collection, read_only collection)
+
+    def resolve(self):
+        database = get_database()
+        pid, resolved_db, coll, reads = self._resolved
+        if coll is None or pid != os.getpid() or resolved_db is not database:
+            coll = database[self.name]
+            reads = coll.with_options(read_preference=read_preference()) if self.read_only else coll
+            self._resolved = (os.getpid(), database, coll, reads)
+        return coll if _primary_reads.get() else reads
+
+    def __getattr__(self, attr):
+        return getattr(self.resolve(), attr)
+
+    def __repr__(self):
+        return f"LazyCollection({self.name!r}, read_only={self.read_only})"
+
+
+def collection(name: str, read_only: bool = False) -> LazyCollection:
+    """
+    Return a lazily resolved collection of the application database.
+    read_only collections use MONGO_READ_PREFERENCE and may return slightly stale data.
+    """
+    return LazyCollection(name, read_only)
+
+
+# -----------------------------
+# Async client
+# -----------------------------
+def get_async_client() -> AsyncMongoClient:
+    """
+    Return the AsyncMongoClient of the running event loop, creating it on first use.
+    An async client belongs to the loop it was created in, so every loop gets its own;
+    close it with close_async_client() before the loop ends.
+    """
+    loop = asyncio.get_running_loop()
+    client = _async_clients.get(loop)
+    if client is None:
+        with _lock:
+            client = _async_clients.get(loop)
+            if client is None:
+                client = _async_clients[loop] = AsyncMongoClient(os.getenv("MONGO_DB_KEY"), **client_options())
+    return client
+
+
+async def close_async_client():
+    """Close the running event loop's AsyncMongoClient, if it has one."""
+    with _lock:
+        client = _async_clients.pop(asyncio.get_running_loop(), None)
+    if client is not None:
+        await client.close()
+
+
+def get_async_database():
+    """The application database (or the one set with use_database, by name) on the async client."""
+    return get_async_client()[_database.name if _database is not None else DATABASE_NAME]
+
+
+async def async_ping():
+    """ping() over the async client."""
+    await get_async_database().command("ping")
+
+
+class LazyAsyncCollection:
+    """LazyCollection for the async client; resolved per event loop and database."""
+
+    def __init__(self, name: str, read_only: bool = False):
+        self.name = name
+        self.read_only = read_only
+        self._resolved = ((None, None), None, None)  # ((client, database name), collection, read_only collection)
+
+    def resolve(self):
+        database = get_async_database()
+        key = (database.client, database.name)
+        resolved, coll, reads = self._resolved
+        # Clients compare equal by address, so check identity (a new loop has a new client)
+        if coll is None or resolved[0] is not key[0] or resolved[1] != key[1]:
+            coll = database[self.name]
+            reads = coll.with_options(read_preference=read_preference()) if self.read_only else coll
+            self._resolved = (key, coll, reads)
+        return coll if _primary_reads.get() else reads
+
+    def __getattr__(self, attr):
+        return getattr(self.resolve(), attr)
+
+    def __repr__(self):
+        return f"LazyAsyncCollection({self.name!r}, read_only={self.read_only})"
+
+
+def async_collection(name: str, read_only: bool = False) -> LazyAsyncCollection:
+    """collection() for coroutines: methods of the returned collection are awaited."""
+    return LazyAsyncCollection(name, read_only)
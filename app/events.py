@@ -0,0 +1,177 @@
+"""
+events.py
+---------
+In-process publish/subscribe bus for flag alerts, served to dashboards as
+Server-Sent Events by /events.
+
+Every subscriber gets its own bounded queue; when a slow client falls behind
+the oldest undelivered events are dropped, so publishing never blocks
+ingestion. Recent events are kept in a ring buffer so a reconnecting client
+can resume from its Last-Event-ID.
+
+Event ids are only meaningful within one server process. Publishing is
+thread-safe; asyncio subscribers (async_server.py) wait with get_async,
+which is woken from the publishing thread without holding a thread itself.
+"""
+import asyncio
+import itertools
+import os
+import threading
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Iterable, List, Optional, Set
+
+from bson import ObjectId
+
+# Events kept for Last-Event-ID resume, and undelivered events kept per subscriber
+EVENT_HISTORY_SIZE = int(os.getenv("EVENT_HISTORY_SIZE", "1000"))
+SUBSCRIBER_QUEUE_SIZE = int(os.getenv("SUBSCRIBER_QUEUE_SIZE", "100"))
+
+
+@dataclass
+class Event:
+    """
+    One published event.
+
+    Attributes:
+        id (int): Monotonic event id (sent as the SSE id).
+        type (str): Event name, e.g. 'flag'.
+        data (dict): JSON-serializable payload.
+        people (Set[ObjectId]): People the event concerns, used for filtering.
+    """
+    id: int
+    type: str
+    data: dict
+    people: Set[ObjectId] = field(default_factory=set)
+
+
+class Subscription:
+    """A subscriber's bounded, drop-oldest queue of events."""
+
+    def __init__(self, bus: "EventBus", people: Optional[Set[ObjectId]], maxsize: int):
+        self.people = people
+        self.dropped = 0
+        self._bus = bus
+        self._events = deque(maxlen=maxsize)
+        self._ready = threading.Condition()
+        self._waiter = None  # (loop, asyncio.Event) of a pending get_async
+
+    def matches(self, event: Event) -> bool:
+        return self.people is None or bool(self.people & event.people)
+
+    def put(self, event: Event):
+        with self._ready:
+            if len(self._events) == self._events.maxlen:
+                self.dropped += 1
+            self._events.append(event)
+            self._ready.notify()
+            waiter = self._waiter
+        if waiter is not None:
+            loop, ready = waiter
+            loop.call_soon_threadsafe(ready.set)
+
+    def get(self, timeout: float = None) -> List[Event]:
+        """Wait up to timeout seconds for events and return everything queued (possibly nothing)."""
+        with self._ready:
+            if not self._events:
+                self._ready.wait(timeout)
+            events = list(self._events)
+            self._events.clear()
+        return events
+
+    async def get_async(self, timeout: float = None) -> List[Event]:
+        """get() for coroutines: waits on the event loop instead of blocking a thread."""
+        ready = asyncio.Event()
+        with self._ready:
+            # Decided under the lock put() uses, so an event can't slip in between the check and the wait
+            waiting = not self._events
+            if waiting:
+                self._waiter = (asyncio.get_running_loop(), ready)
+        if waiting:
+            try:
+                await asyncio.wait_for(ready.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+            finally:
+                with self._ready:
+                    if self._waiter is not None and self._waiter[1] is ready:
+                        self._waiter = None
+        with self._ready:
+            events = list(self._events)
+            self._events.clear()
+        return events
+
+    def close(self):
+        self._bus.unsubscribe(self)
+
+
+class EventBus:
+    """Fan-out of published events to every matching subscription."""
+
+    def __init__(self, history: int = EVENT_HISTORY_SIZE, subscriber_queue: int = SUBSCRIBER_QUEUE_SIZE):
+        self.subscriber_queue = subscriber_queue
+        self._ids = itertools.count(1)
+        self._history = deque(maxlen=history)
+        self._subscribers = []
+        self._lock = threading.Lock()
+
+    def publish(self, event_type: str, data: dict, people: Iterable = ()) -> Event:
+        """Publish an event to every subscriber interested in one of people."""
+        with self._lock:
+            event = Event(next(self._ids), event_type, data, {ObjectId(p) for p in people})
+            self._history.append(event)
+            subscribers = list(self._subscribers)
+        for sub in subscribers:
+            if sub.matches(event):
+                sub.put(event)
+        return event
+
+    def subscribe(self, people: Optional[Iterable] = None, last_event_id: Optional[int] = None) -> Subscription:
+        """
+        Subscribe to events concerning any of people (all events if None).
+        If last_event_id is given, retained events after it are queued first.
+        """
+        sub = Subscription(self, None if people is None else {ObjectId(p) for p in people}, self.subscriber_queue)
+        with self._lock:
+            if last_event_id is not None:
+                for event in self._history:
+                    if event.id > last_event_id and sub.matches(event):
+                        sub.put(event)
+            self._subscribers.append(sub)
+        return sub
+
+    def unsubscribe(self, sub: Subscription):
+        with self._lock:
+            if sub in self._subscribers:
+                self._subscribers.remove(sub)
+
+
+bus = EventBus()
+
+
+def publish_flags(conversation_id, sentences: list, flags: list, participants: list, first_index: int = 0):
+    """
+    Publish one 'flag' event per flagged sentence.
+
+    Args:
+        conversation_id: Id of the conversation the sentences belong to.
+        sentences (list): Sentence objects; sentences[0] has index first_index in the conversation.
+        flags (list): Ids of the flagged sentences.
+        participants (list): Person ids taking part in the conversation.
+        first_index (int): Conversation-wide index of sentences[0].
+    """
+    flagged = set(flags)
+    for position, s in enumerate(sentences):
+        if s._id not in flagged:
+            continue
+        bus.publish("flag", {
+            "conversation": str(conversation_id),
+            "index": first_index + position,
+            "sentence": str(s._id),
+            "rules": list(s.flag_rules),
+            "speaker": str(s.speaker),
+            "text": s.text,
+            "start_time": s.start_time.isoformat() if s.start_time else None,
+            "compound": s.sentiment.get("compound") if isinstance(s.sentiment, dict) else None,
+            "participants": [str(p) for p in participants],
+        }, people=participants)
@@ -0,0 +1,224 @@
+"""
+flag_rules.py
+-------------
+Configurable rules deciding which sentences get flagged for review.
+
+Rules are loaded from a JSON file (FLAG_RULES_FILE, default flag_rules.json
+next to this module):
+
+    {"rules": [
+        {"name": "very_negative", "type": "compound", "max": -0.5},
+        {"name": "abusive_language", "type": "keywords", "keywords": ["shut up", "burden"]},
+        {"name": "caregiver_hostility", "type": "window", "count": 3, "seconds": 60,
+         "role": "Caregiver", "max": -0.3}
+    ]}
+
+Rule types:
+    compound: the sentence's compound score is within [min, max].
+    keywords: the sentence contains one of the keywords (whole words, case-insensitive).
+    window:   at least `count` sentences matching the rule's conditions start
+              within `seconds` of each other; fires on every sentence that completes such a window.
+
+Every rule may also restrict the speaker's role ("role") and the compound
+score ("min"/"max"), and a window rule may require keywords too.
+
+RuleEngine.evaluate makes a single pass over the sentences: the text of each
+sentence is scanned once by an Aho-Corasick automaton built from the keywords
+of all rules, and each rule is then an O(1) check (window rules keep a deque
+of recent matching start times).
+"""
+import json
+import os
+import threading
+from collections import deque
+from typing import Dict, Iterable, List, Optional
+
+from bson import ObjectId
+
+from models import Sentence
+
+FLAG_RULES_FILE = os.getenv("FLAG_RULES_FILE", os.path.join(os.path.dirname(os.path.abspath(__file__)), "flag_rules.json"))
+
+RULE_TYPES = ("compound", "keywords", "window")
+
+
+def normalize(text: str) -> str:
+    """Lowercase, unify apostrophes and collapse whitespace, for keyword matching."""
+    return " ".join(text.lower().replace("’", "'").split())
+
+
+class KeywordAutomaton:
+    """Aho-Corasick automaton reporting which keyword groups occur (as whole words) in a text."""
+
+    def __init__(self, keywords: Dict[str, set]):
+        """keywords: normalized keyword -> ids of the rules it belongs to."""
+        self._goto = [{}]
+        self._fail = [0]
+        self._out = [[]]  # state -> [(keyword length, rule ids)]
+
+        for keyword, rules in keywords.items():
+            state = 0
+            for ch in keyword:
+                nxt = self._goto[state].get(ch)
+                if nxt is None:
+                    nxt = len(self._goto)
+                    self._goto[state][ch] = nxt
+                    self._goto.append({})
+                    self._fail.append(0)
+                    self._out.append([])
+                state = nxt
+            self._out[state].append((len(keyword), frozenset(rules)))
+
+        # Breadth-first failure links; outputs of the fallback state are inherited
+        queue = deque(self._goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for ch, nxt in self._goto[state].items():
+                queue.append(nxt)
+                fallback = self._fail[state]
+                while fallback and ch not in self._goto[fallback]:
+                    fallback = self._fail[fallback]
+                self._fail[nxt] = self._goto[fallback].get(ch, 0)
+                self._out[nxt] = self._out[nxt] + self._out[self._fail[nxt]]
+
+    def match(self, text: str) -> set:
+        """Ids of the rules with a keyword occurring in the (normalized) text on word boundaries."""
+        found = set()
+        state = 0
+        goto, fail, out = self._goto, self._fail, self._out
+        for i, ch in enumerate(text):
+            while state and ch not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(ch, 0)
+            for length, rules in out[state]:
+                start, end = i - length + 1, i + 1
+                if (start == 0 or not text[start - 1].isalnum()) and (end == len(text) or not text[end].isalnum()):
+                    found |= rules
+        return found
+
+
+class Rule:
+    """One configured rule; see the module docstring for the fields."""
+
+    def __init__(self, config: dict):
+        self.name = config["name"]
+        self.type = config.get("type", "compound")
+        if self.type not in RULE_TYPES:
+            raise ValueError(f"Rule '{self.name}': unknown type '{self.type}'")
+        self.role = config["role"].lower() if config.get("role") else None
+        self.min = float(config["min"]) if config.get("min") is not None else None
+        self.max = float(config["max"]) if config.get("max") is not None else None
+        self.keywords = [normalize(k) for k in config.get("keywords", []) if normalize(k)]
+        self.count = int(config.get("count", 1))
+        self.seconds = float(config.get("seconds", 0))
+        if self.type == "keywords" and not self.keywords:
+            raise ValueError(f"Rule '{self.name}': keywords rule without keywords")
+        if self.type == "compound" and self.min is None and self.max is None:
+            raise ValueError(f"Rule '{self.name}': compound rule needs min and/or max")
+        if self.type == "window" and (self.count < 1 or self.seconds <= 0):
+            raise ValueError(f"Rule '{self.name}': window rule needs count >= 1 and seconds > 0")
+
+    def matches(self, compound: Optional[float], role: Optional[str], keyword_hit: bool) -> bool:
+        """Whether one sentence satisfies the rule's per-sentence conditions."""
+        if self.role is not None and role != self.role:
+            return False
+        if self.min is not None and (compound is None or compound < self.min):
+            return False
+        if self.max is not None and (compound is None or compound > self.max):
+            return False
+        return keyword_hit or not self.keywords
+
+
+class RuleEngine:
+    """Evaluates all rules over a sequence of sentences in one pass."""
+
+    def __init__(self, rules: List[Rule]):
+        names = [r.name for r in rules]
+        if len(set(names)) != len(names):
+            raise ValueError("Rule names must be unique")
+        self.rules = rules
+        keywords = {}
+        for i, rule in enumerate(rules):
+            for k in rule.keywords:
+                keywords.setdefault(k, set()).add(i)
+        self._automaton = KeywordAutomaton(keywords) if keywords else None
+        self._windows = [i for i, r in enumerate(rules) if r.type == "window"]
+
+    @classmethod
+    def from_config(cls, config: dict) -> "RuleEngine":
+        return cls([Rule(r) for r in config.get("rules", [])])
+
+    @property
+    def max_window(self) -> float:
+        """Longest window in seconds (how much earlier context evaluate() may need)."""
+        return max((self.rules[i].seconds for i in self._windows), default=0.0)
+
+    def evaluate(self, sentences: List[Sentence], roles: Dict[ObjectId, str] = None,
+                 history: Iterable[Sentence] = ()) -> List[ObjectId]:
+        """
+        Flag scored sentences in place: each sentence's flag_rules is set to the
+        names of the rules that fired on it.
+
+        Args:
+            sentences (List[Sentence]): Scored sentences, in time order.
+            roles (Dict[ObjectId, str]): Person._id -> role, for role conditions.
+            history (Iterable[Sentence]): Earlier sentences of the same conversation;
+                they feed window rules but are not flagged again.
+
+        Returns:
+            List[ObjectId]: Ids of the flagged sentences, in order.
+        """
+        roles = {k: (v or "").lower() for k, v in (roles or {}).items()}
+        windows = {i: deque() for i in self._windows}
+        flagged = []
+        for is_history, sentence in [(True, s) for s in history] + [(False, s) for s in sentences]:
+            fired = self._evaluate_one(sentence, roles, windows)
+            if is_history:
+                continue
+            sentence.flag_rules = fired
+            if fired:
+                flagged.append(sentence._id)
+        return flagged
+
+    def _evaluate_one(self, sentence: Sentence, roles: dict, windows: dict) -> List[str]:
+        scores = sentence.sentiment if isinstance(sentence.sentiment, dict) else {}
+        compound = scores.get("compound")
+        role = roles.get(sentence.speaker)
+        hits = self._automaton.match(normalize(sentence.text)) if self._automaton else ()
+
+        fired = []
+        for i, rule in enumerate(self.rules):
+            if not rule.matches(compound, role, i in hits):
+                continue
+            if rule.type != "window":
+                fired.append(rule.name)
+                continue
+            if sentence.start_time is None:
+                continue
+            recent = windows[i]
+            recent.append(sentence.start_time)
+            while (sentence.start_time - recent[0]).total_seconds() > rule.seconds:
+                recent.popleft()
+            if len(recent) >= rule.count:
+                fired.append(rule.name)
+        return fired
+
+
+def load_rules(path: str = FLAG_RULES_FILE) -> RuleEngine:
+    """Build a RuleEngine from a JSON rules file."""
+    with open(path, encoding="utf-8") as f:
+        return RuleEngine.from_config(json.load(f))
+
+
+_engine = None
+_engine_lock = threading.Lock()
+
+
+def get_engine() -> RuleEngine:
+    """Return the shared engine, loading FLAG_RULES_FILE on first use."""
+    global _engine
+    if _engine is None:
+        with _engine_lock:
+            if _engine is None:
+                _engine = load_rules()
+    return _engine
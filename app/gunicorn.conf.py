@@ -0,0 +1,29 @@
+"""
+gunicorn.conf.py
+----------------
+Run from the app directory:
+    gunicorn server:app
+
+Importing server does no I/O, so workers boot quickly; each worker then
+connects to MongoDB and loads the sentiment model once, before it accepts
+requests, instead of paying for it on its first requests.
+
+preload_app is safe: db.py gives every forked worker its own MongoClient,
+sized by MONGO_MAX_POOL_SIZE. Each worker serves up to `threads` requests
+at once, so a pool a little larger than that avoids waiting for connections
+(see the wait times reported by /stats).
+"""
+import os
+
+bind = os.getenv("BIND", "127.0.0.1:5000")
+workers = int(os.getenv("WEB_CONCURRENCY", "2"))
+threads = int(os.getenv("GUNICORN_THREADS", "4"))
+preload_app = os.getenv("GUNICORN_PRELOAD", "") == "1"
+
+
+def post_worker_init(worker):
+    from server import warm_up
+
+    timings = warm_up(worker.wsgi)
+    worker.log.info("Worker %s warmed up: %s", worker.pid,
+                    ", ".join(f"{step} {seconds * 1000:.0f}ms" for step, seconds in timings.items()))
@@ -1,24 +1,88 @@
 # fetch_data.py
-from dotenv import load_dotenv
-import os
-from pymongo import MongoClient
-from pymongo.server_api import ServerApi
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError, DuplicateKeyError
 from bson import ObjectId
-from datetime import datetime
+from datetime import datetime, timedelta, timezone
+from werkzeug.http import http_date
 import json
+import base64
+import os
+import re
+from itertools import combinations, islice
 from models import Person, Conversation, Sentence
-
-load_dotenv()
+from cache import versions
+from db import collection
+from metrics import stage, timed
+import rollups
+import sentence_store
 
 # -----------------------------
 # MongoDB Connection
 # -----------------------------
-uri = os.getenv("MONGO_DB_KEY")
-client = MongoClient(uri, server_api=ServerApi('1'))
+# Collections resolve the client lazily (see db.py), so importing this module does no I/O
+people = collection("People")
+conversations = collection("Conversations")
+speakers = collection("Speakers")
+
+# Dashboard reads use MONGO_READ_PREFERENCE (secondaries when available) and may lag writes slightly.
+# Anything read before a write, or read back right after one, uses the primary collections above.
+people_reads = collection("People", read_only=True)
+conversations_reads = collection("Conversations", read_only=True)
+
+# Callables run after a Person's name or role changes, so in-process caches
+# built from People (e.g. the speaker registry) can drop stale entries. Other
+# processes notice through the shared "speakers" version key.
+person_change_listeners = []
+
+def _notify_person_changed():
+    versions.bump("speakers")
+    for listener in person_change_listeners:
+        listener()
+
+# Response cache version keys (see cache.py) are bumped after every write below
+def _people_changed(*names):
+    versions.bump("people", *(f"person:{n}" for n in names))
+
+def _person_ids_changed(person_ids):
+    names = []
+    if person_ids:
+        names = [d["name"] for d in people.find({"_id": {"$in": [ObjectId(p) for p in person_ids]}}, {"name": 1})]
+    _people_changed(*names)
 
-db = client["ElderData"]
-people = db["People"]
-conversations = db["Conversations"]
+def _conversations_changed(participants=()):
+    versions.bump("conversations")
+    _person_ids_changed(participants)
+
+# Fields returned for a single conversation lookup (everything the model knows about)
+CONVERSATION_PROJECTION = {
+    "_id": 1,
+    "start_time": 1,
+    "total_time": 1,
+    "participants": 1,
+    "sentences": 1,
+    "flags": 1,
+    "sentiment": 1,
+    # Where the sentences are (see sentence_store.py); ignored by the serializers
+    **sentence_store.LAYOUT_PROJECTION,
+}
+
+# Listings only show metadata, sentiment and flag counts, so leave the transcript out
+SUMMARY_PROJECTION = {k: 1 for k in CONVERSATION_PROJECTION if k != "sentences"}
+
+def ensure_indexes():
+    """Create the indexes the fetch functions rely on. Safe to call repeatedly."""
+    people.create_index("name", unique=True)
+    speakers.create_index([("device", 1), ("label", 1)], unique=True)
+    conversations.create_index("participants")
+    # Compound so keyset pagination on (start_time, _id) never sorts in memory
+    conversations.create_index([("start_time", 1), ("_id", 1)])
+    # Full-text index over the transcript, used by search_sentences
+    conversations.create_index([("sentences.text", "text")], name="sentence_text", default_language="english")
+    # Ingestion dedup keys (see store_conversation); sparse, since live and older conversations have none
+    conversations.create_index("content_hash", unique=True, sparse=True)
+    conversations.create_index("idempotency_key", unique=True, sparse=True)
+    rollups.ensure_indexes()
+    sentence_store.ensure_indexes()
 
 # -----------------------------
 # Helper for JSON-safe conversion
@@ -38,72 +102,1034 @@ def serialize_person(person: Person) -> dict:
     d["conversations"] = [str(c) for c in d["conversations"]]
     return d
 
+def serialize_sentence(sentence: Sentence) -> dict:
+    """Return JSON-serializable dict for a Sentence object."""
+    d = sentence.to_dict()
+    d["_id"] = str(d["_id"])
+    d["speaker"] = str(d["speaker"])
+    if d["start_time"]:
+        d["start_time"] = d["start_time"].isoformat()
+    return d
+
 def serialize_conversation(convo: Conversation) -> dict:
     """Return JSON-serializable dict for a Conversation object."""
     d = convo.to_dict()
     d["_id"] = str(d["_id"])
     d["participants"] = [str(p) for p in d["participants"]]
     d["flags"] = [str(f) for f in d["flags"]]
-    # sentences
-    for i, s in enumerate(d["sentences"]):
-        d["sentences"][i]["_id"] = str(s["_id"])
-        d["sentences"][i]["speaker"] = str(s["speaker"])
-        if s["start_time"]:
-            d["sentences"][i]["start_time"] = s["start_time"].isoformat()
+    d["sentences"] = [serialize_sentence(s) for s in convo.sentences]
+    return d
+
+def serialize_conversation_summary(convo: Conversation) -> dict:
+    """Return JSON-serializable dict for a Conversation object, without its sentences."""
+    d = serialize_conversation(convo)
+    del d["sentences"]
     return d
 
+# -----------------------------
+# Direct BSON -> JSON fast path
+# -----------------------------
+# The model path above copies every sentence three times (from_dict, to_dict,
+# serialize_conversation). The functions below only normalize the top-level
+# fields of a raw document and leave embedded sentences as the cursor returned
+# them; encode_json then converts their ObjectIds and datetimes via json_safe
+# inside the C encoder. The bytes match jsonify() of the serialized models
+# (sorted keys, compact separators, conversation start_time as an HTTP date)
+# for documents written through the models.
+_json_encoder = json.JSONEncoder(default=json_safe, sort_keys=True, separators=(",", ":"))
+
+def fast_conversation(doc: dict, summary: bool = False) -> dict:
+    """Return a JSON-ready shallow copy of a raw conversation document."""
+    start_time = doc.get("start_time")
+    d = {
+        "_id": str(doc.get("_id", ObjectId())),
+        "start_time": http_date(start_time) if start_time else start_time,
+        "total_time": doc.get("total_time", 0),
+        "participants": [str(p) for p in doc.get("participants", [])],
+        "flags": [str(f) for f in doc.get("flags", [])],
+        "sentiment": doc.get("sentiment", ""),
+    }
+    if not summary:
+        d["sentences"] = doc.get("sentences", [])
+    return d
+
+def fast_person(doc: dict) -> dict:
+    """Return a JSON-ready shallow copy of a raw person document."""
+    return {
+        "_id": str(doc.get("_id", ObjectId())),
+        "name": doc.get("name", ""),
+        "role": doc.get("role", ""),
+        "conversations": [str(c) for c in doc.get("conversations", [])],
+        "flag_count": doc.get("flag_count", 0),
+    }
+
+def encode_json(obj) -> bytes:
+    """Encode fast_* output (or lists/dicts containing it) as a JSON response body."""
+    with stage("encode"):
+        return (_json_encoder.encode(obj) + "\n").encode()
+
+def conversation_serializer(summary: bool, fast: bool = False):
+    """
+    Return the (projection, serializer) pair for conversation listings.
+
+    Args:
+        summary (bool): Leave the sentences out.
+        fast (bool): Skip the model round-trip; the result must be encoded with encode_json.
+    """
+    # Timed per document so the "serialize" stage excludes the cursor's own time
+    if fast:
+        return (SUMMARY_PROJECTION if summary else CONVERSATION_PROJECTION), timed("serialize", lambda c: fast_conversation(c, summary))
+    if summary:
+        return SUMMARY_PROJECTION, timed("serialize", lambda c: serialize_conversation_summary(Conversation.from_dict(c)))
+    return CONVERSATION_PROJECTION, timed("serialize", lambda c: serialize_conversation(conversation_from_doc(c)))
+
+def person_serializer(fast: bool = False):
+    """Return the serializer for raw person documents (see conversation_serializer)."""
+    if fast:
+        return timed("serialize", fast_person)
+    return timed("serialize", lambda p: serialize_person(Person.from_dict(p)))
+
+# Cursor batch size used when streaming whole collections
+STREAM_BATCH_SIZE = 100
+
+# -----------------------------
+# Bucketed sentences
+# -----------------------------
+# Documents of bucketed conversations (see sentence_store.py) have no "sentences"
+# field. Listings load the buckets of a whole batch of documents with one query
+# before serializing; a single conversation turned into a model gets a lazily
+# loaded sentence sequence instead.
+def conversation_from_doc(doc: dict) -> Conversation:
+    """Build a Conversation from a document of either layout."""
+    if sentence_store.is_bucketed(doc) and "sentences" not in doc:
+        return Conversation.from_dict(doc, sentence_store.LazySentences(
+            doc["_id"], doc.get("sentence_count", 0), sentence_store.bucket_size(doc)))
+    return Conversation.from_dict(doc)
+
+def _with_sentences(docs: list, summary: bool = False) -> list:
+    """Fill in the sentences of the bucketed documents among docs, unless summary."""
+    if not summary:
+        sentence_store.attach(docs)
+    return docs
+
+def _batches(cursor, size: int = STREAM_BATCH_SIZE):
+    while True:
+        batch = list(islice(cursor, size))
+        if not batch:
+            return
+        yield batch
+
+def iter_conversation_docs(query: dict = None, projection: dict = None):
+    """Yield raw conversation documents with their sentences, whatever the layout (for maintenance jobs)."""
+    if projection is not None:
+        projection = {**projection, **sentence_store.LAYOUT_PROJECTION}
+    cursor = conversations.find(query or {}, projection).sort("_id", 1).batch_size(STREAM_BATCH_SIZE)
+    for batch in _batches(cursor):
+        yield from _with_sentences(batch)
+
+# -----------------------------
+# Pagination cursors
+# -----------------------------
+
+def encode_cursor(*values) -> str:
+    """Encode the sort key of the last returned document as an opaque cursor string."""
+    raw = json.dumps(values, default=json_safe)
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+def decode_cursor(cursor: str) -> list:
+    """
+    Decode a cursor produced by encode_cursor.
+
+    Raises:
+        ValueError: If the cursor is not one we produced.
+    """
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded.encode()))
+    except (ValueError, TypeError) as e:
+        raise ValueError(f"Invalid cursor '{cursor}'") from e
+    if not isinstance(values, list):
+        raise ValueError(f"Invalid cursor '{cursor}'")
+    return values
+
 # -----------------------------
 # Fetch Functions
 # -----------------------------
-def get_all_people():
+def iter_people(fast: bool = False):
+    """Yield every person as a JSON-serializable dict, as the cursor produces them."""
+    serialize = person_serializer(fast)
+    for p in people_reads.find().batch_size(STREAM_BATCH_SIZE):
+        yield serialize(p)
+
+def get_all_people(fast: bool = False):
     """Return list of all people as JSON-serializable dicts."""
-    people_docs = people.find()
-    return [serialize_person(Person.from_dict(p)) for p in people_docs]
+    return list(iter_people(fast))
+
+# Query builders shared with the async read path (async_data.py)
+def people_page_query(after: str = None) -> dict:
+    """Query for the people after a get_people_page cursor (ValueError if it is malformed)."""
+    if not after:
+        return {}
+    (last_id,) = decode_cursor(after)
+    if not ObjectId.is_valid(last_id):
+        raise ValueError(f"Invalid cursor '{after}'")
+    return {"_id": {"$gt": ObjectId(last_id)}}
+
+def conversations_page_query(after: str = None) -> dict:
+    """Query for the conversations after a get_conversations_page cursor (ValueError if it is malformed)."""
+    if not after:
+        return {}
+    last_start, last_id = decode_cursor(after)
+    if not ObjectId.is_valid(last_id):
+        raise ValueError(f"Invalid cursor '{after}'")
+    last_id = ObjectId(last_id)
+    if last_start is None:
+        # null sorts before every date, so every dated conversation comes later
+        return {"$or": [
+            {"start_time": None, "_id": {"$gt": last_id}},
+            {"start_time": {"$ne": None}},
+        ]}
+    try:
+        last_start = datetime.fromisoformat(last_start)
+    except (ValueError, TypeError) as e:
+        raise ValueError(f"Invalid cursor '{after}'") from e
+    return {"$or": [
+        {"start_time": {"$gt": last_start}},
+        {"start_time": last_start, "_id": {"$gt": last_id}},
+    ]}
 
-def get_person_by_name(name: str):
+def conversations_page_cursor(docs: list, limit: int):
+    """Cursor for the page after docs (fetched with limit + 1), or None on the last page."""
+    if len(docs) <= limit:
+        return None
+    last = docs[limit - 1]
+    return encode_cursor(last.get("start_time"), last["_id"])
+
+def get_people_page(limit: int, after: str = None, fast: bool = False):
+    """
+    Return one page of people ordered by _id.
+
+    Args:
+        limit (int): Maximum number of people to return.
+        after (str): Cursor returned with the previous page, if any.
+        fast (bool): Skip the model round-trip (encode the result with encode_json).
+
+    Returns:
+        tuple: (list of JSON-serializable dicts, cursor for the next page or None)
+
+    Raises:
+        ValueError: If the cursor is malformed.
+    """
+    docs = list(people_reads.find(people_page_query(after)).sort("_id", 1).limit(limit + 1))
+    next_cursor = encode_cursor(docs[limit - 1]["_id"]) if len(docs) > limit else None
+    serialize = person_serializer(fast)
+    return [serialize(p) for p in docs[:limit]], next_cursor
+
+def get_person_by_name(name: str, fast: bool = False):
     """Return a single person by name as JSON-serializable dicts.."""
-    p_doc = people.find_one({"name": name})
+    p_doc = people_reads.find_one({"name": name})
     if not p_doc:
         return None
-    return serialize_person(Person.from_dict(p_doc))
+    return person_serializer(fast)(p_doc)
+
+def iter_conversations(summary: bool = False, fast: bool = False):
+    """Yield every conversation as a JSON-serializable dict, as the cursor produces them."""
+    projection, serialize = conversation_serializer(summary, fast)
+    for batch in _batches(conversations_reads.find({}, projection).batch_size(STREAM_BATCH_SIZE)):
+        for c in _with_sentences(batch, summary):
+            yield serialize(c)
+
+def get_all_conversations(summary: bool = False, fast: bool = False):
+    """Return all conversations as JSON-serializable dicts (without sentences if summary)."""
+    return list(iter_conversations(summary, fast))
+
+def get_conversations_page(limit: int, after: str = None, summary: bool = False, fast: bool = False):
+    """
+    Return one page of conversations ordered by (start_time, _id).
+
+    Args:
+        limit (int): Maximum number of conversations to return.
+        after (str): Cursor returned with the previous page, if any.
+        summary (bool): Leave the sentences out of each conversation.
+        fast (bool): Skip the model round-trip (encode the result with encode_json).
+
+    Returns:
+        tuple: (list of JSON-serializable dicts, cursor for the next page or None)
+
+    Raises:
+        ValueError: If the cursor is malformed.
+    """
+    query = conversations_page_query(after)
+    projection, serialize = conversation_serializer(summary, fast)
+    docs = list(conversations_reads.find(query, projection).sort([("start_time", 1), ("_id", 1)]).limit(limit + 1))
+    next_cursor = conversations_page_cursor(docs, limit)
+    return [serialize(c) for c in _with_sentences(docs[:limit], summary)], next_cursor
+
+def get_conversation_by_id(conv_id: str, summary: bool = False, fast: bool = False):
+    """
+    Return a single conversation by its ObjectId as a JSON-serializable dict.
+
+    Args:
+        conv_id (str): The ObjectId of the conversation as a string.
+        summary (bool): Leave the sentences out.
+        fast (bool): Skip the model round-trip (encode the result with encode_json).
+
+    Returns:
+        dict or None: The conversation, or None if the id is malformed or unknown.
+    """
+    if not ObjectId.is_valid(conv_id):
+        return None
+    projection, serialize = conversation_serializer(summary, fast)
+    c_doc = conversations_reads.find_one({"_id": ObjectId(conv_id)}, projection)
+    if not c_doc:
+        return None
+    if fast:
+        _with_sentences([c_doc], summary)
+    return serialize(c_doc)
+
+def get_conversation_sentences(conv_id: str, offset: int = 0, limit: int = 50,
+                               start: datetime = None, end: datetime = None):
+    """
+    Return a slice of one conversation's sentences without loading the rest of the transcript.
+
+    Args:
+        conv_id (str): The ObjectId of the conversation as a string.
+        offset (int): Index of the first sentence to return.
+        limit (int): Maximum number of sentences to return.
+        start (datetime): Only consider sentences starting at or after this time.
+        end (datetime): Only consider sentences starting before this time.
+
+    Returns:
+        dict or None: {"_id", "offset", "total", "sentences"} where total counts the
+        sentences in the (optional) time window, or None if the conversation is unknown.
+    """
+    if not ObjectId.is_valid(conv_id):
+        return None
+    rows = list(conversations_reads.aggregate(sentences_page_pipeline(conv_id, offset, limit, start, end)))
+    if not rows:
+        return None
+    total, docs = rows[0]["total"], rows[0]["sentences"]
+    if sentence_store.is_bucketed(rows[0]):
+        total, docs = sentence_store.page(rows[0], offset, limit, start, end)
+    return sentences_page(conv_id, offset, total, docs)
+
+def sentences_page_pipeline(conv_id: str, offset: int, limit: int, start: datetime = None, end: datetime = None) -> list:
+    """Aggregation returning {total, sentences, layout fields} for get_conversation_sentences."""
+    sentences = "$sentences"
+    window = []
+    if start is not None:
+        window.append({"$gte": ["$$s.start_time", start]})
+    if end is not None:
+        window.append({"$lt": ["$$s.start_time", end]})
+    if window:
+        sentences = {"$filter": {"input": "$sentences", "as": "s", "cond": {"$and": window}}}
+    return [
+        {"$match": {"_id": ObjectId(conv_id)}},
+        {"$project": {"sentences": sentences, **sentence_store.LAYOUT_PROJECTION}},
+        {"$project": {
+            "total": {"$size": {"$ifNull": ["$sentences", []]}},
+            "sentences": {"$slice": [{"$ifNull": ["$sentences", []]}, offset, limit]},
+            **sentence_store.LAYOUT_PROJECTION,
+        }},
+    ]
+
+def sentences_page(conv_id: str, offset: int, total: int, docs: list) -> dict:
+    with stage("serialize"):
+        serialized = [serialize_sentence(Sentence.from_dict(s)) for s in docs]
+    return {
+        "_id": conv_id,
+        "offset": offset,
+        "total": total,
+        "sentences": serialized,
+    }
+
+def flagged_sentences_pipeline(conv_id: str) -> list:
+    """Aggregation returning {sentences: the flagged ones, flags, layout fields} for get_flagged_sentences."""
+    return [
+        {"$match": {"_id": ObjectId(conv_id)}},
+        {"$project": {
+            "sentences": {"$filter": {
+                "input": {"$ifNull": ["$sentences", []]}, "as": "s",
+                "cond": {"$in": ["$$s._id", {"$ifNull": ["$flags", []]}]},
+            }},
+            "flags": 1,
+            **sentence_store.LAYOUT_PROJECTION,
+        }},
+    ]
+
+def get_flagged_sentences(conv_id: str):
+    """
+    Return every flagged sentence of a conversation, in transcript order, without
+    loading the rest of the transcript.
+
+    Returns:
+        dict or None: {"_id", "total", "sentences"}, or None if the conversation is unknown.
+    """
+    if not ObjectId.is_valid(conv_id):
+        return None
+    rows = list(conversations_reads.aggregate(flagged_sentences_pipeline(conv_id)))
+    if not rows:
+        return None
+    docs = rows[0]["sentences"]
+    if sentence_store.is_bucketed(rows[0]):
+        docs = sentence_store.find_flagged(rows[0])
+    return flagged_page(conv_id, docs)
+
+def flagged_page(conv_id: str, docs: list) -> dict:
+    with stage("serialize"):
+        serialized = [serialize_sentence(Sentence.from_dict(s)) for s in docs]
+    return {"_id": conv_id, "total": len(serialized), "sentences": serialized}
+
+def sentence_projection(sentence_id: str) -> dict:
+    return {"sentences": {"$elemMatch": {"_id": ObjectId(sentence_id)}}, "sentence_layout": 1}
+
+def get_sentence(conv_id: str, sentence_id: str):
+    """Return one sentence document of a conversation (without the rest of the transcript), or None."""
+    if not ObjectId.is_valid(conv_id) or not ObjectId.is_valid(sentence_id):
+        return None
+    c_doc = conversations_reads.find_one({"_id": ObjectId(conv_id)}, sentence_projection(sentence_id))
+    if c_doc and sentence_store.is_bucketed(c_doc):
+        return sentence_store.find_sentence(c_doc["_id"], ObjectId(sentence_id))
+    if not c_doc or not c_doc.get("sentences"):
+        return None
+    return c_doc["sentences"][0]
+
+# -----------------------------
+# Sentence search
+# -----------------------------
+SEARCH_TOKEN_RE = re.compile(r'(-?)"([^"]+)"|(-?)(\S+)')
+
+def parse_search_query(query: str):
+    """
+    Split a search query into (phrases, terms, excluded) the way MongoDB's $text reads it:
+    "quoted phrases" must all appear, plain terms match if any appears, -term/-"phrase" must not.
+    """
+    phrases, terms, excluded = [], [], []
+    for neg_phrase, phrase, neg_term, term in SEARCH_TOKEN_RE.findall(query):
+        if phrase:
+            (excluded if neg_phrase else phrases).append(phrase.strip())
+        elif term.strip('"'):
+            (excluded if neg_term else terms).append(term.strip('"'))
+    return phrases, terms, excluded
 
-def get_all_conversations():
-    """Return all conversations as JSON-serializable dicts."""
-    convo_docs = conversations.find()
-    return [serialize_conversation(Conversation.from_dict(c)) for c in convo_docs]
+def _contains(pattern: str):
+    return {"$regexMatch": {"input": "$$s.text", "regex": pattern, "options": "i"}}
 
-def get_conversations_by_person(name: str):
+class SentenceSearch:
+    """
+    The pipelines of one search_sentences call, so the sync and async read paths
+    run the same queries. Conversations holding their own sentences are searched
+    through the Conversations text index; when some conversations are bucketed
+    (see sentence_store.py), their buckets are searched too and the two
+    newest-first result lists are merged.
+    """
+
+    def __init__(self, query: str, person_id=None, speaker_id=None, start: datetime = None, end: datetime = None,
+                 min_compound: float = None, max_compound: float = None, limit: int = 50, offset: int = 0):
+        phrases, terms, excluded = parse_search_query(query)
+        if not phrases and not terms:
+            raise ValueError("Search query must contain at least one word or phrase")
+        self.query = query
+        self.person_id = ObjectId(person_id) if person_id is not None else None
+        self.end = end
+        self.limit = limit
+        self.offset = offset
+
+        self.match = {"$text": {"$search": query}}
+        if person_id is not None:
+            self.match["participants"] = self.person_id
+        if end is not None:
+            self.match["start_time"] = {"$lt": end}
+
+        # Per-sentence version of the $text match plus the other filters
+        cond = [_contains(re.escape(p)) for p in phrases]
+        if not phrases:
+            cond.append({"$or": [_contains(r"\b" + re.escape(t)) for t in terms]})
+        cond += [{"$not": [_contains(re.escape(x))]} for x in excluded]
+        if speaker_id is not None:
+            cond.append({"$eq": ["$$s.speaker", ObjectId(speaker_id)]})
+        if start is not None:
+            cond.append({"$gte": ["$$s.start_time", start]})
+        if end is not None:
+            cond.append({"$lt": ["$$s.start_time", end]})
+        if min_compound is not None:
+            cond.append({"$gte": ["$$s.sentiment.compound", min_compound]})
+        if max_compound is not None:
+            cond.append({"$lte": ["$$s.sentiment.compound", max_compound]})
+        self.cond = cond
+
+    def _matching(self, owner: str) -> list:
+        return [
+            {"$project": {owner: 1, "sentences": {"$filter": {"input": "$sentences", "as": "s", "cond": {"$and": self.cond}}}}},
+            {"$unwind": "$sentences"},
+            {"$sort": {"sentences.start_time": -1, "sentences._id": -1}},
+        ]
+
+    def conversations_pipeline(self, merged: bool = False) -> list:
+        """Search of the Conversations collection; merged: the first offset + limit + 1 rows, to merge with buckets."""
+        page = [{"$limit": self.offset + self.limit + 1}] if merged else [{"$skip": self.offset}, {"$limit": self.limit + 1}]
+        return [{"$match": self.match}, *self._matching("_id"), *page]
+
+    def buckets_pipeline(self, person_conversations: list = None) -> list:
+        """Search of the SentenceBuckets collection (person_conversations: ids of person_id's conversations)."""
+        match = {"$text": {"$search": self.query}}
+        if self.person_id is not None:
+            match["conversation"] = {"$in": [ObjectId(c) for c in person_conversations or []]}
+        if self.end is not None:
+            match["start_time"] = {"$lt": self.end}
+        return [{"$match": match}, *self._matching("conversation"), {"$limit": self.offset + self.limit + 1},
+                {"$project": {"_id": "$conversation", "sentences": 1}}]
+
+    def results(self, rows: list, bucket_rows: list = None) -> dict:
+        """The search_sentences result from the rows of the pipelines above."""
+        if bucket_rows is not None:
+            rows = sorted(rows + bucket_rows, reverse=True,
+                          key=lambda r: (r["sentences"].get("start_time") or datetime.min, r["sentences"]["_id"]))
+            rows = rows[self.offset:self.offset + self.limit + 1]
+        with stage("serialize"):
+            results = []
+            for row in rows[:self.limit]:
+                d = serialize_sentence(Sentence.from_dict(row["sentences"]))
+                d["conversation"] = str(row["_id"])
+                results.append(d)
+        return {"results": results, "next_offset": self.offset + self.limit if len(rows) > self.limit else None}
+
+def search_sentences(query: str, person_id=None, speaker_id=None, start: datetime = None, end: datetime = None,
+                     min_compound: float = None, max_compound: float = None, limit: int = 50, offset: int = 0):
+    """
+    Find sentences whose text matches a search query, newest first.
+
+    The text index narrows the search to matching conversations; only their
+    sentences are then filtered, so the cost follows the number of matches
+    rather than the size of the corpus. Terms match as word prefixes, which
+    approximates the index's stemming ("medicine" also finds "medicines").
+
+    Args:
+        query (str): Words and "quoted phrases"; -word excludes.
+        person_id: Only conversations this person took part in.
+        speaker_id: Only sentences said by this person.
+        start, end (datetime): Only sentences starting in [start, end).
+        min_compound, max_compound (float): Bounds on the sentence's compound sentiment.
+        limit (int): Maximum number of results.
+        offset (int): Results to skip.
+
+    Returns:
+        dict: {"results": [sentence dicts plus "conversation"], "next_offset": int or None}
+
+    Raises:
+        ValueError: If the query has nothing to search for.
+    """
+    search = SentenceSearch(query, person_id, speaker_id, start, end, min_compound, max_compound, limit, offset)
+    if sentence_store.buckets_reads.find_one({}, {"_id": 1}) is None:
+        return search.results(list(conversations_reads.aggregate(search.conversations_pipeline())))
+
+    person_conversations = None
+    if person_id is not None:
+        person = people_reads.find_one({"_id": ObjectId(person_id)}, {"conversations": 1}) or {}
+        person_conversations = person.get("conversations", [])
+    return search.results(list(conversations_reads.aggregate(search.conversations_pipeline(merged=True))),
+                          list(sentence_store.buckets_reads.aggregate(search.buckets_pipeline(person_conversations))))
+
+def get_conversations_by_person(name: str, summary: bool = False, fast: bool = False):
     """
     Return all conversations that a person participates in,
     using the conversation IDs stored in their Person document as JSON-serializable dicts.
+    If summary is set the sentences are left out; fast skips the model round-trip
+    (encode the result with encode_json).
     """
-    # 1. Find the person document by name
-    person_doc = people.find_one({"name": name})
+    person_doc = people_reads.find_one({"name": name}, {"conversations": 1})
     if not person_doc:
         return []
+    return get_conversations_by_ids(person_doc.get("conversations", []), summary, fast)
 
-    # 2. Extract conversation IDs
-    convo_ids = [ObjectId(c) for c in person_doc.get("conversations", [])]
-
+def get_conversations_by_ids(convo_ids: list, summary: bool = False, fast: bool = False):
+    """Return the conversations with the given ids as JSON-serializable dicts (see get_conversations_by_person)."""
+    convo_ids = [ObjectId(c) for c in convo_ids]
     if not convo_ids:
         return []
+    projection, serialize = conversation_serializer(summary, fast)
+    convo_docs = list(conversations_reads.find({"_id": {"$in": convo_ids}}, projection))
+    return [serialize(c) for c in _with_sentences(convo_docs, summary)]
+
+def get_person_overview(name: str, summary: bool = True):
+    """
+    Return what the person page shows, in one call: the person, their flag total and
+    their conversations (without sentences unless summary is False), in fast-path
+    form (encode with encode_json). None if the person is unknown.
+
+    The flag total and conversation ids come from the person document, so this is
+    two queries: the person, then their conversations.
+    """
+    person_doc = people_reads.find_one({"name": name})
+    if not person_doc:
+        return None
+    return overview(person_doc, get_conversations_by_ids(person_doc.get("conversations", []), summary, fast=True))
+
+def overview(person_doc: dict, conversations: list) -> dict:
+    """The get_person_overview result for a person document and their serialized conversations."""
+    return {
+        "person": fast_person(person_doc),
+        "total_flags": person_doc.get("flag_count", 0),
+        "conversations": conversations,
+    }
+
+def get_flag_counts(names: list) -> dict:
+    """
+    Return the precomputed flag counters for several people in one query.
+
+    Args:
+        names (list): Names of the people to look up.
+
+    Returns:
+        dict: Mapping of name -> total flags. Unknown names are left out.
+    """
+    docs = people_reads.find({"name": {"$in": list(names)}}, {"name": 1, "flag_count": 1})
+    return {d["name"]: d.get("flag_count", 0) for d in docs}
+
+def get_person_ids(names: list) -> dict:
+    """
+    Return the ObjectIds of several people by name in one query.
+
+    Args:
+        names (list): Names of the people to look up.
+
+    Returns:
+        dict: Mapping of name -> ObjectId. Unknown names are left out.
+    """
+    return {d["name"]: d["_id"] for d in people_reads.find({"name": {"$in": list(names)}}, {"name": 1})}
+
+# -----------------------------
+# Ingestion
+# -----------------------------
+# Uploaded conversations may carry two dedup keys on top of the model: content_hash
+# (parse.transcript_hash, or a hash of the audio file) and the client's idempotency_key.
+# Both have unique indexes, so a duplicate insert fails before any counter is touched.
+#
+# The insert claims the keys, but the counters, rollups and participant links are
+# written after it, and MongoDB cannot do both atomically without a transaction.
+# So a conversation is inserted with ingest_step (the next step still to run:
+# "rollups", then "people") and an ingest_lease owned by the writer; both are unset
+# once the participants are linked. If a writer fails, the lease is released, and
+# the next upload of the same conversation finishes the remaining steps before it
+# is reported as a duplicate (see find_duplicate_conversation). Linking a person
+# and counting its flags is one update guarded by the link, so it never counts
+# twice; rollups are counted again only if a writer dies between writing them and
+# recording the step (manage.py rebuild-rollups repairs that).
+INGEST_LEASE_SECONDS = float(os.getenv("INGEST_LEASE_SECONDS", "300"))
+
+def _ingest_doc(conversation: Conversation, content_hash: str = None, idempotency_key: str = None) -> dict:
+    doc = conversation.to_dict()
+    if content_hash:
+        doc["content_hash"] = content_hash
+    if idempotency_key:
+        doc["idempotency_key"] = idempotency_key
+    if sentence_store.SENTENCE_STORAGE == sentence_store.BUCKETED:
+        doc.update(sentence_store.layout_fields(len(doc["sentences"])))
+    doc["ingest_step"] = "rollups"
+    doc["ingest_lease"] = datetime.now(timezone.utc) + timedelta(seconds=INGEST_LEASE_SECONDS)
+    return doc
+
+def _split_sentences(docs: list) -> dict:
+    """
+    Take the sentences out of bucketed documents, to be written with
+    sentence_store.write_many before the documents are inserted (so a
+    conversation whose later steps are finished by a retry has its sentences).
+
+    Returns:
+        dict: Conversation id -> (sentence documents, bucket size).
+    """
+    return {d["_id"]: (d.pop("sentences"), d["bucket_size"]) for d in docs if sentence_store.is_bucketed(d)}
+
+def _drop_orphan_buckets(conv_ids: list):
+    """Delete the buckets written for documents whose insert was rejected, unless a conversation owns them."""
+    stored = {d["_id"] for d in conversations.find({"_id": {"$in": conv_ids}}, {"_id": 1})}
+    orphans = [i for i in conv_ids if i not in stored]
+    if orphans:
+        sentence_store.delete(orphans)
+
+def _link_update(conv_id: ObjectId, flag_count: int) -> dict:
+    # Used with a {"conversations": {"$ne": conv_id}} filter, so linking twice neither links nor counts twice
+    return {"$addToSet": {"conversations": conv_id}, "$inc": {"flag_count": flag_count}}
+
+def _link_participants_ops(conversation: Conversation) -> list:
+    return [
+        UpdateOne({"_id": ObjectId(p), "conversations": {"$ne": conversation._id}},
+                  _link_update(conversation._id, len(conversation.flags)))
+        for p in dict.fromkeys(conversation.participants)
+    ]
+
+def _finish_ingest(conversation: Conversation, step: str = "rollups"):
+    """Run the steps of an inserted conversation from step on, then clear its ingest marker."""
+    if step == "rollups":
+        rollups.record_conversation(conversation.sentences, conversation.flags,
+                                    conversation.participants, conversation.start_time)
+        conversations.update_one({"_id": conversation._id, "ingest_step": "rollups"},
+                                 {"$set": {"ingest_step": "people"}})
+    ops = _link_participants_ops(conversation)
+    if ops:
+        people.bulk_write(ops, ordered=False)
+    conversations.update_one({"_id": conversation._id}, {"$unset": {"ingest_step": "", "ingest_lease": ""}})
+    _conversations_changed(conversation.participants)
+
+def _release_on_error(conv_id: ObjectId, finish, *args):
+    """Run finish(*args); if it fails, give up the lease so the next upload can finish the conversation."""
+    try:
+        finish(*args)
+    except Exception:
+        conversations.update_one({"_id": conv_id}, {"$unset": {"ingest_lease": ""}})
+        raise
+
+def finish_conversation(conv_id: ObjectId) -> bool:
+    """
+    Finish the ingestion of a stored conversation whose writer failed or died
+    (ingest_step set, lease released or expired). Does nothing while another
+    writer holds the lease.
 
-    # 3. Fetch conversations by their IDs
-    convo_docs = conversations.find({"_id": {"$in": convo_ids}})
+    Returns:
+        bool: True if the conversation is complete now.
+    """
+    now = datetime.now(timezone.utc)
+    doc = conversations.find_one_and_update(
+        {"_id": conv_id, "ingest_step": {"$exists": True},
+         "$or": [{"ingest_lease": {"$exists": False}}, {"ingest_lease": {"$lt": now}}]},
+        {"$set": {"ingest_lease": now + timedelta(seconds=INGEST_LEASE_SECONDS)}},
+    )
+    if doc is None:
+        return conversations.count_documents({"_id": conv_id, "ingest_step": {"$exists": True}}) == 0
+    _release_on_error(conv_id, _finish_ingest, conversation_from_doc(doc), doc["ingest_step"])
+    return True
 
-    # 4. Serialize to JSON-safe dicts
-    return [serialize_conversation(Conversation.from_dict(c)) for c in convo_docs]
+def find_duplicate_conversation(content_hash: str = None, idempotency_key: str = None):
+    """
+    Return the id of a stored conversation with the same content hash or idempotency key.
+    A duplicate left half-written by a failed upload is finished first.
 
-def add_conversation(conversation: Conversation) -> bool:
-    """Add the conversation to the database.
+    Returns:
+        ObjectId or None: The existing conversation's id, None if neither key is known.
+    """
+    clauses = []
+    if idempotency_key:
+        clauses.append({"idempotency_key": idempotency_key})
+    if content_hash:
+        clauses.append({"content_hash": content_hash})
+    if not clauses:
+        return None
+    doc = conversations.find_one({"$or": clauses}, {"_id": 1, "ingest_step": 1})
+    if doc and "ingest_step" in doc:
+        finish_conversation(doc["_id"])
+    return doc["_id"] if doc else None
+
+def add_conversation(conversation: Conversation, content_hash: str = None, idempotency_key: str = None) -> bool:
+    """Add the conversation to the database, with its sentences and dedup keys.
+
+    The document stays marked as pending (ingest_step) until store_conversation
+    has updated the rollups, counters and participant links.
 
     Args:
         conversation (Conversation): The conversation to add
+        content_hash (str): Canonical hash of the transcript or recording, if known.
+        idempotency_key (str): Client-supplied key of the upload, if any.
 
     Returns:
-        Success of the addition
+        Success of the addition (False if a conversation with the same
+        content hash or idempotency key is already stored)
+    """
+    doc = _ingest_doc(conversation, content_hash, idempotency_key)
+    bucketed = _split_sentences([doc])
+    sentence_store.write_many(bucketed)
+    try:
+        return conversations.insert_one(doc).inserted_id is not None
+    except DuplicateKeyError:
+        if bucketed:
+            _drop_orphan_buckets(list(bucketed))
+        return False
+
+def store_conversation(conversation: Conversation, content_hash: str = None, idempotency_key: str = None) -> bool:
     """
-    return conversations.insert_one(conversation.to_dict()).inserted_id is not None
+    Add the conversation to the database and link it to every participant.
+
+    The flag counters of every participant are bumped with the link so /flags
+    never has to rescan conversations, and the conversation is added to the
+    participants' trend rollups.
+
+    Args:
+        conversation (Conversation): The conversation to add
+        content_hash (str): Canonical hash of the transcript or recording, if known.
+        idempotency_key (str): Client-supplied key of the upload, if any.
+
+    Returns:
+        Success of the addition (False for a duplicate, see find_duplicate_conversation)
+    """
+    if not add_conversation(conversation, content_hash, idempotency_key):
+        return False
+    _release_on_error(conversation._id, _finish_ingest, conversation)
+    return True
+
+def bulk_store_conversations(convos, batch_size: int = 500, content_hashes: dict = None) -> int:
+    """
+    Insert many conversations with unordered insert_many batches, write their
+    trend rollups once per batch, then link them to their participants and bump
+    flag counters with a single bulk_write. Duplicates (same content hash) are
+    skipped.
+
+    Args:
+        convos (Iterable[Conversation]): Conversations to add; consumed lazily.
+        batch_size (int): Conversations per insert_many call.
+        content_hashes (dict): Conversation._id -> content hash; may be filled
+            while convos is consumed.
+
+    Returns:
+        int: Number of conversations inserted.
+    """
+    content_hashes = content_hashes if content_hashes is not None else {}
+    inserted = []  # conversations whose participants are linked at the end
+    participants = set()
+
+    def flush(batch):
+        failed = set()
+        docs = [_ingest_doc(c, content_hashes.get(c._id)) for c in batch]
+        bucketed = _split_sentences(docs)
+        sentence_store.write_many(bucketed)
+        try:
+            conversations.insert_many(docs, ordered=False)
+        except BulkWriteError as e:
+            failed = {err["index"] for err in e.details.get("writeErrors", [])}
+        if bucketed and failed:
+            _drop_orphan_buckets([batch[i]._id for i in failed if batch[i]._id in bucketed])
+        stored = [convo for i, convo in enumerate(batch) if i not in failed]
+        trends = rollups.RollupBatch()
+        for convo in stored:
+            trends.add_conversation(convo.sentences, convo.flags, convo.participants, convo.start_time)
+        trends.write()
+        if stored:
+            conversations.update_many({"_id": {"$in": [c._id for c in stored]}, "ingest_step": "rollups"},
+                                      {"$set": {"ingest_step": "people"}})
+        for convo in stored:
+            participants.update(convo.participants)
+            # Only the (small) link data is kept until the end, not the sentences
+            inserted.append(Conversation(participants=convo.participants, start_time=convo.start_time,
+                                         flags=convo.flags, _id=convo._id))
+        return len(stored)
+
+    batch = []
+    for convo in convos:
+        batch.append(convo)
+        if len(batch) >= batch_size:
+            flush(batch)
+            batch = []
+    if batch:
+        flush(batch)
+
+    ops = [op for convo in inserted for op in _link_participants_ops(convo)]
+    if ops:
+        people.bulk_write(ops, ordered=False)
+    if inserted:
+        conversations.update_many({"_id": {"$in": [c._id for c in inserted]}},
+                                  {"$unset": {"ingest_step": "", "ingest_lease": ""}})
+    _conversations_changed(list(participants))
+    return len(inserted)
+
+# -----------------------------
+# Live (incrementally built) conversations
+# -----------------------------
+# Live conversation documents carry a few bookkeeping fields on top of the model:
+# open, device, sentence_count, and the running sentiment_sum/sentiment_weight
+# (sum of compound * word count, and of word counts) used to finalize sentiment.
+LIVE_PROJECTION = {"start_time": 1, "device": 1, "participants": 1, "flags": 1, **sentence_store.LAYOUT_PROJECTION}
+
+def open_conversation(start_time: datetime, device: str) -> ObjectId:
+    """
+    Insert an empty, open conversation that sentences can be appended to.
+
+    Returns:
+        ObjectId: The new conversation's id.
+    """
+    convo = Conversation(participants=[], start_time=start_time, sentiment=0.0)
+    doc = convo.to_dict()
+    doc.update({"open": True, "device": device, "sentence_count": 0, "sentiment_sum": 0.0, "sentiment_weight": 0})
+    if sentence_store.SENTENCE_STORAGE == sentence_store.BUCKETED:
+        del doc["sentences"]
+        doc.update(sentence_store.layout_fields())
+    conversations.insert_one(doc)
+    _conversations_changed()
+    return convo._id
+
+def get_open_conversation(conv_id: str):
+    """Return the bookkeeping fields of an open conversation, or None if unknown or closed."""
+    if not ObjectId.is_valid(conv_id):
+        return None
+    return conversations.find_one({"_id": ObjectId(conv_id), "open": True}, LIVE_PROJECTION)
+
+def get_recent_sentences(conv_id: ObjectId, since: datetime) -> list:
+    """Return the stored sentences of a conversation starting at or after `since` (context for window flag rules)."""
+    rows = list(conversations.aggregate([
+        {"$match": {"_id": conv_id}},
+        {"$project": {"sentence_layout": 1, "sentences": {"$filter": {
+            "input": {"$ifNull": ["$sentences", []]}, "as": "s", "cond": {"$gte": ["$$s.start_time", since]}}}}},
+    ]))
+    if rows and sentence_store.is_bucketed(rows[0]):
+        return [Sentence.from_dict(s) for s in sentence_store.window(conv_id, since, reads=sentence_store.buckets)]
+    return [Sentence.from_dict(s) for s in rows[0]["sentences"]] if rows else []
+
+def append_sentences(live: dict, sentences: list, flags: list, participants: list,
+                     sentiment_sum: float, sentiment_weight: int, total_time: float) -> bool:
+    """
+    Append scored sentences to an open conversation with a single $push update.
+
+    The update only applies if nobody appended since `live` was read
+    (sentence_count is unchanged), so sentences keep their order and window
+    flag rules saw every earlier sentence; callers retry with a fresh
+    get_open_conversation when this returns False. For a bucketed conversation
+    the sentences are first written to the conversation's last bucket(s), with
+    the same guard on the bucket's own count, and the update then pushes only
+    the flags. sentence_count is bumped last, so readers (which stop at it)
+    never see a position whose sentence isn't stored yet.
+
+    Args:
+        live (dict): Document returned by get_open_conversation.
+        sentences (list): Scored Sentence objects to append.
+        flags (list): Ids of the flagged sentences.
+        participants (list): Person ids who spoke in these sentences.
+        sentiment_sum (float): Sum of compound * weight over the sentences.
+        sentiment_weight (int): Sum of weights over the sentences.
+        total_time (float): Seconds from the conversation start to the end of the last sentence.
+
+    Returns:
+        bool: True if the sentences were appended.
+    """
+    count = live.get("sentence_count", 0)
+    bucketed = sentence_store.is_bucketed(live)
+    push = {"flags": {"$each": flags}}
+    if bucketed:
+        size = sentence_store.bucket_size(live)
+        if not sentence_store.append(live["_id"], [s.to_dict() for s in sentences], count, size):
+            return False
+    else:
+        push["sentences"] = {"$each": [s.to_dict() for s in sentences]}
+    result = conversations.update_one(
+        {"_id": live["_id"], "open": True, "sentence_count": count},
+        {
+            "$push": push,
+            "$addToSet": {"participants": {"$each": participants}},
+            "$inc": {
+                "sentence_count": len(sentences),
+                "sentiment_sum": sentiment_sum,
+                "sentiment_weight": sentiment_weight,
+            },
+            "$max": {"total_time": total_time},
+        }
+    )
+    if result.modified_count == 0:
+        if bucketed:
+            # Closed since it was read: take the sentences back out of the buckets
+            sentence_store.truncate(live["_id"], count, size)
+        return False
+
+    # Keep flag counters as add_conversation would: every participant counts every flag,
+    # including the ones raised before they first spoke
+    existing = live.get("participants", [])
+    new_participants = [p for p in participants if p not in existing]
+    if new_participants:
+        people.update_many(
+            {"_id": {"$in": new_participants}},
+            {"$addToSet": {"conversations": live["_id"]},
+             "$inc": {"flag_count": len(live.get("flags", [])) + len(flags)}}
+        )
+    if flags and existing:
+        people.update_many({"_id": {"$in": existing}}, {"$inc": {"flag_count": len(flags)}})
+    _append_rollups(live, sentences, flags, existing, new_participants)
+    _conversations_changed(list(existing) + new_participants)
+    return True
+
+def _append_rollups(live: dict, sentences: list, flags: list, existing: list, new_participants: list):
+    """
+    Add appended sentences to the trend rollups. Existing participants (and their
+    pairs) get the new sentences; people who just joined get the whole conversation
+    so far, like they would had it been stored in one piece.
+    """
+    count = live.get("sentence_count", 0)
+    trends = rollups.RollupBatch()
+    if existing:
+        trends.add(sentences, set(flags),
+                   live["start_time"], people=existing, pairs=combinations(existing, 2), count_conversation=False)
+    if new_participants:
+        # Only the sentences up to this append; later appends handle their own
+        if sentence_store.is_bucketed(live):
+            doc = conversations.find_one({"_id": live["_id"]}, {"flags": 1}) or {}
+            doc["sentences"] = sentence_store.iter_sentence_docs(
+                live["_id"], sentence_store.bucket_size(live), 0, count + len(sentences), reads=sentence_store.buckets)
+        else:
+            doc = conversations.find_one({"_id": live["_id"]},
+                                         {"sentences": {"$slice": count + len(sentences)}, "flags": 1}) or {}
+        so_far = [Sentence.from_dict(s) for s in doc.get("sentences", [])]
+        everyone = list(existing) + new_participants
+        trends.add(so_far, rollups.flagged_sentence_ids(so_far, doc.get("flags", [])), live["start_time"],
+                   people=new_participants,
+                   pairs=[p for p in combinations(everyone, 2) if p[0] in new_participants or p[1] in new_participants])
+    trends.write()
+
+def close_conversation(conv_id: str):
+    """
+    Close an open conversation and store its final weighted sentiment,
+    computed from the running totals rather than by rescanning sentences.
+
+    Returns:
+        float or None: The final sentiment, or None if the conversation is unknown or already closed.
+    """
+    if not ObjectId.is_valid(conv_id):
+        return None
+    doc = conversations.find_one_and_update(
+        {"_id": ObjectId(conv_id), "open": True},
+        {"$set": {"open": False}},
+        projection={"sentiment_sum": 1, "sentiment_weight": 1, "participants": 1}
+    )
+    if not doc:
+        return None
+    weight = doc.get("sentiment_weight", 0)
+    sentiment = doc.get("sentiment_sum", 0.0) / weight if weight else 0.0
+    conversations.update_one({"_id": doc["_id"]}, {"$set": {"sentiment": sentiment}})
+    _conversations_changed(doc.get("participants", []))
+    return sentiment
+
+def delete_conversations(conv_ids: list) -> int:
+    """
+    Delete conversations and unlink them from people. Flag counters and trend
+    rollups are not adjusted; run rebuild_flag_counts and rollups.rebuild after.
+
+    Returns:
+        int: Number of conversations deleted.
+    """
+    if not conv_ids:
+        return 0
+    deleted = conversations.delete_many({"_id": {"$in": conv_ids}}).deleted_count
+    sentence_store.delete(conv_ids)
+    linked = [d["_id"] for d in people.find({"conversations": {"$in": conv_ids}}, {"_id": 1})]
+    people.update_many({"_id": {"$in": linked}}, {"$pull": {"conversations": {"$in": conv_ids}}})
+    _conversations_changed(linked)
+    return deleted
+
+def rebuild_flag_counts() -> int:
+    """
+    Recompute every person's flag counter from the Conversations collection.
+
+    Returns:
+        int: Number of people whose stored counter was wrong and got corrected.
+    """
+    totals = {
+        row["_id"]: row["total"]
+        for row in conversations.aggregate([
+            {"$unwind": "$participants"},
+            {"$group": {"_id": "$participants", "total": {"$sum": {"$size": {"$ifNull": ["$flags", []]}}}}},
+        ])
+    }
+    corrected = []
+    for p_doc in people.find({}, {"name": 1, "flag_count": 1}):
+        expected = totals.get(p_doc["_id"], 0)
+        if p_doc.get("flag_count") != expected:
+            people.update_one({"_id": p_doc["_id"]}, {"$set": {"flag_count": expected}})
+            corrected.append(p_doc.get("name"))
+    _people_changed(*corrected)
+    return len(corrected)
 
 
 def add_person(person: Person) -> bool:
@@ -116,7 +1142,9 @@ def add_person(person: Person) -> bool:
     Returns:
         Success of the addition
     """
-    people.insert_one(person.to_dict()).inserted_id is not None
+    success = people.insert_one(person.to_dict()).inserted_id is not None
+    _people_changed(person.name)
+    return success
 
 def update_person_name(person_id: str, name: str) -> bool:
     """
@@ -129,7 +1157,12 @@ def update_person_name(person_id: str, name: str) -> bool:
     Returns:
         bool: True if a document was updated, False otherwise.
     """
-    return people.update_one({"_id": ObjectId(person_id)}, {"$set": {"name": name}}).modified_count > 0
+    old = people.find_one_and_update({"_id": ObjectId(person_id)}, {"$set": {"name": name}}, projection={"name": 1})
+    updated = old is not None and old.get("name") != name
+    if updated:
+        _notify_person_changed()
+        _people_changed(old.get("name"), name)
+    return updated
 
 def update_person_role_by_id(person_id: str, role: str) -> bool:
     """
@@ -142,7 +1175,12 @@ def update_person_role_by_id(person_id: str, role: str) -> bool:
     Returns:
         bool: True if a document was updated, False otherwise.
     """
-    return people.update_one({"_id": ObjectId(person_id)}, {"$set": {"role": role}}).modified_count > 0
+    old = people.find_one_and_update({"_id": ObjectId(person_id)}, {"$set": {"role": role}}, projection={"name": 1, "role": 1})
+    updated = old is not None and old.get("role") != role
+    if updated:
+        _notify_person_changed()
+        _people_changed(old.get("name"))
+    return updated
 
 def update_person_role_by_name(name: str, role: str) -> bool:
     """
@@ -155,11 +1193,38 @@ def update_person_role_by_name(name: str, role: str) -> bool:
     Returns:
         bool: True if a document was updated, False otherwise.
     """
-    return people.update_one({"name": name}, {"$set": {"role": role}}).modified_count > 0
+    updated = people.update_one({"name": name}, {"$set": {"role": role}}).modified_count > 0
+    if updated:
+        _notify_person_changed()
+        _people_changed(name)
+    return updated
+
+def set_speaker(device: str, label: str, person_id: str) -> bool:
+    """
+    Map a diarized speaker label on a device/room to a person.
+
+    Args:
+        device (str): Device or room identifier.
+        label (str): Diarized speaker label, e.g. "Speaker 0".
+        person_id (str): The ObjectId of the person as a string.
+
+    Returns:
+        bool: True if the mapping was created or changed, False otherwise.
+    """
+    result = speakers.update_one(
+        {"device": device, "label": label},
+        {"$set": {"person": ObjectId(person_id)}},
+        upsert=True
+    )
+    changed = result.upserted_id is not None or result.modified_count > 0
+    if changed:
+        _notify_person_changed()
+    return changed
 
 def update_person_conversations_by_name(name: str, convoid: str) -> bool:
     """
-    Updates the conversations of the person specified by name by adding a new conversation ID.
+    Updates the conversations of the person specified by name by adding a new conversation ID,
+    and adds the conversation's flags to their flag counter.
 
     Args:
         name (str): The name of the person whose conversations should be updated.
@@ -168,16 +1233,15 @@ def update_person_conversations_by_name(name: str, convoid: str) -> bool:
     Returns:
         bool: True if the conversation ID was added or updated, False otherwise.
     """
-    result = people.update_one(
-        {"name": name},
-        {"$addToSet": {"conversations": ObjectId(convoid)}}
-    )
-    # $addToSet ensures we don't add duplicates
+    result = _link_person({"name": name}, convoid)
+    if result.modified_count > 0:
+        _people_changed(name)
     return result.modified_count > 0
 
 def update_person_conversations_by_id(person_id: str, convoid: str) -> bool:
     """
-    Updates the conversations of the person specified by ObjectId by adding a new conversation ID.
+    Updates the conversations of the person specified by ObjectId by adding a new conversation ID,
+    and adds the conversation's flags to their flag counter.
 
     Args:
         person_id (str): The ObjectId of the person as a string.
@@ -186,9 +1250,14 @@ def update_person_conversations_by_id(person_id: str, convoid: str) -> bool:
     Returns:
         bool: True if the conversation ID was added or updated, False otherwise.
     """
-    result = people.update_one(
-        {"_id": ObjectId(person_id)},
-        {"$addToSet": {"conversations": ObjectId(convoid)}}
-    )
-    # $addToSet ensures we don't add duplicates
+    result = _link_person({"_id": ObjectId(person_id)}, convoid)
+    if result.modified_count > 0:
+        _person_ids_changed([person_id])
     return result.modified_count > 0
+
+def _link_person(person_filter: dict, convoid: str):
+    """Link one person to a conversation and add its flags to their counter, as ingestion does."""
+    conv_id = ObjectId(convoid)
+    convo = conversations.find_one({"_id": conv_id}, {"flags": 1}) or {}
+    return people.update_one({**person_filter, "conversations": {"$ne": conv_id}},
+                             _link_update(conv_id, len(convo.get("flags", []))))
@@ -0,0 +1,169 @@
+"""
+jobs.py
+-------
+Background ingestion for /new-audio.
+
+Requests enqueue the transcript and get a job id back straight away; a pool
+of worker threads runs the parse -> score -> persist stages and records
+per-stage timings and errors on the job. The queue is bounded so a burst of
+uploads is pushed back to the client (QueueFull) instead of piling up.
+
+Jobs live in the memory of the process that accepted them.
+"""
+import os
+import queue
+import threading
+import time
+import traceback
+import uuid
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Callable, Dict, List, Optional, Tuple
+
+# Number of worker threads and maximum number of jobs waiting for one
+INGEST_WORKERS = int(os.getenv("INGEST_WORKERS", "2"))
+INGEST_QUEUE_SIZE = int(os.getenv("INGEST_QUEUE_SIZE", "32"))
+# Finished jobs kept around for /jobs/<id>
+INGEST_JOB_HISTORY = int(os.getenv("INGEST_JOB_HISTORY", "1000"))
+
+
+class QueueFull(Exception):
+    """Raised by IngestQueue.submit when no more jobs can be accepted."""
+
+
+@dataclass
+class Job:
+    """
+    State of one ingestion job.
+
+    Attributes:
+        id (str): Job identifier returned to the client.
+        status (str): 'queued', 'running', 'done' or 'failed'.
+        submitted_at (datetime): When the job was accepted.
+        started_at (Optional[datetime]): When a worker picked it up.
+        finished_at (Optional[datetime]): When it completed or failed.
+        stages (Dict[str, float]): Seconds spent in each completed stage, in order.
+        result (Optional[str]): Id of the stored conversation once done.
+        error (Optional[str]): Error message if the job failed.
+    """
+    id: str = field(default_factory=lambda: uuid.uuid4().hex)
+    status: str = "queued"
+    submitted_at: datetime = field(default_factory=datetime.now)
+    started_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
+    stages: Dict[str, float] = field(default_factory=dict)
+    result: Optional[str] = None
+    error: Optional[str] = None
+
+    def to_dict(self) -> dict:
+        """Return a JSON-serializable dict of the job."""
+        return {
+            "id": self.id,
+            "status": self.status,
+            "submitted_at": self.submitted_at.isoformat(),
+            "started_at": self.started_at.isoformat() if self.started_at else None,
+            "finished_at": self.finished_at.isoformat() if self.finished_at else None,
+            "stages": dict(self.stages),
+            "result": self.result,
+            "error": self.error,
+        }
+
+
+# A stage takes the previous stage's output and returns its own
+Stage = Tuple[str, Callable]
+
+
+class IngestQueue:
+    """
+    Bounded job queue with a pool of worker threads.
+
+    Each job runs its payload through stages in order; the output of the last
+    stage is stored as Job.result. Workers start on the first submit.
+    """
+
+    def __init__(self, stages: List[Stage], workers: int = INGEST_WORKERS,
+                 maxsize: int = INGEST_QUEUE_SIZE, history: int = INGEST_JOB_HISTORY):
+        self.stages = stages
+        self.workers = workers
+        self.history = history
+        self._queue = queue.Queue(maxsize=maxsize)
+        self._jobs = OrderedDict()
+        self._keys: Dict[str, str] = {}  # dedup key -> id of the latest job submitted with it
+        self._lock = threading.Lock()
+        self._threads = []
+
+    def submit(self, payload, key: str = None) -> Job:
+        """
+        Enqueue a payload for ingestion. With a key, a payload submitted again while
+        an earlier job with the same key is known (and hasn't failed) returns that job.
+
+        Raises:
+            QueueFull: If the queue is at capacity.
+        """
+        self._start()
+        with self._lock:
+            earlier = self._jobs.get(self._keys.get(key)) if key else None
+            if earlier and earlier.status != "failed":
+                return earlier
+            job = Job()
+            self._jobs[job.id] = job
+            if key:
+                self._keys[key] = job.id
+            self._trim()
+        try:
+            self._queue.put_nowait((job, payload))
+        except queue.Full:
+            with self._lock:
+                del self._jobs[job.id]
+                if key:
+                    self._keys.pop(key, None)
+            raise QueueFull(f"Ingestion queue is full ({self._queue.maxsize} jobs waiting)")
+        return job
+
+    def get(self, job_id: str) -> Optional[Job]:
+        """Return the job with this id, or None if unknown or expired."""
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def pending(self) -> int:
+        """Number of jobs waiting for a worker."""
+        return self._queue.qsize()
+
+    def _start(self):
+        with self._lock:
+            if self._threads:
+                return
+            for i in range(self.workers):
+                t = threading.Thread(target=self._work, name=f"ingest-{i}", daemon=True)
+                t.start()
+                self._threads.append(t)
+
+    def _trim(self):
+        # Forget the oldest finished jobs beyond the history limit
+        finished = [j.id for j in self._jobs.values() if j.status in ("done", "failed")]
+        for job_id in finished[:max(len(self._jobs) - self.history, 0)]:
+            del self._jobs[job_id]
+        if len(self._keys) > len(self._jobs):
+            self._keys = {k: j for k, j in self._keys.items() if j in self._jobs}
+
+    def _work(self):
+        while True:
+            job, value = self._queue.get()
+            job.status = "running"
+            job.started_at = datetime.now()
+            stage_name = None
+            try:
+                for stage_name, fn in self.stages:
+                    start = time.perf_counter()
+                    value = fn(value)
+                    job.stages[stage_name] = time.perf_counter() - start
+                job.result = None if value is None else str(value)
+                job.status = "done"
+            except Exception as e:
+                job.error = f"{stage_name}: {e}"
+                job.status = "failed"
+                traceback.print_exc()
+            finally:
+                job.finished_at = datetime.now()
+                self._queue.task_done()
@@ -0,0 +1,110 @@
+"""
+live.py
+-------
+Incremental ingestion for conversations that are still being recorded.
+
+A conversation is opened once, transcript segments are scored on arrival and
+appended with $push (see handle_data.append_sentences), and closing it
+finalizes the weighted sentiment from running totals.
+"""
+from datetime import datetime, timedelta
+from typing import List, Optional
+
+from bson import ObjectId
+
+import handle_data
+from events import publish_flags
+from flag_rules import get_engine as get_flag_rules
+from metrics import stage
+from models import Sentence
+from parse import iter_sentences, resolve_speakers_rnbrad, score_sentences
+from sentiment import weighted_compound
+from speakers import DEFAULT_DEVICE, registry as speaker_registry
+
+# Appends that lose the race against a concurrent append are retried this many times
+MAX_APPEND_RETRIES = 5
+
+
+class ConversationNotOpen(Exception):
+    """Raised when appending to a conversation that is unknown or already closed."""
+
+
+def open_live_conversation(device: str = DEFAULT_DEVICE, start_time: datetime = None) -> str:
+    """Open a conversation for a device and return its id as a string."""
+    return str(handle_data.open_conversation(start_time or datetime.now(), device))
+
+
+def segments_to_sentences(segments: List[dict], speaker_map: dict, start_time: datetime) -> List[Sentence]:
+    """
+    Build unscored sentences from JSON segments:
+    {"speaker": "Speaker 0", "text": "...", "start": 12.5, "end": 14.0}
+    where start/end are seconds from the start of the conversation.
+    """
+    sentences = []
+    for seg in segments:
+        start, end = float(seg["start"]), float(seg["end"])
+        sentences.append(Sentence(
+            speaker=speaker_map.get(seg.get("speaker"), ObjectId()),
+            text=str(seg.get("text", "")),
+            sentiment={},
+            start_time=start_time + timedelta(seconds=start),
+            total_time=end - start
+        ))
+    return sentences
+
+
+def append_segments(conv_id: str, segments: List[dict] = None, srt_text: str = None) -> dict:
+    """
+    Score and append transcript segments (JSON segments or an SRT snippet) to an open conversation.
+
+    Returns:
+        dict: {"appended", "flags", "sentence_count"} for this call.
+
+    Raises:
+        ConversationNotOpen: If the conversation is unknown or closed.
+        ValueError: If a segment is malformed.
+    """
+    live = handle_data.get_open_conversation(conv_id)
+    if not live:
+        raise ConversationNotOpen(conv_id)
+
+    device = live.get("device", DEFAULT_DEVICE)
+    speaker_map = resolve_speakers_rnbrad(device)
+    try:
+        with stage("parse"):
+            if srt_text is not None:
+                sentences = list(iter_sentences(srt_text, speaker_map, live["start_time"], score=False))
+            else:
+                sentences = segments_to_sentences(segments or [], speaker_map, live["start_time"])
+    except (KeyError, TypeError, ValueError) as e:
+        raise ValueError(f"Malformed segment: {e}") from e
+    if not sentences:
+        return {"appended": 0, "flags": 0, "sentence_count": live.get("sentence_count", 0)}
+
+    roles = speaker_registry.roles(device)
+    window = timedelta(seconds=get_flag_rules().max_window)
+    known = set(speaker_map.values())
+    participants = [p for p in dict.fromkeys(s.speaker for s in sentences) if p in known]
+    total_time = max((s.start_time - live["start_time"]).total_seconds() + s.total_time for s in sentences)
+
+    for _ in range(MAX_APPEND_RETRIES):
+        count = live.get("sentence_count", 0)
+        # Window rules need the stored sentences just before this batch; scores are
+        # cached per text, so re-running this after a lost race is cheap
+        history = handle_data.get_recent_sentences(live["_id"], sentences[0].start_time - window) if window else []
+        flags = score_sentences(sentences, roles, history)
+        sentiment_sum, sentiment_weight = weighted_compound(sentences)
+        if handle_data.append_sentences(live, sentences, flags, participants,
+                                        sentiment_sum, sentiment_weight, total_time):
+            everyone = list(dict.fromkeys(list(live.get("participants", [])) + participants))
+            publish_flags(live["_id"], sentences, flags, everyone, first_index=count)
+            return {"appended": len(sentences), "flags": len(flags), "sentence_count": count + len(sentences)}
+        live = handle_data.get_open_conversation(conv_id)
+        if not live:
+            raise ConversationNotOpen(conv_id)
+    raise RuntimeError(f"Could not append to conversation '{conv_id}' after {MAX_APPEND_RETRIES} attempts")
+
+
+def close_live_conversation(conv_id: str) -> Optional[float]:
+    """Close a conversation and return its final sentiment (None if unknown or already closed)."""
+    return handle_data.close_conversation(conv_id)
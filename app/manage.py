@@ -0,0 +1,333 @@
+"""
+manage.py
+---------
+Maintenance commands for the ElderGuardian database.
+
+Usage (from the app directory):
+    python manage.py rebuild-flags
+    python manage.py rebuild-rollups
+    python manage.py reflag
+    python manage.py dedup [--dry-run]
+    python manage.py migrate-sentences --to {bucketed,embedded} [--dry-run]
+    python manage.py ingest-dir <directory> [--batch-size N] [--workers N] [--device D]
+    python manage.py ingest-audio <recording> [--backend B] [--chunk-seconds S] [--device D] [--no-audio]
+    python manage.py set-speaker <device> <label> <person name>
+"""
+import argparse
+import hashlib
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from pathlib import Path
+
+import handle_data
+
+
+def rebuild_flags(args):
+    corrected = handle_data.rebuild_flag_counts()
+    print(f"Flag counters rebuilt ({corrected} corrected)")
+
+
+def rebuild_rollups(args):
+    import rollups
+    from cache import versions
+
+    start = time.perf_counter()
+    processed = rollups.rebuild(handle_data.iter_conversation_docs())
+    # /trends responses are cached per person
+    versions.bump(*(f"person:{p['name']}" for p in handle_data.people.find({}, {"name": 1})))
+    print(f"Trend rollups rebuilt from {processed} conversations in {time.perf_counter() - start:.2f}s")
+
+
+def reflag(args):
+    import sentence_store
+    from cache import versions
+    from flag_rules import get_engine
+    from models import Sentence
+    from speakers import registry as speaker_registry
+
+    engine = get_engine()
+    start = time.perf_counter()
+    changed = 0
+    for doc in handle_data.iter_conversation_docs({}, {"sentences": 1, "flags": 1, "device": 1}):
+        sentences = [Sentence.from_dict(s) for s in doc.get("sentences", [])]
+        before = [s.get("flag_rules", []) for s in doc.get("sentences", [])]
+        flags = engine.evaluate(sentences, speaker_registry.roles(doc.get("device", "default")))
+        if flags == doc.get("flags", []) and before == [s.flag_rules for s in sentences]:
+            continue
+        if sentence_store.is_bucketed(doc):
+            sentence_store.set_sentence_fields(doc["_id"], sentence_store.bucket_size(doc),
+                                               {i: {"flag_rules": s.flag_rules} for i, s in enumerate(sentences)})
+            handle_data.conversations.update_one({"_id": doc["_id"]}, {"$set": {"flags": flags}})
+        else:
+            handle_data.conversations.update_one({"_id": doc["_id"]}, {"$set": {
+                "flags": flags,
+                **{f"sentences.{i}.flag_rules": s.flag_rules for i, s in enumerate(sentences)},
+            }})
+        changed += 1
+    print(f"Re-flagged {changed} conversations in {time.perf_counter() - start:.2f}s")
+    if changed:
+        versions.bump("conversations")
+    rebuild_flags(args)
+    rebuild_rollups(args)
+
+
+def dedup(args):
+    from models import Sentence
+    from parse import transcript_hash
+
+    start = time.perf_counter()
+    keep = {}        # content hash -> id of the oldest conversation with it
+    duplicates = []
+    missing = {}     # id -> hash, for kept conversations stored before hashing existed
+    query = {"open": {"$ne": True}}
+    projection = {"content_hash": 1, "sentences.text": 1, "sentences.start_time": 1, "sentences.total_time": 1}
+    for doc in handle_data.iter_conversation_docs(query, projection):
+        content_hash = doc.get("content_hash") or transcript_hash(Sentence.from_dict(s) for s in doc.get("sentences", []))
+        if content_hash is None:
+            continue
+        if content_hash in keep:
+            duplicates.append(doc["_id"])
+            continue
+        keep[content_hash] = doc["_id"]
+        if not doc.get("content_hash"):
+            missing[doc["_id"]] = content_hash
+
+    print(f"{len(duplicates)} duplicate conversations, {len(missing)} kept conversations to hash "
+          f"({time.perf_counter() - start:.2f}s)")
+    if args.dry_run or not (duplicates or missing):
+        return
+    # Duplicates go first so the hashes of the kept copies are unique
+    deleted = handle_data.delete_conversations(duplicates)
+    for conv_id, content_hash in missing.items():
+        handle_data.conversations.update_one({"_id": conv_id}, {"$set": {"content_hash": content_hash}})
+    handle_data.ensure_indexes()
+    print(f"Deleted {deleted} duplicates")
+    if deleted:
+        rebuild_flags(args)
+        rebuild_rollups(args)
+
+
+def migrate_sentences(args):
+    """
+    Move closed conversations to the given sentence layout (see sentence_store.py).
+    Open conversations are skipped; run it again after they close. Interrupted runs
+    can simply be repeated: a conversation's document only switches layout after
+    its sentences have been written in the new one.
+    """
+    import sentence_store
+    from cache import versions
+    from pymongo.errors import DocumentTooLarge, WriteError
+
+    to_buckets = args.to == sentence_store.BUCKETED
+    query = {"open": {"$ne": True},
+             "sentence_layout": {"$ne": sentence_store.BUCKETED} if to_buckets else sentence_store.BUCKETED}
+    start = time.perf_counter()
+    moved, sentences, skipped = 0, 0, []
+    for doc in handle_data.iter_conversation_docs(query, {"sentences": 1}):
+        if args.dry_run:
+            moved += 1
+            sentences += len(doc["sentences"])
+            continue
+        conv_id = doc["_id"]
+        if to_buckets:
+            # Leftovers of an interrupted run would otherwise be appended to
+            sentence_store.delete([conv_id])
+            size = sentence_store.SENTENCE_BUCKET_SIZE
+            sentence_store.write_many({conv_id: (doc["sentences"], size)})
+            update = {"$set": {"sentence_layout": sentence_store.BUCKETED, "bucket_size": size,
+                               "sentence_count": len(doc["sentences"])},
+                      "$unset": {"sentences": ""}}
+        else:
+            update = {"$set": {"sentences": doc["sentences"]},
+                      "$unset": {"sentence_layout": "", "bucket_size": "", "sentence_count": ""}}
+        try:
+            handle_data.conversations.update_one({"_id": conv_id, "sentence_layout": query["sentence_layout"]}, update)
+        except (DocumentTooLarge, WriteError):
+            skipped.append(conv_id)  # too long to embed (16 MB); stays bucketed
+            continue
+        if not to_buckets:
+            sentence_store.delete([conv_id])
+        moved += 1
+        sentences += len(doc["sentences"])
+
+    verb = "Would move" if args.dry_run else "Moved"
+    print(f"{verb} {moved} conversations ({sentences} sentences) to the {args.to} layout "
+          f"in {time.perf_counter() - start:.2f}s")
+    if skipped:
+        print(f"{len(skipped)} conversations could not be embedded: " + ", ".join(str(c) for c in skipped))
+    if moved and not args.dry_run:
+        versions.bump("conversations")
+
+
+def set_speaker(args):
+    person = handle_data.get_person_by_name(args.name)
+    if not person:
+        raise SystemExit(f"Person '{args.name}' not found")
+    handle_data.set_speaker(args.device, args.label, person["_id"])
+    print(f"{args.device}: {args.label} -> {args.name}")
+
+
+def _parse_srt_file(task):
+    """
+    Parse and score one SRT file (runs in a worker process).
+    Returns (conversation, content hash); conversation is None if the transcript is already stored.
+    """
+    from parse import parse_conversation, score_conversation, srt_hash
+
+    path, speaker_map, roles = task
+    # Back-filled recordings have no other start time than the file's own timestamp
+    recording_start = datetime.fromtimestamp(os.path.getmtime(path))
+    with open(path, encoding="utf-8") as f:
+        content_hash = srt_hash(f)
+        if handle_data.find_duplicate_conversation(content_hash):
+            return None, content_hash
+        f.seek(0)
+        return score_conversation(parse_conversation(f, speaker_map, recording_start), roles), content_hash
+
+
+def ingest_dir(args):
+    from parse import resolve_speakers_rnbrad
+    from speakers import registry as speaker_registry
+
+    paths = sorted(Path(args.directory).glob(args.pattern))
+    if not paths:
+        print(f"No files matching {args.pattern} in {args.directory}")
+        return
+
+    speaker_map = resolve_speakers_rnbrad(args.device)
+    roles = speaker_registry.roles(args.device)
+    counts = {"sentences": 0, "duplicates": 0}
+    content_hashes = {}
+
+    def counted(results):
+        for convo, content_hash in results:
+            if convo is None:
+                counts["duplicates"] += 1
+                continue
+            counts["sentences"] += len(convo.sentences)
+            content_hashes[convo._id] = content_hash
+            yield convo
+
+    start = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=args.workers) as pool:
+        results = pool.map(_parse_srt_file, [(str(p), speaker_map, roles) for p in paths], chunksize=args.chunksize)
+        inserted = handle_data.bulk_store_conversations(counted(results), batch_size=args.batch_size,
+                                                        content_hashes=content_hashes)
+    elapsed = time.perf_counter() - start
+
+    print(f"Ingested {inserted}/{len(paths)} conversations ({counts['sentences']} sentences) in {elapsed:.2f}s")
+    print(f"  {inserted / elapsed:.1f} conversations/s, {counts['sentences'] / elapsed:.1f} sentences/s")
+    if counts["duplicates"]:
+        print(f"  {counts['duplicates']} already stored, skipped")
+
+
+def _file_hash(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def ingest_audio(args):
+    import audio
+    import audio_store
+    from parse import resolve_speakers_rnbrad
+    from speakers import registry as speaker_registry
+
+    # Recordings are deduplicated on the bytes of the file, before any decoding
+    content_hash = "audio:" + _file_hash(args.recording)
+    existing = handle_data.find_duplicate_conversation(content_hash)
+    if existing:
+        print(f"Already stored as conversation {existing}")
+        return
+
+    name = args.backend or audio.AUDIO_BACKEND
+    backend = audio.get_backend(name, **({"realtime_factor": args.fake_rtf} if name == "fake" else {}))
+    pipeline = audio.AudioPipeline(
+        backend,
+        chunk_seconds=args.chunk_seconds or audio.AUDIO_CHUNK_SECONDS,
+        queue_size=args.queue_size or audio.AUDIO_QUEUE_SIZE,
+        transcribe_workers=args.workers or audio.AUDIO_TRANSCRIBE_WORKERS,
+        store=None if args.no_audio or args.dry_run else audio_store.store,
+    )
+    # Without --start, the recording is assumed to have started when the file was written
+    recording_start = (datetime.fromisoformat(args.start) if args.start
+                       else datetime.fromtimestamp(os.path.getmtime(args.recording)))
+    conversation = pipeline.run(args.recording, resolve_speakers_rnbrad(args.device), recording_start,
+                                speaker_registry.roles(args.device))
+
+    stats = pipeline.stats
+    print(f"Transcribed {stats['audio_seconds']:.1f}s of audio in {stats['chunks']} chunks "
+          f"in {stats['elapsed']:.2f}s ({stats['audio_seconds'] / max(stats['elapsed'], 1e-9):.1f}x realtime)")
+    print("  busy: " + ", ".join(f"{name} {seconds:.2f}s" for name, seconds in stats["stages"].items()))
+    print(f"  {len(conversation.sentences)} sentences, {len(conversation.flags)} flagged")
+    if stats["recording"]:
+        print(f"  audio stored as recording {stats['recording']}")
+    if args.dry_run:
+        return
+    if not handle_data.store_conversation(conversation, content_hash):
+        raise SystemExit("Error storing the conversation")
+    print(f"Stored conversation {conversation._id}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="ElderGuardian maintenance commands")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    rebuild = commands.add_parser("rebuild-flags", help="recompute every person's flag counter from scratch")
+    rebuild.set_defaults(func=rebuild_flags)
+
+    trends = commands.add_parser("rebuild-rollups", help="recompute the daily/weekly trend rollups from scratch")
+    trends.set_defaults(func=rebuild_rollups)
+
+    reflag_cmd = commands.add_parser("reflag", help="re-run the flag rules over every stored conversation")
+    reflag_cmd.set_defaults(func=reflag)
+
+    ingest = commands.add_parser("ingest-dir", help="bulk-ingest a directory of SRT transcripts")
+    ingest.add_argument("directory")
+    ingest.add_argument("--pattern", default="*.srt", help="glob for transcript files (default: *.srt)")
+    ingest.add_argument("--batch-size", type=int, default=500, help="conversations per insert_many")
+    ingest.add_argument("--workers", type=int, default=os.cpu_count(), help="parse/score processes")
+    ingest.add_argument("--chunksize", type=int, default=8, help="files handed to a worker at a time")
+    ingest.add_argument("--device", default="default", help="device whose speaker mapping to use")
+    ingest.set_defaults(func=ingest_dir)
+
+    recording = commands.add_parser("ingest-audio", help="transcribe, score and store an audio recording")
+    recording.add_argument("recording")
+    recording.add_argument("--backend", default=None, help="transcription backend: fake, whisper or diarize "
+                                                          "(default: AUDIO_BACKEND)")
+    recording.add_argument("--chunk-seconds", type=float, default=None, help="length of the decoded chunks")
+    recording.add_argument("--queue-size", type=int, default=None, help="chunks buffered between stages")
+    recording.add_argument("--workers", type=int, default=None, help="transcription threads")
+    recording.add_argument("--fake-rtf", type=float, default=0.0,
+                           help="fake backend: simulated seconds of work per second of audio")
+    recording.add_argument("--start", help="ISO start time of the recording (default: file modification time)")
+    recording.add_argument("--device", default="default", help="device whose speaker mapping to use")
+    recording.add_argument("--no-audio", action="store_true", help="don't keep the audio for playback")
+    recording.add_argument("--dry-run", action="store_true", help="print the results without storing them")
+    recording.set_defaults(func=ingest_audio)
+
+    dedup_cmd = commands.add_parser("dedup", help="delete duplicate conversations and hash the rest")
+    dedup_cmd.add_argument("--dry-run", action="store_true", help="only count the duplicates")
+    dedup_cmd.set_defaults(func=dedup)
+
+    migrate = commands.add_parser("migrate-sentences", help="move stored sentences to another storage layout")
+    migrate.add_argument("--to", required=True, choices=["bucketed", "embedded"])
+    migrate.add_argument("--dry-run", action="store_true", help="only count the conversations to move")
+    migrate.set_defaults(func=migrate_sentences)
+
+    speaker = commands.add_parser("set-speaker", help="map a device's diarized speaker label to a person")
+    speaker.add_argument("device")
+    speaker.add_argument("label", help='diarized label, e.g. "Speaker 0"')
+    speaker.add_argument("name", help="name of the person")
+    speaker.set_defaults(func=set_speaker)
+
+    args = parser.parse_args(argv)
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,290 @@
+"""
+metrics.py
+----------
+Request and stage latency metrics, published in Prometheus text format by /metrics.
+
+Stages ("parse", "sentiment", "db_read", "db_write", "serialize", "encode",
+and "decode"/"transcribe"/"score" in the audio pipeline)
+are timed with stage(). Inside a request the time of each stage is summed
+and observed once when the request ends, so per-document timers cost a
+couple of perf_counter() calls and a dict update. Stage spans outside a
+request (ingest workers, CLI) are observed one by one.
+
+MongoDB time comes from a pymongo CommandListener (see db.client_options),
+so it covers the server round trip of every command, getMore included.
+mongomock does not emit command events.
+
+Requests slower than SLOW_REQUEST_MS are logged with their stage breakdown.
+"""
+import bisect
+import os
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Callable, Dict, Iterable, Optional, Tuple
+
+from pymongo.monitoring import CommandListener
+
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "1") == "1"
+# Requests taking longer than this are logged with a stage breakdown (0 = off)
+SLOW_REQUEST_MS = float(os.getenv("SLOW_REQUEST_MS", "500"))
+
+REQUEST_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+STAGE_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+
+def _labels(names: Tuple[str, ...], values: tuple) -> str:
+    if not names:
+        return ""
+    pairs = []
+    for name, value in zip(names, values):
+        value = str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+        pairs.append(f'{name}="{value}"')
+    return "{" + ",".join(pairs) + "}"
+
+
+class Counter:
+    """Monotonic counter with labels."""
+
+    def __init__(self, name: str, help: str, labelnames: Iterable[str] = ()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._values: Dict[tuple, float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *labels, amount: float = 1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def render(self) -> list:
+        with self._lock:
+            items = sorted(self._values.items())
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        lines += [f"{self.name}{_labels(self.labelnames, k)} {v}" for k, v in items]
+        return lines
+
+
+class Histogram:
+    """Cumulative-bucket histogram with labels."""
+
+    def __init__(self, name: str, help: str, labelnames: Iterable[str] = (), buckets=REQUEST_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        self._series: Dict[tuple, list] = {}  # labels -> [bucket counts..., +Inf count, sum]
+        self._lock = threading.Lock()
+
+    def observe(self, seconds: float, *labels):
+        i = bisect.bisect_left(self.buckets, seconds)
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [0] * (len(self.buckets) + 1) + [0.0]
+            series[i] += 1
+            series[-1] += seconds
+
+    def render(self) -> list:
+        with self._lock:
+            items = sorted((k, list(v)) for k, v in self._series.items())
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        names = self.labelnames + ("le",)
+        for labels, series in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets + ("+Inf",), series):
+                cumulative += count
+                lines.append(f"{self.name}_bucket{_labels(names, labels + (bound,))} {cumulative}")
+            lines.append(f"{self.name}_sum{_labels(self.labelnames, labels)} {series[-1]}")
+            lines.append(f"{self.name}_count{_labels(self.labelnames, labels)} {cumulative}")
+        return lines
+
+
+class Registry:
+    """Metrics plus gauge callbacks rendered together by /metrics."""
+
+    def __init__(self):
+        self.metrics = []
+        self.callbacks = []  # (name, help, type, callback returning {labels tuple: value}, labelnames)
+
+    def counter(self, *args, **kwargs) -> Counter:
+        metric = Counter(*args, **kwargs)
+        self.metrics.append(metric)
+        return metric
+
+    def histogram(self, *args, **kwargs) -> Histogram:
+        metric = Histogram(*args, **kwargs)
+        self.metrics.append(metric)
+        return metric
+
+    def gauge(self, name: str, help: str, callback: Callable[[], dict], labelnames: Iterable[str] = (),
+              type: str = "gauge"):
+        """
+        Register a metric whose values are read from callback() at scrape time,
+        for numbers that are already tracked elsewhere (type may be "counter").
+        """
+        self.callbacks.append((name, help, type, callback, tuple(labelnames)))
+
+    def render(self) -> str:
+        lines = []
+        for metric in self.metrics:
+            lines += metric.render()
+        for name, help, type, callback, labelnames in self.callbacks:
+            lines += [f"# HELP {name} {help}", f"# TYPE {name} {type}"]
+            lines += [f"{name}{_labels(labelnames, k)} {v}" for k, v in sorted(callback().items())]
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+requests_total = registry.counter(
+    "elderguardian_http_requests_total", "HTTP requests handled.", ("method", "endpoint", "status"))
+request_seconds = registry.histogram(
+    "elderguardian_http_request_duration_seconds", "Time to produce a response.", ("method", "endpoint"))
+slow_requests_total = registry.counter(
+    "elderguardian_http_slow_requests_total", "Requests slower than SLOW_REQUEST_MS.", ("method", "endpoint"))
+stage_seconds = registry.histogram(
+    "elderguardian_stage_duration_seconds",
+    "Time per stage: summed per request inside a request, per span otherwise.", ("stage",), STAGE_BUCKETS)
+db_commands_total = registry.counter(
+    "elderguardian_mongo_commands_total", "MongoDB commands sent.", ("command", "outcome"))
+
+# Stage totals of the request being handled by the current thread/task (None outside requests)
+_request_stages: ContextVar[Optional[Dict[str, float]]] = ContextVar("request_stages", default=None)
+
+
+def record(stage_name: str, seconds: float):
+    """Add seconds to a stage of the current request, or observe it directly outside requests."""
+    if not METRICS_ENABLED:
+        return
+    stages = _request_stages.get()
+    if stages is None:
+        stage_seconds.observe(seconds, stage_name)
+    else:
+        stages[stage_name] = stages.get(stage_name, 0.0) + seconds
+
+
+@contextmanager
+def stage(stage_name: str):
+    """Time the enclosed block as stage_name."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record(stage_name, time.perf_counter() - start)
+
+
+def timed(stage_name: str, fn: Callable) -> Callable:
+    """Wrap fn so every call is timed as stage_name (for per-document callables)."""
+    if not METRICS_ENABLED:
+        return fn
+
+    def wrapper(*args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            record(stage_name, time.perf_counter() - start)
+    return wrapper
+
+
+# -----------------------------
+# MongoDB command timing
+# -----------------------------
+WRITE_COMMANDS = {"insert", "update", "delete", "findAndModify", "bulkWrite", "createIndexes", "dropIndexes", "drop", "create"}
+
+
+class CommandTimer(CommandListener):
+    """Attributes the server time of each MongoDB command to the db_read or db_write stage."""
+
+    def started(self, event):
+        pass
+
+    def _done(self, event, outcome: str):
+        name = event.command_name
+        db_commands_total.inc(name, outcome)
+        record("db_write" if name in WRITE_COMMANDS else "db_read", event.duration_micros / 1e6)
+
+    def succeeded(self, event):
+        self._done(event, "ok")
+
+    def failed(self, event):
+        self._done(event, "error")
+
+
+command_timer = CommandTimer()
+
+
+# -----------------------------
+# Flask (and Quart) integration
+# -----------------------------
+# The hook bodies take the framework's g and request, so the Quart app
+# (init_async_app) installs the same ones as coroutines.
+def _start_timer(g):
+    g.metrics_start = time.perf_counter()
+    g.metrics_token = _request_stages.set({})
+
+
+def _observe(app, g, request, response):
+    start = g.pop("metrics_start", None)
+    if start is None:
+        return response
+    elapsed = time.perf_counter() - start
+    stages = _request_stages.get() or {}
+    endpoint = request.url_rule.rule if request.url_rule else "unmatched"
+
+    request_seconds.observe(elapsed, request.method, endpoint)
+    requests_total.inc(request.method, endpoint, str(response.status_code))
+    for name, seconds in stages.items():
+        stage_seconds.observe(seconds, name)
+
+    if SLOW_REQUEST_MS and elapsed * 1000 >= SLOW_REQUEST_MS:
+        slow_requests_total.inc(request.method, endpoint)
+        breakdown = ", ".join(f"{name} {s * 1000:.1f}ms" for name, s in sorted(stages.items(), key=lambda x: -x[1]))
+        app.logger.warning("Slow request: %s %s %d in %.1fms (%s)", request.method, request.full_path.rstrip("?"),
+                           response.status_code, elapsed * 1000, breakdown or "no stages recorded")
+    return response
+
+
+def _reset(g):
+    token = g.pop("metrics_token", None)
+    if token is not None:
+        try:
+            _request_stages.reset(token)
+        except ValueError:  # torn down in another context (e.g. after a streamed response)
+            _request_stages.set(None)
+
+
+def init_app(app):
+    """Install the request-timing hooks on a Flask app."""
+    if not METRICS_ENABLED:
+        return
+    from flask import g, request
+
+    app.before_request(lambda: _start_timer(g))
+    app.after_request(lambda response: _observe(app, g, request, response))
+    app.teardown_request(lambda exc: _reset(g))
+
+
+def init_async_app(app):
+    """
+    Install the request-timing hooks on a Quart app. They are coroutines so they
+    run in the request's task (Quart runs sync hooks in a thread), where the
+    stage totals of the request live.
+    """
+    if not METRICS_ENABLED:
+        return
+    from quart import g, request
+
+    @app.before_request
+    async def _start_timer_async():
+        _start_timer(g)
+
+    @app.after_request
+    async def _observe_async(response):
+        return _observe(app, g, request, response)
+
+    @app.teardown_request
+    async def _reset_async(exc):
+        _reset(g)
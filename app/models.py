@@ -1,5 +1,5 @@
 from dataclasses import dataclass, field
-from typing import List, Optional
+from typing import List, Optional, Sequence
 from bson import ObjectId
 from datetime import datetime
 
@@ -17,14 +17,20 @@ class Sentence:
         text (str): The text content of the sentence.
         sentiment (str): Sentiment label of the sentence (e.g., 'positive', 'negative').
         start_time (Optional[datetime]): Timestamp when the sentence started.
-        total_time (int): Duration of the sentence in seconds.
+        total_time (float): Duration of the sentence in seconds.
+        flag_rules (List[str]): Names of the flag rules that fired on the sentence (empty if not flagged).
+        audio_ref (Optional[str]): Id of the stored recording the sentence was transcribed from (see audio_store.py).
+        audio_offset (Optional[float]): Seconds from the start of that recording to the start of the sentence.
         _id (ObjectId): Unique identifier for the sentence.
     """
     speaker: ObjectId
     text: str
     sentiment: str
     start_time: Optional[datetime] = None
-    total_time: int = 0
+    total_time: float = 0
+    flag_rules: List[str] = field(default_factory=list)
+    audio_ref: Optional[str] = None
+    audio_offset: Optional[float] = None
     _id: ObjectId = field(default_factory=ObjectId)
 
     @classmethod
@@ -44,7 +50,10 @@ class Sentence:
             text=data.get("text", ""),
             sentiment=data.get("sentiment", ""),
             start_time=data.get("start_time"),
-            total_time=data.get("total_time", 0)
+            total_time=data.get("total_time", 0),
+            flag_rules=data.get("flag_rules", []),
+            audio_ref=data.get("audio_ref"),
+            audio_offset=data.get("audio_offset")
         )
 
     def to_dict(self) -> dict:
@@ -60,7 +69,10 @@ class Sentence:
             "text": self.text,
             "sentiment": self.sentiment,
             "start_time": self.start_time,
-            "total_time": self.total_time
+            "total_time": self.total_time,
+            "flag_rules": self.flag_rules,
+            "audio_ref": self.audio_ref,
+            "audio_offset": self.audio_offset
         }
 
 
@@ -75,27 +87,30 @@ class Conversation:
     Attributes:
         participants (List[ObjectId]): List of Person._id participating in the conversation.
         start_time (datetime): Timestamp when the conversation started.
-        total_time (int): Duration of the conversation in seconds.
-        sentences (List[Sentence]): List of Sentence objects in the conversation.
+        total_time (float): Duration of the conversation in seconds.
+        sentences (List[Sentence]): List of Sentence objects in the conversation (a lazily
+            loaded, read-only sequence for bucketed conversations, see sentence_store.py).
         flags (List[ObjectId]): List of sentence IDs that were flagged.
         sentiment (str): Overall sentiment of the conversation.
         _id (ObjectId): Unique identifier for the conversation.
     """
     participants: List[ObjectId]
     start_time: datetime
-    total_time: int = 0
+    total_time: float = 0
     sentences: List[Sentence] = field(default_factory=list)
     flags: List[ObjectId] = field(default_factory=list)
     sentiment: str = ""
     _id: ObjectId = field(default_factory=ObjectId)
 
     @classmethod
-    def from_dict(cls, data: dict) -> "Conversation":
+    def from_dict(cls, data: dict, sentences: Sequence[Sentence] = None) -> "Conversation":
         """
         Creates a Conversation object from a MongoDB document.
 
         Args:
             data (dict): MongoDB document representing a conversation.
+            sentences (Sequence[Sentence]): Sentences to use instead of the document's own
+                (for conversations whose sentences are stored separately).
 
         Returns:
             Conversation: A Python Conversation object.
@@ -105,7 +120,7 @@ class Conversation:
             start_time=data.get("start_time"),
             total_time=data.get("total_time", 0),
             participants=data.get("participants", []),
-            sentences=[Sentence.from_dict(s) for s in data.get("sentences", [])],
+            sentences=sentences if sentences is not None else [Sentence.from_dict(s) for s in data.get("sentences", [])],
             flags=data.get("flags", []),
             sentiment=data.get("sentiment", "")
         )
@@ -140,11 +155,13 @@ class Person:
         name (str): Name of the person.
         role (str): Role of the person (e.g., 'Elder', 'Caregiver').
         conversations (List[ObjectId]): List of Conversation._id the person participates in.
+        flag_count (int): Running total of flags across the person's conversations.
         _id (ObjectId): Unique identifier for the person.
     """
     name: str
     role: str
     conversations: List[ObjectId] = field(default_factory=list)
+    flag_count: int = 0
     _id: ObjectId = field(default_factory=ObjectId)
 
     @classmethod
@@ -162,7 +179,8 @@ class Person:
             _id=data.get("_id", ObjectId()),
             name=data.get("name", ""),
             role=data.get("role", ""),
-            conversations=data.get("conversations", [])
+            conversations=data.get("conversations", []),
+            flag_count=data.get("flag_count", 0)
         )
 
     def to_dict(self) -> dict:
@@ -176,5 +194,6 @@ class Person:
             "_id": self._id,
             "name": self.name,
             "role": self.role,
-            "conversations": self.conversations
+            "conversations": self.conversations,
+            "flag_count": self.flag_count
         }
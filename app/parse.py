@@ -1,85 +1,199 @@
+import hashlib
 import re
-from datetime import datetime
+from datetime import datetime, timedelta
+from typing import Iterable, Iterator, List, NamedTuple, Optional, TextIO, Union
 
 from bson import ObjectId
-from handle_data import Person, Conversation, Sentence, people
-from sentiment import analyze_sentiment, analyze_conversation
-def parse_srt_time(time_str: str) -> datetime:
-    """Parse SRT time format 'HH:MM:SS,ms' into a datetime object."""
-    h, m, s_ms = time_str.split(":")
-    s, ms = s_ms.split(",")
-    return datetime.now()
-
-def srt_to_conversation_rnbrad(srt_text: str) -> Conversation:
+from handle_data import Person, Conversation, Sentence
+from sentiment import analyze_sentiment, analyze_sentiments, analyze_conversation
+from speakers import DEFAULT_DEVICE, registry as speaker_registry
+from flag_rules import get_engine as get_flag_rules
+from metrics import stage
+
+# "00:00:04,080 --> 00:00:04,720" (a '.' before the milliseconds is tolerated too)
+TIME_RANGE_RE = re.compile(
+    r"^(\d+:\d{2}:\d{2}[,.]\d{1,3})\s*-->\s*(\d+:\d{2}:\d{2}[,.]\d{1,3})"
+)
+SPEAKER_RE = re.compile(r"(Speaker \d+): (.*)")
+
+
+class SrtCue(NamedTuple):
+    """One subtitle block: index (None if missing), offsets from the recording start, text lines."""
+    index: Optional[int]
+    start: timedelta
+    end: timedelta
+    lines: List[str]
+
+
+def parse_srt_time(time_str: str) -> timedelta:
+    """Parse SRT time format 'HH:MM:SS,ms' into an offset from the start of the recording."""
+    h, m, s_ms = time_str.strip().split(":")
+    s, ms = s_ms.replace(".", ",").split(",")
+    return timedelta(hours=int(h), minutes=int(m), seconds=int(s), milliseconds=int(ms.ljust(3, "0")))
+
+
+def iter_srt_cues(source: Union[str, Iterable[str]]) -> Iterator[SrtCue]:
     """
-    Converts an SRT transcript to a Conversation object,
-    mapping Speaker 0 -> Ryan, Speaker 1 -> Brad.
+    Yield cues from an SRT transcript one block at a time.
+
+    source may be the transcript text, an open file, or any iterable of lines;
+    files are read lazily so memory use does not depend on transcript length.
+    Blocks are detected by their time-range line rather than by blank lines, so
+    a missing blank line between two blocks is tolerated: a bare number right
+    before a time range is taken as that block's index. Blocks without text
+    and lines before the first time range are skipped.
     """
-    # Fetch Person documents from MongoDB
-    ryan_doc = people.find_one({"name": "Ryan"})
-    brad_doc = people.find_one({"name": "Brad"})
-    if not ryan_doc or not brad_doc:
-        raise ValueError("Ryan or Brad not found in MongoDB People collection.")
-
-    speaker_map = {
-        "Speaker 0": ryan_doc["_id"],
-        "Speaker 1": brad_doc["_id"]
-    }
-
-    sentences = []
-    flags = []
-    participants_set = set([ryan_doc["_id"], brad_doc["_id"]])
-
-    blocks = srt_text.strip().split("\n\n")
-    for block in blocks:
-        lines = block.strip().split("\n")
-        if len(lines) < 3:
-            continue  # Skip malformed blocks
-        
-        # Lines: [index, time_range, text...]
-        time_range = lines[1]
-        text_lines = lines[2:]
-        start_str, end_str = time_range.split(" --> ")
-        start_time = parse_srt_time(start_str)
-        end_time = parse_srt_time(end_str)
-        total_seconds = int((end_time - start_time).total_seconds())
+    lines = source.splitlines() if isinstance(source, str) else source
+
+    current = None  # (index, start, end) of the block being collected
+    pending = []    # text lines seen since the last time range
+    for raw in lines:
+        line = raw.strip()
+        if not line:
+            continue
+
+        match = TIME_RANGE_RE.match(line)
+        if not match:
+            pending.append(line)
+            continue
+
+        index = int(pending.pop()) if pending and pending[-1].isdigit() else None
+        if current and pending:
+            yield SrtCue(*current, pending)
+        current = (index, parse_srt_time(match.group(1)), parse_srt_time(match.group(2)))
+        pending = []
+
+    if current and pending:
+        yield SrtCue(*current, pending)
 
+
+def iter_sentences(source: Union[str, Iterable[str]], speaker_map: dict,
+                   recording_start: datetime, score: bool = True) -> Iterator[Sentence]:
+    """
+    Yield Sentence objects from an SRT transcript as its blocks are read.
+
+    Args:
+        source: Transcript text, open file or iterable of lines (see iter_srt_cues).
+        speaker_map (dict): Diarized label ("Speaker 0") -> Person._id.
+        recording_start (datetime): Wall-clock time the recording started.
+        score (bool): Score each sentence as it is read. If False, sentiment is
+            left empty for score_conversation to fill in.
+    """
+    for cue in iter_srt_cues(source):
         # Extract speaker and text
-        match = re.match(r"(Speaker \d+): (.*)", text_lines[0])
+        match = SPEAKER_RE.match(cue.lines[0])
         if match:
             speaker_id, text = match.groups()
+            text = " ".join([text] + cue.lines[1:])
         else:
-            speaker_id, text = "Unknown", " ".join(text_lines)
+            speaker_id, text = "Unknown", " ".join(cue.lines)
 
-        # Map to Person ObjectId
-        speaker_oid = speaker_map.get(speaker_id, ObjectId())
-
-        sentence = Sentence(
-            speaker=speaker_oid,
+        yield Sentence(
+            # Map to Person ObjectId
+            speaker=speaker_map.get(speaker_id, ObjectId()),
             text=text,
-            sentiment=analyze_sentiment(text),
-            start_time=start_time,
-            total_time=total_seconds
+            sentiment=analyze_sentiment(text) if score else {},
+            start_time=recording_start + cue.start,
+            total_time=(cue.end - cue.start).total_seconds()
         )
 
-        sentences.append(sentence)
-        if(sentence.sentiment['compound'] <= -0.):  # Flag very negative sentences
-            flags.append(sentences.index(sentence))
-    # Conversation metadata
-    conversation_start = sentences[0].start_time if sentences else datetime.now()
-    total_time = sum(s.total_time for s in sentences)
 
-    convo = Conversation(
-        participants=list(participants_set),
+def resolve_speakers_rnbrad(device: str = DEFAULT_DEVICE) -> dict:
+    """
+    Return the diarized speaker map for a device from the cached speaker registry.
+    The default device maps Speaker 0 -> Ryan, Speaker 1 -> Brad.
+    """
+    return speaker_registry.resolve(device)
+
+
+def parse_conversation(srt_text: Union[str, TextIO], speaker_map: dict,
+                       recording_start: datetime = None) -> Conversation:
+    """
+    Parse an SRT transcript into an unscored Conversation (no sentiment, no flags).
+    Sentence start times are recording_start (default: now) plus the SRT offsets.
+    """
+    recording_start = recording_start or datetime.now()
+    with stage("parse"):
+        sentences = list(iter_sentences(srt_text, speaker_map, recording_start, score=False))
+
+    # Conversation metadata
+    conversation_start = sentences[0].start_time if sentences else recording_start
+    conversation_end = max((s.start_time + timedelta(seconds=s.total_time) for s in sentences),
+                           default=conversation_start)
+
+    # Participants are the registered people who actually spoke
+    known = set(speaker_map.values())
+    return Conversation(
+        participants=[p for p in dict.fromkeys(s.speaker for s in sentences) if p in known],
         start_time=conversation_start,
-        total_time=total_time,
-        sentences=sentences,
-        sentiment= analyze_conversation(sentences),
-        flags=flags
+        total_time=(conversation_end - conversation_start).total_seconds(),
+        sentences=sentences
     )
 
+
+def transcript_hash(sentences: Iterable[Sentence]) -> Optional[str]:
+    """
+    Canonical hash of a transcript, used to recognize re-uploads of the same conversation.
+
+    Covers each sentence's text (whitespace collapsed), start relative to the
+    first sentence and duration, in milliseconds. It does not depend on when the
+    transcript was uploaded, its SRT layout or the speaker mapping, and a stored
+    conversation hashes to the same value as the upload it came from.
+    Returns None for an empty transcript.
+    """
+    digest = hashlib.sha256()
+    first = None
+    for s in sentences:
+        if first is None:
+            first = s.start_time
+        offset = (s.start_time - first) // timedelta(milliseconds=1) if s.start_time and first else 0
+        digest.update(f"{offset}|{round(s.total_time * 1000)}|{' '.join(s.text.split())}\n".encode())
+    return digest.hexdigest() if first is not None else None
+
+
+def srt_hash(srt_text: Union[str, Iterable[str]]) -> Optional[str]:
+    """transcript_hash of an SRT transcript, without scoring it or resolving speakers."""
+    return transcript_hash(iter_sentences(srt_text, {}, datetime(2000, 1, 1), score=False))
+
+
+def is_flagged(sentence: Sentence) -> bool:
+    """Whether a scored sentence was flagged by one of the flag rules (see flag_rules.py)."""
+    return bool(sentence.flag_rules)
+
+
+def score_sentences(sentences: List[Sentence], roles: dict = None, history: List[Sentence] = ()) -> List[ObjectId]:
+    """
+    Score sentences in one batch, run the flag rules over them and return the ids of the flagged ones.
+
+    Args:
+        sentences (List[Sentence]): Sentences to score, in time order.
+        roles (dict): Person._id -> role, for rules restricted to a role.
+        history (List[Sentence]): Earlier, already scored sentences of the conversation (for window rules).
+    """
+    for sentence, scores in zip(sentences, analyze_sentiments([s.text for s in sentences])):
+        sentence.sentiment = scores
+    return get_flag_rules().evaluate(sentences, roles, history)
+
+
+def score_conversation(convo: Conversation, roles: dict = None) -> Conversation:
+    """Score every sentence once, apply the flag rules and set the conversation sentiment."""
+    convo.flags.extend(score_sentences(convo.sentences, roles))
+    convo.sentiment = analyze_conversation(convo.sentences)
     return convo
 
+
+def srt_to_conversation_rnbrad(srt_text: Union[str, TextIO], recording_start: datetime = None,
+                               device: str = DEFAULT_DEVICE) -> Conversation:
+    """
+    Converts an SRT transcript (text or open file) to a Conversation object,
+    mapping speakers through the registry for the device
+    (by default Speaker 0 -> Ryan, Speaker 1 -> Brad).
+    Sentence start times are recording_start (default: now) plus the SRT offsets.
+    """
+    speaker_map = resolve_speakers_rnbrad(device)
+    return score_conversation(parse_conversation(srt_text, speaker_map, recording_start),
+                              speaker_registry.roles(device))
+
 # -------------------------
 # Example usage
 # -------------------------
@@ -169,4 +283,7 @@ Speaker 0: If you squirt me, I'll be glad I'll squirt with a smile.
 Speaker 1: That is a good thing good boy.
 """
 
-conversation = srt_to_conversation_rnbrad(srt_text)
+if __name__ == "__main__":
+    conversation = srt_to_conversation_rnbrad(srt_text)
+    print(f"{len(conversation.sentences)} sentences, sentiment {conversation.sentiment:.3f}, "
+          f"{len(conversation.flags)} flagged")
@@ -0,0 +1,179 @@
+"""
+request_args.py
+---------------
+Request parsing and validation shared by server.py (Flask) and
+async_server.py (Quart), so the two servers differ only in their I/O.
+
+Both frameworks hand routes Werkzeug MultiDicts, Headers and Range objects,
+so these functions take those and return plain values. Invalid input raises
+ValueError, which the routes turn into a 400 with the message as the error.
+"""
+import json
+from datetime import datetime
+from typing import List, Optional, Tuple
+
+from audio_store import WAV_HEADER_BYTES, clip_bounds
+
+# Page size limits for ?limit= on the list endpoints
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
+# Page size of /search when no ?limit= is given
+DEFAULT_SEARCH_LIMIT = 50
+
+# Longest Idempotency-Key header accepted by /new-audio
+MAX_IDEMPOTENCY_KEY_LENGTH = 255
+
+
+def iso_datetime(value: Optional[str]) -> Optional[datetime]:
+    """Parse an optional ISO 8601 query parameter."""
+    return datetime.fromisoformat(value) if value else None
+
+
+def split_names(value: Optional[str]) -> List[str]:
+    """Names of a comma-separated parameter (?names=a,b or ?person=a,b), skipping empty ones."""
+    return [n for n in (value or "").split(",") if n]
+
+
+def first_missing(names: list, found: dict) -> Optional[str]:
+    """The first of names that get_person_ids did not find, if any."""
+    return next((n for n in names if n not in found), None)
+
+
+def person_not_found(name: str) -> dict:
+    return {"error": f"Person '{name}' not found"}
+
+
+def page_args(args) -> Optional[Tuple[int, Optional[str]]]:
+    """
+    (limit, after) of a keyset-paged list request, or None when the client asked
+    for neither ?limit= nor ?after= (the full list).
+    """
+    if "limit" not in args and "after" not in args:
+        return None
+    try:
+        limit = int(args.get("limit", DEFAULT_PAGE_SIZE))
+    except ValueError:
+        raise ValueError("limit must be an integer") from None
+    if limit < 1:
+        raise ValueError("limit must be positive")
+    return min(limit, MAX_PAGE_SIZE), args.get("after")
+
+
+def offset_limit(args, default_limit: int) -> Tuple[int, int]:
+    """?offset= and ?limit= of a sentence page, with limit capped at MAX_PAGE_SIZE."""
+    offset = int(args.get("offset", 0))
+    limit = int(args.get("limit", default_limit))
+    if offset < 0 or limit < 1:
+        raise ValueError("offset must be >= 0 and limit must be positive")
+    return offset, min(limit, MAX_PAGE_SIZE)
+
+
+def sentences_args(args) -> dict:
+    """Keyword arguments of get_conversation_sentences for /conversation/<id>/sentences."""
+    start, end = iso_datetime(args.get("start")), iso_datetime(args.get("end"))
+    offset, limit = offset_limit(args, DEFAULT_PAGE_SIZE)
+    return {"offset": offset, "limit": limit, "start": start, "end": end}
+
+
+def search_query(args) -> str:
+    query = args.get("q", "").strip()
+    if not query:
+        raise ValueError("q is required")
+    return query
+
+
+def search_names(args) -> List[str]:
+    """People named by /search (?person= participant, ?speaker=), to look up before searching."""
+    return [n for n in (args.get("person"), args.get("speaker")) if n]
+
+
+def search_args(args, found: dict) -> dict:
+    """Keyword arguments of search_sentences for /search, given the ids of search_names."""
+    min_compound, max_compound = args.get("min_compound"), args.get("max_compound")
+    start, end = iso_datetime(args.get("start")), iso_datetime(args.get("end"))
+    offset, limit = offset_limit(args, DEFAULT_SEARCH_LIMIT)
+    return {
+        "person_id": found.get(args.get("person")),
+        "speaker_id": found.get(args.get("speaker")),
+        "start": start,
+        "end": end,
+        "min_compound": float(min_compound) if min_compound else None,
+        "max_compound": float(max_compound) if max_compound else None,
+        "limit": limit,
+        "offset": offset,
+    }
+
+
+def trend_names(person_name: str, args) -> List[str]:
+    """People named by /trends/<person_name> (?with= for the pair's buckets)."""
+    return [person_name] + ([args["with"]] if args.get("with") else [])
+
+
+def trend_args(person_name: str, args, found: dict) -> dict:
+    """Keyword arguments of get_trend for /trends/<person_name>, given the ids of trend_names."""
+    return {
+        "person_id": found[person_name],
+        "period": args.get("period", "week"),
+        "start": iso_datetime(args.get("start")),
+        "end": iso_datetime(args.get("end")),
+        "other_id": found.get(args.get("with")),
+    }
+
+
+def trend_body(person_name: str, args, buckets: list) -> dict:
+    for b in buckets:
+        b["start"] = b["start"].date().isoformat()
+    return {"person": person_name, "with": args.get("with"), "period": args.get("period", "week"), "buckets": buckets}
+
+
+def idempotency_key(headers) -> Optional[str]:
+    """The Idempotency-Key header of an upload, if any."""
+    key = headers.get("Idempotency-Key") or None
+    if key and len(key) > MAX_IDEMPOTENCY_KEY_LENGTH:
+        raise ValueError(f"Idempotency-Key must be at most {MAX_IDEMPOTENCY_KEY_LENGTH} characters")
+    return key
+
+
+def segments_body(body) -> list:
+    """A JSON segment or list of segments posted to /live/conversations/<id>/segments."""
+    return body if isinstance(body, list) else [body]
+
+
+def last_event_id(headers, args) -> Optional[int]:
+    """Where a reconnecting /events client resumes (Last-Event-ID header or ?last_event_id=); None if unusable."""
+    value = headers.get("Last-Event-ID") or args.get("last_event_id")
+    try:
+        return int(value) if value else None
+    except ValueError:
+        return None
+
+
+def sse_message(event) -> str:
+    return f"id: {event.id}\nevent: {event.type}\ndata: {json.dumps(event.data)}\n\n"
+
+
+def audio_clip(recording: dict, sentence: dict, byte_range) -> Tuple[int, dict, Optional[tuple]]:
+    """
+    Status, headers and clip_wav arguments (recording omitted) of a sentence's audio
+    response. byte_range is the request's parsed Range header, or None. The clip
+    arguments are None for a 416 (range not satisfiable).
+    """
+    pcm_start, pcm_stop = clip_bounds(recording, sentence.get("audio_offset") or 0.0, sentence.get("total_time", 0))
+    length = WAV_HEADER_BYTES + pcm_stop - pcm_start
+    headers = {
+        "Accept-Ranges": "bytes",
+        # Stored audio never changes, so a clip can be cached for good
+        "Cache-Control": "public, max-age=31536000, immutable",
+        "ETag": f'"{recording["_id"][:16]}-{pcm_start}-{pcm_stop}"',
+    }
+    start, stop, status = 0, length, 200
+    if byte_range is not None:
+        bounds = byte_range.range_for_length(length)
+        if bounds is None:
+            headers["Content-Range"] = f"bytes */{length}"
+            return 416, headers, None
+        start, stop = bounds
+        status = 206
+        headers["Content-Range"] = f"bytes {start}-{stop - 1}/{length}"
+    headers["Content-Length"] = str(stop - start)
+    return status, headers, (pcm_start, pcm_stop, start, stop)
@@ -0,0 +1,229 @@
+"""
+rollups.py
+----------
+Daily and weekly sentiment rollups, per person and per pair of participants.
+
+Every bucket document in the Rollups collection holds running totals for
+one subject and period:
+
+    {kind: "person" | "pair", subject: "<id>" | "<id>:<id>", people: [ids],
+     period: "day" | "week", start: <bucket start>,
+     sentences, words, compound_sum, flags, conversations}
+
+compound_sum is the sum of compound * word count, so compound_sum / words
+is the same length-weighted score analyze_conversation computes. A person's
+buckets cover every sentence of the conversations they take part in; a
+pair's cover the conversations both take part in. Sentences fall into the
+bucket of their own start time (weeks start on Monday); a conversation is
+counted once per subject, in the bucket of its start time.
+
+Buckets are updated with $inc upserts at ingest (see handle_data), so a
+trend query reads one small document per bucket instead of rescanning
+sentences. manage.py rebuild-rollups recomputes them from scratch.
+"""
+from datetime import datetime, timedelta
+from itertools import combinations
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from bson import ObjectId
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError
+
+from db import collection
+from models import Sentence
+from sentiment import analyze_sentiment, sentence_weight
+
+PERIODS = ("day", "week")
+COUNTERS = ("sentences", "words", "compound_sum", "flags", "conversations")
+
+rollups = collection("Rollups")
+rollups_reads = collection("Rollups", read_only=True)
+
+
+def ensure_indexes():
+    rollups.create_index([("kind", 1), ("subject", 1), ("period", 1), ("start", 1)], unique=True)
+
+
+def bucket_start(t: datetime, period: str) -> datetime:
+    """Start of the day or (Monday-based) week containing t."""
+    day = datetime(t.year, t.month, t.day)
+    return day if period == "day" else day - timedelta(days=day.weekday())
+
+
+def pair_subject(a, b) -> Tuple[str, List[ObjectId]]:
+    """Order-independent subject key and member list of a pair of people."""
+    first, second = sorted((ObjectId(a), ObjectId(b)), key=str)
+    return f"{first}:{second}", [first, second]
+
+
+def flagged_sentence_ids(sentences: List[Sentence], flags: Iterable) -> set:
+    """Ids of the flagged sentences; flags may hold sentence ids or (older documents) indices."""
+    ids = set()
+    for f in flags:
+        if isinstance(f, int):
+            if 0 <= f < len(sentences):
+                ids.add(sentences[f]._id)
+        else:
+            ids.add(f)
+    return ids
+
+
+class RollupBatch:
+    """Accumulates bucket increments in memory and writes them with one bulk_write."""
+
+    def __init__(self):
+        # (kind, subject, period, start) -> [people, {counter: increment}]
+        self._buckets: Dict[tuple, list] = {}
+
+    def __len__(self):
+        return len(self._buckets)
+
+    def _inc(self, kind: str, subject: str, people: list, period: str, start: datetime, counts: dict):
+        entry = self._buckets.setdefault((kind, subject, period, start), [people, dict.fromkeys(COUNTERS, 0)])
+        for name, value in counts.items():
+            entry[1][name] += value
+
+    def add(self, sentences: List[Sentence], flagged: set, conversation_start: Optional[datetime],
+            people: Iterable = (), pairs: Iterable = (), count_conversation: bool = True):
+        """
+        Add sentences to the buckets of the given people and pairs.
+
+        Args:
+            sentences (List[Sentence]): Scored sentences (unscored ones are scored here).
+            flagged (set): Ids of the flagged sentences.
+            conversation_start (datetime): Start of the conversation (bucket for sentences without a time).
+            people (Iterable): Person ids whose buckets get the sentences.
+            pairs (Iterable): (id, id) pairs whose buckets get the sentences.
+            count_conversation (bool): Also count the conversation once per subject.
+        """
+        subjects = [("person", str(ObjectId(p)), [ObjectId(p)]) for p in people]
+        subjects += [("pair", *pair_subject(a, b)) for a, b in pairs]
+        if not subjects:
+            return
+
+        # Totals per bucket are computed once and then added to every subject
+        totals = {}
+        for s in sentences:
+            when = s.start_time or conversation_start
+            if when is None:
+                continue
+            scores = s.sentiment if isinstance(s.sentiment, dict) and "compound" in s.sentiment else analyze_sentiment(s.text)
+            weight = sentence_weight(s.text)
+            for period in PERIODS:
+                t = totals.setdefault((period, bucket_start(when, period)), dict.fromkeys(COUNTERS, 0))
+                t["sentences"] += 1
+                t["words"] += weight
+                t["compound_sum"] += scores["compound"] * weight
+                t["flags"] += s._id in flagged
+        if count_conversation and conversation_start is not None:
+            for period in PERIODS:
+                t = totals.setdefault((period, bucket_start(conversation_start, period)), dict.fromkeys(COUNTERS, 0))
+                t["conversations"] += 1
+
+        for kind, subject, members in subjects:
+            for (period, start), counts in totals.items():
+                self._inc(kind, subject, members, period, start, counts)
+
+    def add_conversation(self, sentences: List[Sentence], flags: Iterable, participants: Iterable,
+                         conversation_start: Optional[datetime]):
+        """Add a whole conversation for all its participants and their pairs."""
+        participants = list(dict.fromkeys(ObjectId(p) for p in participants))
+        self.add(sentences, flagged_sentence_ids(sentences, flags), conversation_start,
+                 people=participants, pairs=combinations(participants, 2))
+
+    def write(self):
+        """Apply the accumulated increments (upserting new buckets) and clear the batch."""
+        if not self._buckets:
+            return
+        ops = [
+            UpdateOne(
+                {"kind": kind, "subject": subject, "period": period, "start": start},
+                {"$inc": counts, "$setOnInsert": {"people": people}},
+                upsert=True,
+            )
+            for (kind, subject, period, start), (people, counts) in self._buckets.items()
+        ]
+        self._buckets = {}
+        try:
+            rollups.bulk_write(ops, ordered=False)
+        except BulkWriteError as e:
+            # Two writers upserting the same new bucket: the loser retries as a plain update
+            duplicates = [ops[err["index"]] for err in e.details.get("writeErrors", []) if err.get("code") == 11000]
+            if len(duplicates) < len(e.details.get("writeErrors", [])):
+                raise
+            rollups.bulk_write(duplicates, ordered=False)
+
+
+def record_conversation(sentences: List[Sentence], flags: Iterable, participants: Iterable,
+                        conversation_start: Optional[datetime]):
+    """Add one stored conversation to the rollups."""
+    batch = RollupBatch()
+    batch.add_conversation(sentences, flags, participants, conversation_start)
+    batch.write()
+
+
+def trend_query(person_id, period: str = "week", start: datetime = None, end: datetime = None,
+                other_id=None) -> dict:
+    """Query for the buckets returned by get_trend (ValueError for an unknown period)."""
+    if period not in PERIODS:
+        raise ValueError(f"period must be one of {', '.join(PERIODS)}")
+    if other_id is None:
+        query = {"kind": "person", "subject": str(ObjectId(person_id))}
+    else:
+        query = {"kind": "pair", "subject": pair_subject(person_id, other_id)[0]}
+    query["period"] = period
+    if start is not None or end is not None:
+        query["start"] = {}
+        if start is not None:
+            query["start"]["$gte"] = bucket_start(start, period)
+        if end is not None:
+            query["start"]["$lt"] = end
+    return query
+
+
+TREND_PROJECTION = {"_id": 0, "start": 1, **{c: 1 for c in COUNTERS}}
+
+
+def trend_bucket(doc: dict) -> dict:
+    words = doc.get("words", 0)
+    return {
+        "start": doc["start"],
+        "sentences": doc.get("sentences", 0),
+        "words": words,
+        "sentiment": doc.get("compound_sum", 0.0) / words if words else None,
+        "flags": doc.get("flags", 0),
+        "conversations": doc.get("conversations", 0),
+    }
+
+
+def get_trend(person_id, period: str = "week", start: datetime = None, end: datetime = None,
+              other_id=None) -> List[dict]:
+    """
+    Return a person's (or, with other_id, a pair's) buckets in time order.
+
+    Each bucket: {"start", "sentences", "words", "sentiment", "flags", "conversations"},
+    where sentiment is the word-count-weighted compound score of the bucket (None if empty).
+    """
+    query = trend_query(person_id, period, start, end, other_id)
+    return [trend_bucket(doc) for doc in rollups_reads.find(query, TREND_PROJECTION).sort("start", 1)]
+
+
+def rebuild(conversation_docs: Iterable[dict], batch_size: int = 500) -> int:
+    """
+    Recompute every bucket from conversation documents (replacing the collection).
+
+    Returns:
+        int: Number of conversations processed.
+    """
+    rollups.drop()
+    ensure_indexes()
+    batch = RollupBatch()
+    processed = 0
+    for doc in conversation_docs:
+        sentences = [Sentence.from_dict(s) for s in doc.get("sentences", [])]
+        batch.add_conversation(sentences, doc.get("flags", []), doc.get("participants", []), doc.get("start_time"))
+        processed += 1
+        if processed % batch_size == 0:
+            batch.write()
+    batch.write()
+    return processed
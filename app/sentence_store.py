@@ -0,0 +1,319 @@
+"""
+sentence_store.py
+-----------------
+Bucketed storage for the sentences of long conversations.
+
+By default (SENTENCE_STORAGE=embedded) a conversation document embeds all of
+its sentences, which caps a conversation at MongoDB's 16 MB document limit
+and makes every live append rewrite a growing document. With
+SENTENCE_STORAGE=bucketed, new conversations keep only their metadata and
+flags, and their sentences go to the SentenceBuckets collection in buckets
+of bucket_size consecutive sentences:
+
+    {conversation: <id>, index: n, first: n * bucket_size, count,
+     start_time, end_time, sentences: [...]}
+
+start_time/end_time are the earliest and latest sentence start times in the
+bucket, for time-window reads. The conversation document is marked with
+sentence_layout: "bucketed" and carries sentence_count and bucket_size (so
+changing SENTENCE_BUCKET_SIZE never affects stored conversations). Readers
+look at the marker of each document, so both layouts can coexist and a
+database can be migrated gradually (manage.py migrate-sentences).
+
+LazySentences gives Conversation.sentences the same sequence view for
+bucketed conversations, loading a bucket the first time one of its
+sentences is accessed.
+"""
+import os
+from collections.abc import Sequence
+from datetime import datetime
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+from bson import ObjectId
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError, DuplicateKeyError
+
+from db import collection
+from models import Sentence
+
+EMBEDDED = "embedded"
+BUCKETED = "bucketed"
+# Layout of newly stored conversations
+SENTENCE_STORAGE = os.getenv("SENTENCE_STORAGE", EMBEDDED)
+# Sentences per bucket (a few hundred bytes each)
+SENTENCE_BUCKET_SIZE = int(os.getenv("SENTENCE_BUCKET_SIZE", "200"))
+
+if SENTENCE_STORAGE not in (EMBEDDED, BUCKETED):
+    raise ValueError(f"SENTENCE_STORAGE must be '{EMBEDDED}' or '{BUCKETED}'")
+
+buckets = collection("SentenceBuckets")
+buckets_reads = collection("SentenceBuckets", read_only=True)
+
+# Fields of a conversation document the functions below need
+LAYOUT_PROJECTION = {"sentence_layout": 1, "sentence_count": 1, "bucket_size": 1}
+
+
+def ensure_indexes():
+    buckets.create_index([("conversation", 1), ("index", 1)], unique=True)
+    # Same name and language as the Conversations index searched by handle_data.search_sentences
+    buckets.create_index([("sentences.text", "text")], name="sentence_text", default_language="english")
+
+
+def is_bucketed(doc: dict) -> bool:
+    return doc.get("sentence_layout") == BUCKETED
+
+
+def layout_fields(sentence_count: int = 0) -> dict:
+    """Fields marking a new conversation document as bucketed."""
+    return {"sentence_layout": BUCKETED, "sentence_count": sentence_count, "bucket_size": SENTENCE_BUCKET_SIZE}
+
+
+def bucket_size(doc: dict) -> int:
+    return doc.get("bucket_size") or SENTENCE_BUCKET_SIZE
+
+
+# -----------------------------
+# Writes
+# -----------------------------
+def append(conv_id: ObjectId, sentence_docs: List[dict], first: int, size: int = SENTENCE_BUCKET_SIZE) -> bool:
+    """
+    Store sentences first .. first + len - 1 of a conversation whose buckets hold
+    exactly `first` sentences (live appends).
+
+    The write to the bucket holding `first` only applies while that bucket still
+    has the sentences before it and no others, so of two appends racing for the
+    same position one writes and the other gets False and writes nothing.
+    """
+    ops = []
+    pos = 0
+    while pos < len(sentence_docs):
+        index, within = divmod(first + pos, size)
+        part = sentence_docs[pos:pos + size - within]
+        update = {
+            "$push": {"sentences": {"$each": part}},
+            "$inc": {"count": len(part)},
+            "$setOnInsert": {"first": index * size},
+        }
+        times = [s["start_time"] for s in part if s.get("start_time") is not None]
+        if times:
+            update["$min"] = {"start_time": min(times)}
+            update["$max"] = {"end_time": max(times)}
+        # A bucket that starts here is new; one that doesn't must exist already
+        ops.append(({"conversation": conv_id, "index": index, "count": within}, update, within == 0))
+        pos += len(part)
+    if not ops:
+        return True
+    guard, update, upsert = ops[0]
+    try:
+        result = buckets.update_one(guard, update, upsert=upsert)
+    except DuplicateKeyError:
+        # Another append created the bucket first
+        return False
+    if result.matched_count == 0 and result.upserted_id is None:
+        return False
+    if len(ops) > 1:
+        # The rest are new buckets past the one won above, so nobody else writes them
+        buckets.bulk_write([UpdateOne(*op) for op in ops[1:]], ordered=True)
+    return True
+
+
+def truncate(conv_id: ObjectId, count: int, size: int = SENTENCE_BUCKET_SIZE):
+    """Drop every sentence of a conversation after the first `count`, undoing an append()."""
+    index, within = divmod(count, size)
+    if within:
+        buckets.update_one({"conversation": conv_id, "index": index},
+                           {"$push": {"sentences": {"$each": [], "$slice": within}}, "$set": {"count": within}})
+        index += 1
+    buckets.delete_many({"conversation": conv_id, "index": {"$gte": index}})
+
+
+def write_many(conversations: Dict[ObjectId, Tuple[List[dict], int]]):
+    """
+    Store the sentences of several new conversations ({id: (sentence docs, bucket size)})
+    in one insert. Buckets that already exist are left as they are.
+    """
+    docs = []
+    for conv_id, (sentence_docs, size) in conversations.items():
+        for index, first in enumerate(range(0, len(sentence_docs), size)):
+            part = sentence_docs[first:first + size]
+            times = [s["start_time"] for s in part if s.get("start_time") is not None]
+            docs.append({
+                "conversation": conv_id, "index": index, "first": first, "count": len(part),
+                "start_time": min(times, default=None), "end_time": max(times, default=None),
+                "sentences": part,
+            })
+    if not docs:
+        return
+    try:
+        buckets.insert_many(docs, ordered=False)
+    except BulkWriteError as e:
+        # Buckets already written by an earlier attempt to store the same conversation
+        if any(err.get("code") != 11000 for err in e.details.get("writeErrors", [])):
+            raise
+
+
+def set_sentence_fields(conv_id: ObjectId, size: int, updates: Dict[int, dict]):
+    """$set fields of sentences by conversation-wide index: {index: {field: value}}."""
+    per_bucket: Dict[int, dict] = {}
+    for i, fields in updates.items():
+        index, within = divmod(i, size)
+        per_bucket.setdefault(index, {}).update({f"sentences.{within}.{k}": v for k, v in fields.items()})
+    if per_bucket:
+        buckets.bulk_write([UpdateOne({"conversation": conv_id, "index": index}, {"$set": fields})
+                            for index, fields in per_bucket.items()], ordered=False)
+
+
+def delete(conv_ids: List[ObjectId]) -> int:
+    return buckets.delete_many({"conversation": {"$in": conv_ids}}).deleted_count
+
+
+# -----------------------------
+# Reads
+# -----------------------------
+def iter_buckets(conv_id: ObjectId, size: int, start: int = 0, stop: Optional[int] = None,
+                 reads=buckets_reads) -> Iterator[Tuple[int, List[dict]]]:
+    """
+    Yield (bucket index, raw sentence documents) for sentences start .. stop - 1 of a
+    conversation. Positions come from each bucket's "first" and actual length, so
+    a bucket that is not full never shifts the sentences after it.
+    """
+    query = {"conversation": conv_id, "index": {"$gte": start // size}}
+    if stop is not None:
+        if stop <= start:
+            return
+        query["index"]["$lte"] = (stop - 1) // size
+    for bucket in reads.find(query, {"index": 1, "first": 1, "sentences": 1}).sort("index", 1):
+        first = bucket.get("first", 0)
+        lo = max(start - first, 0)
+        hi = len(bucket["sentences"]) if stop is None else max(min(stop - first, len(bucket["sentences"])), 0)
+        yield bucket["index"], bucket["sentences"][lo:hi]
+
+
+def iter_sentence_docs(conv_id: ObjectId, size: int, start: int = 0, stop: Optional[int] = None,
+                       reads=buckets_reads) -> Iterator[dict]:
+    """Yield raw sentence documents start .. stop - 1 of a conversation, one bucket at a time."""
+    for _, sentences in iter_buckets(conv_id, size, start, stop, reads):
+        yield from sentences
+
+
+def attach(docs: Iterable[dict], reads=buckets_reads):
+    """Fill in "sentences" of the bucketed conversation documents among docs, with one query."""
+    pending = {d["_id"]: d for d in docs if is_bucketed(d) and "sentences" not in d}
+    if not pending:
+        return
+    for d in pending.values():
+        d["sentences"] = []
+    cursor = reads.find({"conversation": {"$in": list(pending)}}, {"conversation": 1, "sentences": 1})
+    for bucket in cursor.sort([("conversation", 1), ("index", 1)]):
+        pending[bucket["conversation"]]["sentences"].extend(bucket["sentences"])
+    for d in pending.values():
+        # Sentences of a live append still in progress are not counted yet
+        del d["sentences"][d.get("sentence_count", 0):]
+
+
+def window(conv_id: ObjectId, start: datetime = None, end: datetime = None, reads=buckets_reads,
+           count: Optional[int] = None) -> Iterator[dict]:
+    """
+    Yield the sentence documents starting in [start, end), reading only the buckets
+    that overlap it. If count is given, only the first count sentences are considered.
+    """
+    query = {"conversation": conv_id}
+    if start is not None:
+        query["end_time"] = {"$gte": start}
+    if end is not None:
+        query["start_time"] = {"$lt": end}
+    for bucket in reads.find(query, {"first": 1, "sentences": 1}).sort("index", 1):
+        sentences = bucket["sentences"]
+        if count is not None:
+            sentences = sentences[:max(count - bucket.get("first", 0), 0)]
+        for s in sentences:
+            t = s.get("start_time")
+            if (start is None or (t is not None and t >= start)) and (end is None or (t is not None and t < end)):
+                yield s
+
+
+def page(doc: dict, offset: int, limit: int, start: datetime = None, end: datetime = None) -> Tuple[int, List[dict]]:
+    """(total, sentence documents) for handle_data.get_conversation_sentences on a bucketed conversation."""
+    if start is None and end is None:
+        total = doc.get("sentence_count", 0)
+        return total, list(iter_sentence_docs(doc["_id"], bucket_size(doc), offset, min(offset + limit, total)))
+    matching = list(window(doc["_id"], start, end, count=doc.get("sentence_count", 0)))
+    return len(matching), matching[offset:offset + limit]
+
+
+def find_flagged(doc: dict, reads=buckets_reads) -> List[dict]:
+    """The flagged sentence documents of a bucketed conversation (doc needs flags), in order."""
+    flags = set(doc.get("flags", []))
+    if not flags:
+        return []
+    found = []
+    query = {"conversation": doc["_id"], "sentences._id": {"$in": list(flags)}}
+    for bucket in reads.find(query, {"first": 1, "sentences": 1}).sort("index", 1):
+        counted = bucket["sentences"][:max(doc.get("sentence_count", 0) - bucket.get("first", 0), 0)]
+        found += [s for s in counted if s["_id"] in flags]
+    return found
+
+
+def find_sentence(conv_id: ObjectId, sentence_id: ObjectId) -> Optional[dict]:
+    bucket = buckets_reads.find_one({"conversation": conv_id, "sentences._id": sentence_id},
+                                    {"sentences": {"$elemMatch": {"_id": sentence_id}}})
+    return bucket["sentences"][0] if bucket and bucket.get("sentences") else None
+
+
+# -----------------------------
+# Lazy sequence
+# -----------------------------
+class LazySentences(Sequence):
+    """
+    Read-only sequence of a bucketed conversation's Sentence objects. len() costs
+    nothing; indexing loads only the bucket holding the sentence; iterating
+    streams the buckets in order. Loaded buckets are kept.
+    """
+
+    def __init__(self, conv_id: ObjectId, count: int, size: int = SENTENCE_BUCKET_SIZE):
+        self.conv_id = conv_id
+        self.count = count
+        self.size = size
+        self._buckets: Dict[int, List[Sentence]] = {}
+
+    def __len__(self):
+        return self.count
+
+    def _bucket(self, index: int) -> List[Sentence]:
+        if index not in self._buckets:
+            start = index * self.size
+            docs = iter_sentence_docs(self.conv_id, self.size, start, min(start + self.size, self.count))
+            self._buckets[index] = [Sentence.from_dict(s) for s in docs]
+        return self._buckets[index]
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self[j] for j in range(*i.indices(self.count))]
+        if i < 0:
+            i += self.count
+        if not 0 <= i < self.count:
+            raise IndexError("sentence index out of range")
+        bucket = self._bucket(i // self.size)
+        if i % self.size >= len(bucket):  # counted but not written yet (live append in progress)
+            raise IndexError("sentence index out of range")
+        return bucket[i % self.size]
+
+    def __iter__(self):
+        missing = [i for i in range((self.count + self.size - 1) // self.size) if i not in self._buckets]
+        if missing:
+            # One cursor for everything not loaded yet, instead of one query per bucket
+            loaded = {i: [] for i in missing}
+            for index, sentences in iter_buckets(self.conv_id, self.size, missing[0] * self.size, self.count):
+                if index in loaded:
+                    loaded[index] = [Sentence.from_dict(s) for s in sentences]
+            self._buckets.update(loaded)
+        for i in range((self.count + self.size - 1) // self.size):
+            yield from self._buckets[i]
+
+    def __eq__(self, other):
+        if isinstance(other, Sequence):
+            return len(self) == len(other) and list(self) == list(other)
+        return NotImplemented
+
+    def __repr__(self):
+        return f"LazySentences(conversation={self.conv_id}, count={self.count})"
@@ -3,68 +3,144 @@ sentiment.py
 ------------
 Use NLTK's VADER sentiment analysis to score sentences.
 """
-from nltk.sentiment import SentimentIntensityAnalyzer
-from typing import Dict, List
+import os
+import threading
+from functools import lru_cache
+from typing import Dict, List, Tuple
 from models import Sentence
+from metrics import stage
 
-# Initialize analyzer once
-sia = SentimentIntensityAnalyzer()
+# The analyzer (and the NLTK import behind it) is built on first use or by load_analyzer()
+_sia = None
+_sia_lock = threading.Lock()
+
+# Maximum number of distinct (normalized) texts whose scores are kept.
+# Short utterances ("I'm fine", "Help me") repeat constantly while monitoring.
+SENTIMENT_CACHE_SIZE = int(os.getenv("SENTIMENT_CACHE_SIZE", "10000"))
+
+NEUTRAL_SCORES = {"neg": 0.0, "neu": 1.0, "pos": 0.0, "compound": 0.0}
+
+def load_analyzer():
+    """
+    Return the shared VADER analyzer, loading NLTK and the lexicon on first call.
+    Call it from a warm-up hook to keep the cost out of the first request.
+    """
+    global _sia
+    if _sia is None:
+        with _sia_lock:
+            if _sia is None:
+                from nltk.sentiment import SentimentIntensityAnalyzer
+                _sia = SentimentIntensityAnalyzer()
+    return _sia
+
+def normalize_text(text: str) -> str:
+    """
+    Cache key for a text: surrounding and repeated whitespace is collapsed.
+    Case and punctuation are kept because VADER scores them.
+    """
+    return " ".join(text.split())
+
+@lru_cache(maxsize=SENTIMENT_CACHE_SIZE)
+def _cached_scores(normalized: str) -> tuple:
+    # Stored as a tuple so callers can't mutate the cached value.
+    # Only cache misses get here, so the "sentiment" stage is time spent in VADER.
+    analyzer = load_analyzer()
+    with stage("sentiment"):
+        return tuple(analyzer.polarity_scores(normalized).items())
 
 def analyze_sentiment(text: str) -> Dict[str, float]:
     """
     Analyze sentiment of a sentence using VADER.
+    Scores are memoized in a bounded LRU cache keyed on normalize_text(text).
     :param text: Input text
     :return: dict with neg, neu, pos, and compound scores
     """
-    if not text.strip():
-        return {"neg": 0.0, "neu": 1.0, "pos": 0.0, "compound": 0.0}
-    return sia.polarity_scores(text)
+    normalized = normalize_text(text)
+    if not normalized:
+        return dict(NEUTRAL_SCORES)
+    return dict(_cached_scores(normalized))
+
+def analyze_sentiments(texts: List[str]) -> List[Dict[str, float]]:
+    """
+    Score a batch of texts, running VADER at most once per distinct text.
+    :param texts: Input texts
+    :return: list of score dicts, in the same order as texts
+    """
+    scores = {}
+    for normalized in map(normalize_text, texts):
+        if normalized not in scores:
+            scores[normalized] = _cached_scores(normalized) if normalized else tuple(NEUTRAL_SCORES.items())
+    return [dict(scores[normalize_text(t)]) for t in texts]
+
+def sentiment_cache_stats() -> Dict[str, int]:
+    """
+    Hit/miss statistics of the sentiment score cache.
+    :return: dict with hits, misses, size and maxsize
+    """
+    info = _cached_scores.cache_info()
+    return {"hits": info.hits, "misses": info.misses, "size": info.currsize, "maxsize": info.maxsize}
 
 def analyze_sentences(sentences: List[Sentence]) -> List[Sentence]:
     """
     Update a list of Sentence objects with sentiment scores.
     Sentiment field will store the full dictionary.
     """
-    for s in sentences:
-        s.sentiment = analyze_sentiment(s.text)
+    for s, scores in zip(sentences, analyze_sentiments([s.text for s in sentences])):
+        s.sentiment = scores
     return sentences
 
-def analyze_conversation(conversation: List[Sentence]) -> float:
+def sentence_weight(text: str) -> int:
+    """Weight of a sentence in the conversation score: its word count (at least 1)."""
+    return max(len(text.split()), 1)
+
+def weighted_compound(conversation: List[Sentence]) -> Tuple[float, int]:
     """
-    Analyze sentiment for a whole conversation.
-    Returns a length-weighted compound score between -1 and +1.
+    Return (sum of compound * weight, sum of weights) over the sentences,
+    so running totals can be kept without rescanning a conversation.
+    Scores already stored on the sentences are reused.
     """
-
     weighted_sum = 0.0
     total_weight = 0
 
     for s in conversation:
-        scores = analyze_sentiment(s.text)
-        weight = max(len(s.text.split()), 1)  # weight = word count
+        scores = s.sentiment if isinstance(s.sentiment, dict) and "compound" in s.sentiment else analyze_sentiment(s.text)
+        weight = sentence_weight(s.text)
         weighted_sum += scores["compound"] * weight
         total_weight += weight
 
+    return weighted_sum, total_weight
+
+def analyze_conversation(conversation: List[Sentence]) -> float:
+    """
+    Analyze sentiment for a whole conversation.
+    Returns a length-weighted compound score between -1 and +1.
+    Scores already stored on the sentences are reused.
+    """
+    weighted_sum, total_weight = weighted_compound(conversation)
+    if not total_weight:
+        return 0.0
     return weighted_sum / total_weight
 
 
-texts = [
-    "I love spending time with my family.",
-    "I went to the store to buy some bread.",
-    "I feel unsafe and scared right now.",
-    "I love the food, but the service is terrible.",
-    "Im so so so so so sad and upset and sad!!!",
-]
-for t in texts:
-    print(t)
-    print(analyze_sentiment(t))
-
-sentences = [Sentence(text=t, speaker="", sentiment={}) for t in texts]
-batched = analyze_sentences(sentences)
-print("\n\n\nBatched sentence sentiments:")
-for s in batched:
-    print(s.text, s.sentiment)
-
-sentences = [Sentence(text=t, speaker="", sentiment={}) for t in texts]
-# Compute overall conversation score
-overall = analyze_conversation(sentences)
-print("\n\n\nConversation sentiment (weighted avg):", overall)
\ No newline at end of file
+if __name__ == "__main__":
+    texts = [
+        "I love spending time with my family.",
+        "I went to the store to buy some bread.",
+        "I feel unsafe and scared right now.",
+        "I love the food, but the service is terrible.",
+        "Im so so so so so sad and upset and sad!!!",
+    ]
+    for t in texts:
+        print(t)
+        print(analyze_sentiment(t))
+
+    sentences = [Sentence(text=t, speaker="", sentiment={}) for t in texts]
+    batched = analyze_sentences(sentences)
+    print("\n\n\nBatched sentence sentiments:")
+    for s in batched:
+        print(s.text, s.sentiment)
+
+    sentences = [Sentence(text=t, speaker="", sentiment={}) for t in texts]
+    # Compute overall conversation score
+    overall = analyze_conversation(sentences)
+    print("\n\n\nConversation sentiment (weighted avg):", overall)
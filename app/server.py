@@ -1,42 +1,88 @@
-from flask import Flask, jsonify
+import time
+from functools import partial
+from flask import Blueprint, Flask, Response, jsonify, request, stream_with_context
 from flask_cors import CORS
+from pymongo.errors import PyMongoError
 from handle_data import (
     get_all_conversations,
     get_all_people,
+    get_conversation_by_id,
+    get_conversation_sentences,
+    get_flagged_sentences,
+    get_sentence,
     get_person_by_name,
-    get_conversations_by_person,  # not used anymore, but leaving import
-    add_conversation, update_person_conversations_by_id
+    get_person_overview,
+    get_conversations_by_person,
+    get_flag_counts,
+    get_person_ids,
+    search_sentences,
+    get_people_page,
+    get_conversations_page,
+    iter_people,
+    iter_conversations,
+    encode_json,
+    store_conversation,
+    find_duplicate_conversation,
+    ensure_indexes
 )
-from parse import srt_to_conversation_rnbrad, srt_text
-
-app = Flask(__name__)
-CORS(app)
+from parse import parse_conversation, score_conversation, resolve_speakers_rnbrad, srt_hash
+from jobs import IngestQueue, QueueFull
+from speakers import DEFAULT_DEVICE, registry as speaker_registry
+from cache import cached, response_cache
+from events import bus as event_bus, publish_flags
+from live import ConversationNotOpen, append_segments, close_live_conversation, open_live_conversation
+from db import ping, pool_stats
+from rollups import get_trend
+from audio_store import clip_wav, get_recording
+import metrics
+import request_args
+from sentiment import load_analyzer, sentiment_cache_stats
+
+# Routes are registered on a blueprint; create_app() builds the Flask app without any I/O
+api = Blueprint("api", __name__)
+
+def create_app() -> Flask:
+    """Build the Flask app. No database or model work happens here (see warm_up)."""
+    app = Flask(__name__)
+    CORS(app)
+    metrics.init_app(app)
+    app.register_blueprint(api)
+    return app
+
+def warm_up(app: Flask = None) -> dict:
+    """
+    Do the expensive one-time work up front instead of in the first requests:
+    connect to MongoDB, ensure indexes and load the VADER lexicon.
+    A database that is not reachable yet is logged, not fatal; queries connect lazily later.
+
+    Returns:
+        dict: Seconds spent in each step.
+    """
+    timings = {}
+    start = time.perf_counter()
+    load_analyzer()
+    timings["sentiment"] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    try:
+        ping()
+        ensure_indexes()
+    except PyMongoError as e:
+        if app is not None:
+            app.logger.warning("MongoDB warm-up failed: %s", e)
+    timings["database"] = time.perf_counter() - start
+    return timings
 
 def count_flags_for_person(person_name: str) -> int:
-    person = get_person_by_name(person_name)
-    if not person:
+    counts = get_flag_counts([person_name])
+    if person_name not in counts:
         return -1  # person not found
 
-    # Get conversation IDs stored on this person
-    conversation_ids = person.get("conversations", [])
-    
-    # Pull all conversations and filter by those IDs
-    all_conversations = get_all_conversations()
-    person_conversations = [
-        conv for conv in all_conversations
-        if str(conv.get("_id")) in [str(cid) for cid in conversation_ids]
-    ]
-
-    # Count flags
-    total_flags = sum(len(conv.get("flags", [])) for conv in person_conversations)
-    return total_flags
-
-@app.route('/new-audio')
-def handle():
-    # process audio and return srt as string
-    
-    # parse string and store conversation in db
-    conversation = srt_to_conversation_rnbrad(srt_text="""1
+    # Counter is kept up to date by store_conversation
+    return counts[person_name]
+
+# Transcript ingested by GET /new-audio
+SAMPLE_SRT = """1
 00:00:00,000 --> 00:00:03,000
 Speaker 0: Could you please help me get up?
 
@@ -129,55 +175,347 @@ Speaker 0: Please let me call my daughter.
 
 24
 00:01:02,200 --> 00:01:04,000
-Speaker 1: Call her yourself. I told you the phone line is for emergencies not for whining.""")
-    success = add_conversation(conversation)
-
-    # add conversation to all participants
-    for participant in conversation.participants:
-        update_person_conversations_by_id(participant, conversation._id)
-    
-    if(success):   return f"Conversation file successfully added", 200
-    else: return "Error uploading conversation file"
+Speaker 1: Call her yourself. I told you the phone line is for emergencies not for whining."""
+
+def wants_summary() -> bool:
+    """True when the client asked for ?view=summary (conversations without sentences)."""
+    return request.args.get("view") == "summary"
+
+def json_response(obj, status: int = 200):
+    """Return fast-path (fast=True) fetch results as a JSON response."""
+    return Response(encode_json(obj), status=status, mimetype="application/json")
+
+def ndjson_response(docs):
+    """Stream an iterable of fast-path (fast=True) documents as newline-delimited JSON."""
+    def generate():
+        for doc in docs:
+            yield encode_json(doc)
+    return Response(stream_with_context(generate()), mimetype="application/x-ndjson")
+
+def list_response(iter_all, get_page):
+    """
+    Shared handling for the list endpoints:
+    ?format=ndjson streams every document, ?limit=/?after= returns one keyset page,
+    otherwise the full list is returned as before.
+    """
+    if request.args.get("format") == "ndjson":
+        return ndjson_response(iter_all())
+
+    try:
+        page = request_args.page_args(request.args)
+        if page is None:
+            return None
+        items, next_cursor = get_page(*page)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    return json_response({"items": items, "next": next_cursor})
+
+# Stages run by the ingestion workers for every uploaded transcript
+# (an upload is (srt, device, content_hash, idempotency_key))
+def parse_upload(upload):
+    srt, device, _, _ = upload
+    return parse_conversation(srt, resolve_speakers_rnbrad(device)), upload
+
+def score_upload(parsed):
+    conversation, upload = parsed
+    return score_conversation(conversation, speaker_registry.roles(upload[1])), upload
+
+def persist_conversation(scored):
+    conversation, (_, _, content_hash, idempotency_key) = scored
+    if not store_conversation(conversation, content_hash, idempotency_key):
+        # Lost the race against an identical upload handled elsewhere
+        existing = find_duplicate_conversation(content_hash, idempotency_key)
+        if existing:
+            return existing
+        raise RuntimeError("Error uploading conversation file")
+    publish_flags(conversation._id, conversation.sentences, conversation.flags, conversation.participants)
+    return conversation._id
+
+ingest_queue = IngestQueue([
+    ("parse", parse_upload),
+    ("score", score_upload),
+    ("persist", persist_conversation),
+])
+
+@api.route('/new-audio', methods=['GET', 'POST'])
+def handle():
+    # process audio and return srt as string
+    # (POST an SRT body; GET ingests the sample transcript)
+    srt = request.get_data(as_text=True) if request.method == 'POST' else SAMPLE_SRT
+    # ?device= selects the room's speaker mapping
+    device = request.args.get("device", DEFAULT_DEVICE)
+    # Retried uploads (same Idempotency-Key header, or the same transcript) return the stored conversation
+    try:
+        key = request_args.idempotency_key(request.headers)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    content_hash = srt_hash(srt)
+    existing = find_duplicate_conversation(content_hash, key)
+    if existing:
+        return (jsonify({"status": "done", "result": str(existing), "duplicate": True}), 200,
+                {"Location": f"/conversation/{existing}"})
+
+    # parse, score and store the conversation in the background
+    try:
+        job = ingest_queue.submit((srt, device, content_hash, key), key=key or content_hash)
+    except QueueFull as e:
+        return jsonify({"error": str(e)}), 503, {"Retry-After": "5"}
+
+    return jsonify(job.to_dict()), 202, {"Location": f"/jobs/{job.id}"}
+
+# /jobs/<job_id> endpoint to return the status, stage timings and error of an ingestion job
+@api.route('/jobs/<job_id>')
+def job_status(job_id):
+    job = ingest_queue.get(job_id)
+    if not job:
+        return jsonify({"error": f"Job '{job_id}' not found"}), 404
+    return jsonify(job.to_dict())
+
+# /live/conversations endpoint to open a conversation that transcript segments are appended to
+@api.route('/live/conversations', methods=['POST'])
+def live_open():
+    conv_id = open_live_conversation(request.args.get("device", DEFAULT_DEVICE))
+    return jsonify({"_id": conv_id}), 201, {"Location": f"/conversation/{conv_id}"}
+
+# /live/conversations/<conv_id>/segments endpoint to score and append segments as they arrive
+# (JSON segment or list of segments, or an SRT snippet as the body)
+@api.route('/live/conversations/<conv_id>/segments', methods=['POST'])
+def live_append(conv_id):
+    try:
+        if request.is_json:
+            result = append_segments(conv_id, segments=request_args.segments_body(request.get_json()))
+        else:
+            result = append_segments(conv_id, srt_text=request.get_data(as_text=True))
+    except ConversationNotOpen:
+        return jsonify({"error": f"Conversation '{conv_id}' not found or already closed"}), 409
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    return jsonify(result)
+
+# /live/conversations/<conv_id>/close endpoint to finalize a conversation's sentiment
+@api.route('/live/conversations/<conv_id>/close', methods=['POST'])
+def live_close(conv_id):
+    sentiment = close_live_conversation(conv_id)
+    if sentiment is None:
+        return jsonify({"error": f"Conversation '{conv_id}' not found or already closed"}), 409
+    return jsonify({"_id": conv_id, "sentiment": sentiment})
+
+# Seconds between keep-alive comments on idle event streams
+EVENT_KEEPALIVE = 15
+
+# /events endpoint to stream flag alerts as Server-Sent Events
+# (?person=a,b limits the stream to those people; Last-Event-ID resumes after a reconnect)
+@api.route('/events')
+def events():
+    person_ids = None
+    if request.args.get("person"):
+        names = request_args.split_names(request.args["person"])
+        found = get_person_ids(names)
+        missing = request_args.first_missing(names, found)
+        if missing:
+            return jsonify(request_args.person_not_found(missing)), 404
+        person_ids = list(found.values())
+
+    subscription = event_bus.subscribe(person_ids, request_args.last_event_id(request.headers, request.args))
+
+    def stream():
+        try:
+            yield "retry: 3000\n\n"
+            while True:
+                pending = subscription.get(timeout=EVENT_KEEPALIVE)
+                if not pending:
+                    yield ": keep-alive\n\n"
+                for event in pending:
+                    yield request_args.sse_message(event)
+        finally:
+            subscription.close()
+
+    return Response(stream_with_context(stream()), mimetype="text/event-stream",
+                    headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
 
 # /people endpoint to return all people and data attached directly to their objects (name, role, conversations)
-@app.route('/people')
+@api.route('/people')
+@cached("people")
 def people():
-    return get_all_people()
+    paged = list_response(partial(iter_people, fast=True), partial(get_people_page, fast=True))
+    return paged if paged is not None else json_response(get_all_people(fast=True))
 
 # /conversations endpoint to return all conversations and data attached directly to their objects (participants, sentences, flags)
-@app.route('/conversations')
+@api.route('/conversations')
+@cached("conversations")
 def conversations():
-    return get_all_conversations()
+    summary = wants_summary()
+    paged = list_response(partial(iter_conversations, summary=summary, fast=True),
+                          partial(get_conversations_page, summary=summary, fast=True))
+    return paged if paged is not None else json_response(get_all_conversations(summary, fast=True))
 
 # /person/<person_name> endpoint to return a single person by name
-@app.route('/person/<person_name>')
+@api.route('/person/<person_name>')
+@cached("person:{person_name}")
 def person_detail(person_name):
-    return get_person_by_name(person_name) 
+    person = get_person_by_name(person_name, fast=True)
+    if not person:
+        return jsonify({"error": f"Person '{person_name}' not found"}), 404
+    return json_response(person)
+
+# /person/<person_name>/overview endpoint to return what the person page shows in one request
+# (the person, their flag total and their conversations; sentences only with ?view=full)
+@api.route('/person/<person_name>/overview')
+@cached("person:{person_name}")
+def person_overview(person_name):
+    overview = get_person_overview(person_name, summary=request.args.get("view") != "full")
+    if not overview:
+        return jsonify({"error": f"Person '{person_name}' not found"}), 404
+    return json_response(overview)
 
 # /conversation/<conv_id> endpoint to return a single conversation by ID
-@app.route('/conversation/<conv_id>')
+@api.route('/conversation/<conv_id>')
+@cached("conversations")
 def conversation_detail(conv_id):
-    # fetch one conversation by ID
-    conv = next((c for c in get_all_conversations() if str(c.get("_id")) == conv_id), None)
+    # fetch one conversation by ID (malformed ids are treated as not found)
+    conv = get_conversation_by_id(conv_id, wants_summary(), fast=True)
     if not conv:
         return jsonify({"error": f"Conversation '{conv_id}' not found"}), 404
-    return jsonify(conv)
+    return json_response(conv)
+
+# /conversation/<conv_id>/sentences endpoint to return a page of a conversation's sentences
+# (?offset=&limit=, optionally restricted to an ISO ?start=/?end= window)
+@api.route('/conversation/<conv_id>/sentences')
+def conversation_sentences(conv_id):
+    try:
+        page = get_conversation_sentences(conv_id, **request_args.sentences_args(request.args))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    if page is None:
+        return jsonify({"error": f"Conversation '{conv_id}' not found"}), 404
+    return jsonify(page)
+
+# /conversation/<conv_id>/flagged endpoint to return every flagged sentence of a conversation
+# (however much of the transcript the client has paged in)
+@api.route('/conversation/<conv_id>/flagged')
+@cached("conversations")
+def conversation_flagged(conv_id):
+    flagged = get_flagged_sentences(conv_id)
+    if flagged is None:
+        return jsonify({"error": f"Conversation '{conv_id}' not found"}), 404
+    return jsonify(flagged)
+
+# /conversation/<conv_id>/audio/<sentence_id> endpoint to play the audio behind one sentence
+# (a WAV clip; Range requests are answered from the stored segments without loading the recording)
+@api.route('/conversation/<conv_id>/audio/<sentence_id>')
+def sentence_audio(conv_id, sentence_id):
+    sentence = get_sentence(conv_id, sentence_id)
+    if sentence is None:
+        return jsonify({"error": f"Sentence '{sentence_id}' not found"}), 404
+    recording = get_recording(sentence["audio_ref"]) if sentence.get("audio_ref") else None
+    if recording is None:
+        return jsonify({"error": f"No audio stored for sentence '{sentence_id}'"}), 404
+
+    status, headers, clip = request_args.audio_clip(recording, sentence, request.range)
+    if clip is None:
+        return Response(status=status, headers=headers)
+    return Response(clip_wav(recording, *clip), status=status,
+                    mimetype="audio/wav", headers=headers, direct_passthrough=True)
+
+# /search endpoint to find sentences by text, newest first
+# (?q= words and "phrases"; optional ?person= participant, ?speaker=, ISO ?start=/?end=,
+#  ?min_compound=/?max_compound= sentiment bounds, ?limit=/?offset=)
+@api.route('/search')
+@cached("conversations", "people")
+def search():
+    try:
+        query = request_args.search_query(request.args)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    names = request_args.search_names(request.args)
+    found = get_person_ids(names) if names else {}
+    missing = request_args.first_missing(names, found)
+    if missing:
+        return jsonify(request_args.person_not_found(missing)), 404
+
+    try:
+        page = search_sentences(query, **request_args.search_args(request.args, found))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    return jsonify({"query": query, **page})
+
+# /trends/<person_name> endpoint to return a person's daily or weekly sentiment buckets from the rollups
+# (?period=day|week, ISO ?start=/?end=, ?with=<name> for the buckets shared with another person)
+@api.route('/trends/<person_name>')
+@cached("person:{person_name}")
+def trends(person_name):
+    names = request_args.trend_names(person_name, request.args)
+    found = get_person_ids(names)
+    missing = request_args.first_missing(names, found)
+    if missing:
+        return jsonify(request_args.person_not_found(missing)), 404
+
+    try:
+        buckets = get_trend(**request_args.trend_args(person_name, request.args, found))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    return jsonify(request_args.trend_body(person_name, request.args, buckets))
 
 # /conversations/<person_name> endpoint to return all conversations for a given person
-@app.route('/conversations/<person_name>')
+@api.route('/conversations/<person_name>')
+@cached("person:{person_name}")
 def conversations_by_person(person_name):
-    return get_conversations_by_person(person_name)
+    return json_response(get_conversations_by_person(person_name, wants_summary(), fast=True))
 
 # /flags/<person_name> endpoint to return total number of flags across all conversations for a given person
-@app.route('/flags/<person_name>', methods=['GET'])
+@api.route('/flags/<person_name>', methods=['GET'])
 def flags_endpoint(person_name):
     total_flags = count_flags_for_person(person_name)
 
     if total_flags == -1:
-        return jsonify({"error": f"Person '{person_name}' not found"}), 404
+        return jsonify(request_args.person_not_found(person_name)), 404
 
     return jsonify({"person": person_name, "total_flags": total_flags})
 
+# /flags?names=a,b,c endpoint to return flag totals for several people in one round trip
+@api.route('/flags', methods=['GET'])
+def flags_batch_endpoint():
+    names = request_args.split_names(request.args.get("names"))
+    counts = get_flag_counts(names)
+    return jsonify({
+        "total_flags": counts,
+        "not_found": [n for n in names if n not in counts]
+    })
+
+
+# /stats endpoint to return this worker process's MongoDB pool and cache statistics, for sizing workers
+@api.route('/stats')
+def stats():
+    return jsonify({
+        "mongo_pool": pool_stats.to_dict(),
+        "response_cache": response_cache.stats(),
+        "sentiment_cache": sentiment_cache_stats(),
+        "ingest_pending": ingest_queue.pending(),
+    })
+
+
+# /metrics endpoint to return request/stage latency histograms and counters in Prometheus text format
+@api.route('/metrics')
+def metrics_endpoint():
+    return Response(metrics.registry.render(), mimetype="text/plain; version=0.0.4")
+
+# Point-in-time values scraped along with the histograms
+metrics.registry.gauge("elderguardian_mongo_pool_connections", "MongoDB pool connections of this process.",
+                       lambda: {("open",): pool_stats.to_dict()["open"],
+                                ("checked_out",): pool_stats.to_dict()["checked_out"]}, ("state",))
+metrics.registry.gauge("elderguardian_cache_lookups_total", "Cache lookups since start.",
+                       lambda: {(name, result): stats[result]
+                                for name, stats in (("response", response_cache.stats()),
+                                                    ("sentiment", sentiment_cache_stats()))
+                                for result in ("hits", "misses")}, ("cache", "result"), type="counter")
+metrics.registry.gauge("elderguardian_ingest_jobs_pending", "Uploads waiting for an ingest worker.",
+                       lambda: {(): ingest_queue.pending()})
+
+
+# WSGI entry point, e.g. `gunicorn server:app` (see gunicorn.conf.py for per-worker warm-up)
+app = create_app()
 
 if __name__ == '__main__':
+    warm_up(app)
     app.run(debug=True)
\ No newline at end of file
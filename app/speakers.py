@@ -0,0 +1,98 @@
+"""
+speakers.py
+-----------
+Registry mapping (device/room, diarized speaker label) -> Person._id.
+
+Mappings live in the Speakers collection and are cached per device, so the
+ingest hot path does no People/Speakers lookups. Whenever a person's name or
+role changes, or a mapping is set, handle_data bumps the shared "speakers"
+version counter (cache.versions) and drops this process's cache. Every
+worker compares the counter on each lookup (one small _id read), so no
+worker keeps using a stale mapping; the TTL is a backstop for writes made
+outside handle_data.
+
+Devices without their own mappings fall back to the default device, which
+keeps the original "Speaker 0 -> Ryan, Speaker 1 -> Brad" behaviour.
+"""
+import os
+import threading
+import time
+from typing import Dict, Tuple
+
+from bson import ObjectId
+
+import handle_data
+from cache import versions
+
+DEFAULT_DEVICE = "default"
+# Used for the default device when it has no Speakers entries
+DEFAULT_SPEAKER_NAMES = {"Speaker 0": "Ryan", "Speaker 1": "Brad"}
+# Seconds a device's mapping is trusted before it is reloaded
+SPEAKER_CACHE_TTL = float(os.getenv("SPEAKER_CACHE_TTL", "300"))
+
+
+class SpeakerRegistry:
+    """Versioned TTL cache in front of the Speakers collection."""
+
+    def __init__(self, ttl: float = SPEAKER_CACHE_TTL):
+        self.ttl = ttl
+        self._cache: Dict[str, Tuple[float, tuple, dict, dict]] = {}  # device -> (expiry, version, map, roles)
+        self._generation = 0  # bumped by invalidate(), so a load that overlaps it is not kept
+        self._lock = threading.Lock()
+
+    def resolve(self, device: str = DEFAULT_DEVICE) -> Dict[str, ObjectId]:
+        """
+        Return the label -> Person._id map for a device.
+
+        Raises:
+            ValueError: If neither the device nor the default device has speakers.
+        """
+        return self._entry(device)[0]
+
+    def roles(self, device: str = DEFAULT_DEVICE) -> Dict[ObjectId, str]:
+        """Return Person._id -> role for every person mapped on a device."""
+        return self._entry(device)[1]
+
+    def invalidate(self):
+        """Drop every cached mapping of this process (other processes see the shared version)."""
+        with self._lock:
+            self._cache.clear()
+            self._generation += 1
+
+    def _entry(self, device: str) -> Tuple[dict, dict]:
+        now = time.monotonic()
+        # Taken before loading, so a change made while loading makes the result stale
+        version = versions.snapshot(["speakers"])
+        with self._lock:
+            cached = self._cache.get(device)
+            generation = self._generation
+        if cached and cached[0] > now and cached[1] == version:
+            return cached[2], cached[3]
+
+        speaker_map, roles = self._load(device)
+        with self._lock:
+            if self._generation == generation:
+                self._cache[device] = (now + self.ttl, version, speaker_map, roles)
+        return speaker_map, roles
+
+    def _load(self, device: str) -> Tuple[dict, dict]:
+        speaker_map = {d["label"]: d["person"] for d in handle_data.speakers.find({"device": device})}
+        if speaker_map:
+            person_docs = handle_data.people.find({"_id": {"$in": list(speaker_map.values())}}, {"role": 1})
+            return speaker_map, {p["_id"]: p.get("role", "") for p in person_docs}
+
+        if device != DEFAULT_DEVICE:
+            return self._entry(DEFAULT_DEVICE)
+
+        person_docs = {
+            p["name"]: p
+            for p in handle_data.people.find({"name": {"$in": list(DEFAULT_SPEAKER_NAMES.values())}}, {"name": 1, "role": 1})
+        }
+        if len(person_docs) < len(set(DEFAULT_SPEAKER_NAMES.values())):
+            raise ValueError("Ryan or Brad not found in MongoDB People collection.")
+        speaker_map = {label: person_docs[name]["_id"] for label, name in DEFAULT_SPEAKER_NAMES.items()}
+        return speaker_map, {p["_id"]: p.get("role", "") for p in person_docs.values()}
+
+
+registry = SpeakerRegistry()
+handle_data.person_change_listeners.append(registry.invalidate)
@@ -0,0 +1,157 @@
+"""
+bench_async_server.py
+---------------------
+The Flask app (server.py under gunicorn) against its ASGI variant
+(async_server.py under hypercorn), side by side, at increasing numbers of
+concurrent clients:
+
+  * flask: gunicorn server:app, --workers processes x --threads threads
+  * async: hypercorn async_server:app, --workers processes, one event loop each
+
+Both servers get the same number of processes and talk to the same
+synthetic database (synthetic.populate), with the response cache off so every
+request reaches MongoDB. Each client thread sends requests over its own
+keep-alive connection, cycling through the endpoints the person page and the
+conversation view use:
+
+    /person/<name>/overview, /conversations/<name>?view=summary, /conversation/<id>
+
+Requests per second, latency percentiles and errors are reported per server
+and concurrency level. Needs a MongoDB server (--uri), plus gunicorn and
+hypercorn on PATH.
+
+    python benchmarks/bench_async_server.py --uri mongodb://localhost:27017 --concurrency 1,8,32,128
+"""
+import argparse
+import http.client
+import os
+import random
+import statistics
+import subprocess
+import sys
+import threading
+import time
+
+from pymongo import MongoClient
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import synthetic  # noqa: E402
+
+APP_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "app")
+
+
+def start_server(kind: str, port: int, args) -> subprocess.Popen:
+    env = dict(os.environ, MONGO_DB_KEY=args.uri, MONGO_DB_NAME=args.db, RESPONSE_CACHE_BYTES="0",
+               BIND=f"127.0.0.1:{port}", WEB_CONCURRENCY=str(args.workers), GUNICORN_THREADS=str(args.threads))
+    if kind == "flask":
+        cmd = ["gunicorn", "server:app"]  # bind, workers and threads come from gunicorn.conf.py
+    else:
+        cmd = ["hypercorn", "async_server:app", "--bind", f"127.0.0.1:{port}", "--workers", str(args.workers)]
+    proc = subprocess.Popen(cmd, cwd=APP_DIR, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        try:
+            conn = http.client.HTTPConnection("127.0.0.1", port, timeout=1)
+            conn.request("GET", "/stats")
+            if conn.getresponse().status == 200:
+                return proc
+        except OSError:
+            time.sleep(0.2)
+    proc.terminate()
+    raise SystemExit(f"{kind} server did not start on port {port}")
+
+
+def stop_server(proc: subprocess.Popen):
+    proc.terminate()
+    try:
+        proc.wait(timeout=10)
+    except subprocess.TimeoutExpired:
+        proc.kill()
+
+
+def run_load(port: int, paths: list, clients: int, seconds: float, seed: int) -> dict:
+    """Send requests from `clients` threads for `seconds`; return latencies (s) and error count."""
+    latencies, errors = [], [0]
+    lock = threading.Lock()
+    deadline = time.monotonic() + seconds
+
+    def client(n: int):
+        rng = random.Random(seed + n)
+        conn = http.client.HTTPConnection("127.0.0.1", port, timeout=30)
+        own = []
+        while time.monotonic() < deadline:
+            start = time.perf_counter()
+            try:
+                conn.request("GET", rng.choice(paths))
+                response = conn.getresponse()
+                response.read()
+                ok = response.status == 200
+            except (OSError, http.client.HTTPException):
+                conn.close()
+                conn = http.client.HTTPConnection("127.0.0.1", port, timeout=30)
+                ok = False
+            if ok:
+                own.append(time.perf_counter() - start)
+            else:
+                with lock:
+                    errors[0] += 1
+        conn.close()
+        with lock:
+            latencies.extend(own)
+
+    threads = [threading.Thread(target=client, args=(n,)) for n in range(clients)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return {"latencies": latencies, "errors": errors[0]}
+
+
+def percentile(values: list, p: float) -> float:
+    if not values:
+        return float("nan")
+    return statistics.quantiles(values, n=100, method="inclusive")[int(p) - 1] if len(values) > 1 else values[0]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--uri", default="mongodb://localhost:27017")
+    parser.add_argument("--db", default="ElderDataBench")
+    parser.add_argument("--people", type=int, default=20)
+    parser.add_argument("--conversations", type=int, default=2000)
+    parser.add_argument("--sentences", type=int, default=50, help="sentences per conversation")
+    parser.add_argument("--concurrency", default="1,8,32,128", help="comma-separated numbers of concurrent clients")
+    parser.add_argument("--seconds", type=float, default=10, help="duration of each measurement")
+    parser.add_argument("--workers", type=int, default=2, help="server processes, for both servers")
+    parser.add_argument("--threads", type=int, default=4, help="threads per gunicorn worker")
+    parser.add_argument("--port", type=int, default=5055)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    client = MongoClient(args.uri)
+    persons, convos = synthetic.populate(client[args.db], args.seed, args.people, args.conversations, args.sentences)
+    paths = ([f"/person/{p.name}/overview" for p in persons]
+             + [f"/conversations/{p.name}?view=summary" for p in persons]
+             + [f"/conversation/{c._id}" for c in random.Random(args.seed).sample(convos, min(len(convos), 200))])
+
+    levels = sorted(int(c) for c in args.concurrency.split(","))
+    print(f"{'server':>6} {'clients':>8} {'req/s':>9} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'errors':>7}")
+    for kind in ("flask", "async"):
+        proc = start_server(kind, args.port, args)
+        try:
+            run_load(args.port, paths, min(levels), 1, args.seed)  # warm the connection pools
+            for clients in levels:
+                result = run_load(args.port, paths, clients, args.seconds, args.seed)
+                lat = result["latencies"]
+                print(f"{kind:>6} {clients:>8} {len(lat) / args.seconds:9.1f} {percentile(lat, 50) * 1000:8.1f} "
+                      f"{percentile(lat, 95) * 1000:8.1f} {percentile(lat, 99) * 1000:8.1f} {result['errors']:>7}")
+        finally:
+            stop_server(proc)
+
+    for name in ("People", "Conversations", "Speakers"):
+        client[args.db][name].drop()
+
+
+if __name__ == "__main__":
+    main()
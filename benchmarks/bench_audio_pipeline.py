@@ -0,0 +1,90 @@
+"""
+bench_audio_pipeline.py
+-----------------------
+Throughput of audio.AudioPipeline against running the same stages one chunk
+at a time, on a synthetic WAV recording with the fake transcription backend:
+
+  * serial:    decode -> transcribe -> parse -> score, chunk after chunk
+  * pipelined: the stages overlapped through bounded queues
+
+--rtf sets the simulated transcription cost (seconds per second of audio);
+the fake backend sleeps for it, like a model running outside the GIL. Both
+runs are checked to produce the same sentences and flags. No database is needed.
+
+    python benchmarks/bench_audio_pipeline.py --seconds 1800 --rtf 0.01 --workers 2
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+import wave
+from datetime import datetime
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "app"))
+
+from bson import ObjectId  # noqa: E402
+
+import audio  # noqa: E402
+
+
+def write_wav(path: str, seconds: int, seed: int):
+    """Low-level noise, one second of frames at a time."""
+    rng = random.Random(seed)
+    with wave.open(path, "wb") as w:
+        w.setnchannels(1)
+        w.setsampwidth(2)
+        w.setframerate(audio.SAMPLE_RATE)
+        for _ in range(seconds):
+            w.writeframes(rng.randbytes(2 * audio.SAMPLE_RATE))
+
+
+def run_serial(path: str, backend, chunk_seconds: float, speaker_map: dict, start: datetime):
+    scorer = audio.ChunkScorer()
+    for chunk in audio.decode_chunks(path, chunk_seconds):
+        scorer.add(audio.chunk_sentences(chunk, backend.transcribe(chunk), speaker_map, start))
+    return audio.build_conversation(scorer.sentences, scorer.flags, speaker_map, start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--seconds", type=int, default=1800, help="length of the synthetic recording")
+    parser.add_argument("--chunk-seconds", type=float, default=30)
+    parser.add_argument("--rtf", type=float, default=0.01, help="simulated transcription seconds per audio second")
+    parser.add_argument("--workers", type=int, default=2, help="transcription threads in the pipelined run")
+    parser.add_argument("--queue-size", type=int, default=4)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    speaker_map = {"Speaker 0": ObjectId(), "Speaker 1": ObjectId()}
+    start = datetime(2025, 1, 1)
+    backend = audio.FakeBackend(realtime_factor=args.rtf)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "recording.wav")
+        write_wav(path, args.seconds, args.seed)
+
+        t = time.perf_counter()
+        serial = run_serial(path, backend, args.chunk_seconds, speaker_map, start)
+        serial_time = time.perf_counter() - t
+
+        pipeline = audio.AudioPipeline(backend, args.chunk_seconds, args.queue_size, args.workers)
+        t = time.perf_counter()
+        piped = pipeline.run(path, speaker_map, start)
+        piped_time = time.perf_counter() - t
+
+    same = ([(s.text, s.start_time, s.flag_rules) for s in serial.sentences]
+            == [(s.text, s.start_time, s.flag_rules) for s in piped.sentences])
+    if not same:
+        raise SystemExit("Serial and pipelined runs produced different conversations")
+
+    print(f"{args.seconds}s of audio, {len(piped.sentences)} sentences, {len(piped.flags)} flagged")
+    print(f"   serial: {serial_time:7.2f}s ({args.seconds / serial_time:7.1f}x realtime)")
+    print(f"pipelined: {piped_time:7.2f}s ({args.seconds / piped_time:7.1f}x realtime), "
+          f"{serial_time / piped_time:.2f}x faster")
+    print("     busy: " + ", ".join(f"{name} {s:.2f}s" for name, s in pipeline.stats["stages"].items()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,111 @@
+"""
+bench_conversation_lookup.py
+----------------------------
+Compare the cost of fetching one conversation for /conversation/<conv_id>
+as the Conversations collection grows:
+
+  * scan:   the old path (serialize every conversation, search in Python)
+  * lookup: handle_data.get_conversation_by_id (indexed _id lookup)
+
+Run against a scratch database on a local mongod:
+
+    python benchmarks/bench_conversation_lookup.py --uri mongodb://localhost:27017
+
+--mock runs against mongomock instead. mongomock has no real indexes, so
+that mode is only useful to smoke-test the script.
+"""
+import argparse
+import os
+import random
+import sys
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "app"))
+
+import db  # noqa: E402
+import handle_data  # noqa: E402
+from models import Conversation, Sentence  # noqa: E402
+
+
+def make_conversation(rng: random.Random, participants, sentence_count: int) -> dict:
+    start = datetime(2025, 1, 1) + timedelta(minutes=rng.randint(0, 500_000))
+    sentences = [
+        Sentence(
+            speaker=rng.choice(participants),
+            text=f"synthetic sentence {i}",
+            sentiment={"neg": 0.0, "neu": 1.0, "pos": 0.0, "compound": 0.0},
+            start_time=start + timedelta(seconds=i),
+            total_time=1,
+        )
+        for i in range(sentence_count)
+    ]
+    return Conversation(
+        participants=list(participants),
+        start_time=start,
+        total_time=sentence_count,
+        sentences=sentences,
+        sentiment=0.0,
+    ).to_dict()
+
+
+def time_per_call(fn, ids, repeat: int) -> float:
+    """Return the mean wall time of fn(conv_id) in milliseconds."""
+    start = time.perf_counter()
+    for i in range(repeat):
+        fn(ids[i % len(ids)])
+    return (time.perf_counter() - start) / repeat * 1000
+
+
+def scan_lookup(conv_id: str):
+    return next((c for c in handle_data.get_all_conversations() if str(c.get("_id")) == conv_id), None)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--uri", default="mongodb://localhost:27017")
+    parser.add_argument("--db", default="ElderDataBench")
+    parser.add_argument("--mock", action="store_true", help="use mongomock instead of a real server")
+    parser.add_argument("--sizes", default="100,1000,10000", help="comma-separated collection sizes")
+    parser.add_argument("--sentences", type=int, default=50, help="sentences per conversation")
+    parser.add_argument("--repeat", type=int, default=200, help="lookups per measurement")
+    parser.add_argument("--scan-limit", type=int, default=1000, help="skip the scan path above this size")
+    args = parser.parse_args()
+
+    if args.mock:
+        import mongomock
+        client = mongomock.MongoClient()
+    else:
+        from pymongo import MongoClient
+        client = MongoClient(args.uri)
+
+    db.use_database(client[args.db])
+    handle_data.conversations.drop()
+    handle_data.people.drop()
+    handle_data.ensure_indexes()
+
+    rng = random.Random(42)
+    participants = [handle_data.ObjectId(), handle_data.ObjectId()]
+    ids = []
+
+    print(f"{'conversations':>14} {'scan ms':>10} {'lookup ms':>10}")
+    for size in sorted(int(s) for s in args.sizes.split(",")):
+        batch = [make_conversation(rng, participants, args.sentences) for _ in range(size - len(ids))]
+        if batch:
+            handle_data.conversations.insert_many(batch)
+            ids.extend(str(doc["_id"]) for doc in batch)
+
+        sample = rng.sample(ids, min(len(ids), 50))
+        lookup_ms = time_per_call(handle_data.get_conversation_by_id, sample, args.repeat)
+        if size <= args.scan_limit:
+            scan_ms = f"{time_per_call(scan_lookup, sample, max(args.repeat // 20, 1)):10.3f}"
+        else:
+            scan_ms = f"{'skipped':>10}"
+        print(f"{size:>14} {scan_ms} {lookup_ms:10.3f}")
+
+    handle_data.conversations.drop()
+    handle_data.people.drop()
+
+
+if __name__ == "__main__":
+    main()
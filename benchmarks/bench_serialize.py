@@ -0,0 +1,94 @@
+"""
+bench_serialize.py
+------------------
+Throughput of turning raw Conversation documents into JSON response bytes:
+
+  * models: Conversation.from_dict -> serialize_conversation -> jsonify
+  * fast:   handle_data.fast_conversation -> encode_json
+
+Both paths are checked to produce identical bytes before timing.
+No database is needed; documents are generated in memory.
+
+    python benchmarks/bench_serialize.py --sentences 2000 --docs 50
+"""
+import argparse
+import os
+import random
+import sys
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "app"))
+
+from bson import ObjectId  # noqa: E402
+from flask import Flask  # noqa: E402
+
+import handle_data  # noqa: E402
+from models import Conversation, Sentence  # noqa: E402
+
+
+def make_document(rng: random.Random, sentence_count: int) -> dict:
+    speakers = [ObjectId(), ObjectId()]
+    start = datetime(2025, 1, 1) + timedelta(minutes=rng.randint(0, 500_000))
+    sentences = []
+    for i in range(sentence_count):
+        compound = round(rng.uniform(-1, 1), 4)
+        sentences.append(Sentence(
+            speaker=rng.choice(speakers),
+            text=" ".join(rng.choice(["I", "you", "need", "help", "fine", "today", "please", "stop"])
+                          for _ in range(rng.randint(3, 15))),
+            sentiment={"neg": 0.1, "neu": 0.8, "pos": 0.1, "compound": compound},
+            start_time=start + timedelta(seconds=2 * i),
+            total_time=2,
+        ))
+    return Conversation(
+        participants=speakers,
+        start_time=start,
+        total_time=2 * sentence_count,
+        sentences=sentences,
+        flags=[s._id for s in sentences[::25]],
+        sentiment=0.1,
+    ).to_dict()
+
+
+def run(label: str, fn, docs, repeat: int) -> float:
+    start = time.perf_counter()
+    for _ in range(repeat):
+        fn(docs)
+    elapsed = time.perf_counter() - start
+    rate = len(docs) * repeat / elapsed
+    print(f"{label:>8}: {rate:10.1f} docs/s")
+    return rate
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--docs", type=int, default=50, help="conversations per response")
+    parser.add_argument("--sentences", type=int, default=2000, help="sentences per conversation")
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    rng = random.Random(42)
+    docs = [make_document(rng, args.sentences) for _ in range(args.docs)]
+
+    app = Flask(__name__)
+
+    def models_path(raw_docs):
+        body = [handle_data.serialize_conversation(Conversation.from_dict(d)) for d in raw_docs]
+        with app.app_context():
+            return app.json.response(body).get_data()
+
+    def fast_path(raw_docs):
+        return handle_data.encode_json([handle_data.fast_conversation(d) for d in raw_docs])
+
+    if models_path(docs) != fast_path(docs):
+        sys.exit("fast path output differs from the model path")
+
+    print(f"{args.docs} conversations x {args.sentences} sentences")
+    slow = run("models", models_path, docs, args.repeat)
+    fast = run("fast", fast_path, docs, args.repeat)
+    print(f" speedup: {fast / slow:10.2f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,67 @@
+"""
+bench_startup.py
+----------------
+Worker startup cost, measured in fresh interpreters:
+
+  * import:     `import server` (must not touch the network or load models)
+  * create_app: server.create_app()
+  * warm_up:    server.warm_up() (VADER lexicon + MongoDB ping/indexes), with --warm-up
+
+Each step is timed in its own subprocess, --repeat times, and the median is
+reported. --json prints machine-readable results to track over time.
+
+    python benchmarks/bench_startup.py --repeat 5
+    python benchmarks/bench_startup.py --warm-up --json
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+APP_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "app")
+
+# Runs in the child interpreter; prints the elapsed seconds of each step as JSON
+CHILD = """
+import json, sys, time
+t0 = time.perf_counter()
+import server
+t1 = time.perf_counter()
+server.create_app()
+t2 = time.perf_counter()
+result = {"import": t1 - t0, "create_app": t2 - t1}
+if sys.argv[1] == "1":
+    result.update({"warm_up." + k: v for k, v in server.warm_up().items()})
+print(json.dumps(result))
+"""
+
+
+def measure(warm_up: bool) -> dict:
+    out = subprocess.run([sys.executable, "-c", CHILD, "1" if warm_up else "0"],
+                         cwd=APP_DIR, capture_output=True, text=True)
+    if out.returncode:
+        raise SystemExit(f"Startup failed:\n{out.stderr}")
+    return json.loads(out.stdout.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeat", type=int, default=5, help="fresh interpreters per measurement")
+    parser.add_argument("--warm-up", action="store_true", help="also time server.warm_up()")
+    parser.add_argument("--json", action="store_true", help="print results as JSON")
+    args = parser.parse_args()
+
+    runs = [measure(args.warm_up) for _ in range(args.repeat)]
+    results = {step: statistics.median(run[step] for run in runs) * 1000 for step in runs[0]}
+
+    if args.json:
+        print(json.dumps({"unit": "ms", "repeat": args.repeat, "median": results}, indent=2))
+        return
+    print(f"{'step':>22} {'median ms':>10}")
+    for step, ms in results.items():
+        print(f"{step:>22} {ms:10.1f}")
+
+
+if __name__ == "__main__":
+    main()
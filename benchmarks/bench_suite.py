@@ -0,0 +1,344 @@
+"""
+bench_suite.py
+--------------
+Benchmark suite over seeded synthetic data (see synthetic.py) covering:
+
+  * ingestion: srt_to_conversation_rnbrad, parse_conversation, store_conversation
+  * sentiment: analyze_sentiment (cold and warm cache), analyze_conversation
+  * handle_data fetch functions and serialize_* functions
+  * every Flask route, through the test client
+
+Runs against mongomock (--mock) or a local mongod (--uri; the --db database
+is dropped and refilled). Response caching is disabled unless
+--response-cache is given, so route timings measure the handlers.
+
+Results are written as JSON with --output. With --baseline, each benchmark's
+median is compared with a previous run and the exit status is 1 when any is
+more than --threshold slower.
+
+    python benchmarks/bench_suite.py --mock --output before.json
+    python benchmarks/bench_suite.py --mock --baseline before.json --threshold 0.2
+"""
+import argparse
+import fnmatch
+import json
+import os
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import time
+from datetime import datetime
+
+APP_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "app")
+sys.path.insert(0, APP_DIR)
+
+import db  # noqa: E402
+import handle_data  # noqa: E402
+import parse  # noqa: E402
+import sentiment  # noqa: E402
+import server  # noqa: E402
+from cache import response_cache  # noqa: E402
+from models import Sentence  # noqa: E402
+from speakers import registry as speaker_registry  # noqa: E402
+
+import synthetic  # noqa: E402
+
+
+class Suite:
+    """Runs benchmarks and collects per-call timings in milliseconds."""
+
+    def __init__(self, rounds: int, min_time: float, only: str = None):
+        self.rounds = rounds
+        self.min_time = min_time
+        self.only = only
+        self.results = {}
+
+    def selected(self, name: str) -> bool:
+        return not self.only or any(fnmatch.fnmatch(name, p) for p in self.only.split(","))
+
+    def autorange(self, fn) -> int:
+        """Smallest power-of-two call count whose batch takes min_time / rounds."""
+        number = 1
+        while number < 1_000_000:
+            start = time.perf_counter()
+            for _ in range(number):
+                fn()
+            if time.perf_counter() - start >= self.min_time / self.rounds:
+                break
+            number *= 2
+        return number
+
+    def bench(self, name: str, fn, number: int = None):
+        """Time fn(); stateful benchmarks pass a fixed number of calls per round."""
+        if not self.selected(name):
+            return
+        fn()  # warm-up (and fail fast)
+        if number is None:
+            number = self.autorange(fn)
+        per_call = []
+        for _ in range(self.rounds):
+            start = time.perf_counter()
+            for _ in range(number):
+                fn()
+            per_call.append((time.perf_counter() - start) / number * 1000)
+        self.results[name] = {
+            "median_ms": statistics.median(per_call),
+            "mean_ms": statistics.mean(per_call),
+            "min_ms": min(per_call),
+            "stdev_ms": statistics.stdev(per_call) if len(per_call) > 1 else 0.0,
+            "rounds": self.rounds,
+            "number": number,
+        }
+        print(f"{name:<58} {self.results[name]['median_ms']:12.4f} ms  (x{number})")
+
+    def supply(self, make, number: int):
+        """Iterator over enough pre-built arguments for a fixed-number benchmark."""
+        return iter([make() for _ in range(number * self.rounds + 1)])
+
+
+def bench_ingestion(suite: Suite, args):
+    srt = synthetic.make_srt(args.seed, args.sentences)
+    speaker_map = parse.resolve_speakers_rnbrad()
+    suite.bench("parse.srt_to_conversation_rnbrad", lambda: parse.srt_to_conversation_rnbrad(srt))
+    suite.bench("parse.parse_conversation", lambda: parse.parse_conversation(srt, speaker_map))
+
+    people = [p["_id"] for p in handle_data.people.find({}, {"_id": 1}).limit(2)]
+    rng = random.Random(args.seed + 1)
+    convos = suite.supply(lambda: synthetic.make_conversation(rng, people, args.sentences), args.write_number)
+    suite.bench("handle_data.store_conversation", lambda: handle_data.store_conversation(next(convos)),
+                number=args.write_number)
+
+
+def bench_sentiment(suite: Suite, args):
+    rng = random.Random(args.seed)
+    texts = [synthetic.make_text(rng) for _ in range(100)]
+    sentences = [Sentence(speaker=None, text=t, sentiment={}) for t in texts]
+
+    def cold(fn):
+        def run():
+            sentiment._cached_scores.cache_clear()
+            fn()
+        return run
+
+    analyze_all = lambda: [sentiment.analyze_sentiment(t) for t in texts]  # noqa: E731
+    suite.bench("sentiment.analyze_sentiment[100 texts, cold]", cold(analyze_all))
+    suite.bench("sentiment.analyze_sentiment[100 texts, warm]", analyze_all)
+    suite.bench("sentiment.analyze_conversation[100 sentences, cold]",
+                cold(lambda: sentiment.analyze_conversation(sentences)))
+
+
+def bench_fetch(suite: Suite, args, person: str, conv_id: str, names: list):
+    for fast in (False, True):
+        suffix = "[fast]" if fast else ""
+        suite.bench(f"handle_data.get_all_people{suffix}", lambda: handle_data.get_all_people(fast=fast))
+        suite.bench(f"handle_data.get_person_by_name{suffix}", lambda: handle_data.get_person_by_name(person, fast=fast))
+        for summary in (False, True):
+            view = suffix + ("[summary]" if summary else "")
+            suite.bench(f"handle_data.get_all_conversations{view}",
+                        lambda: handle_data.get_all_conversations(summary, fast=fast))
+            suite.bench(f"handle_data.get_conversation_by_id{view}",
+                        lambda: handle_data.get_conversation_by_id(conv_id, summary, fast=fast))
+            suite.bench(f"handle_data.get_conversations_by_person{view}",
+                        lambda: handle_data.get_conversations_by_person(person, summary, fast=fast))
+    suite.bench("handle_data.get_people_page[100]", lambda: handle_data.get_people_page(100, fast=True))
+    suite.bench("handle_data.get_conversations_page[100, summary]",
+                lambda: handle_data.get_conversations_page(100, summary=True, fast=True))
+    suite.bench("handle_data.get_conversation_sentences[50]",
+                lambda: handle_data.get_conversation_sentences(conv_id, 0, 50))
+    suite.bench("handle_data.get_flag_counts", lambda: handle_data.get_flag_counts(names))
+    suite.bench("handle_data.get_person_ids", lambda: handle_data.get_person_ids(names))
+
+
+def bench_serialize(suite: Suite, people: list, convos: list):
+    convo = convos[0]
+    raw = convo.to_dict()
+    suite.bench("handle_data.serialize_person[all]", lambda: [handle_data.serialize_person(p) for p in people])
+    suite.bench("handle_data.serialize_sentence", lambda: handle_data.serialize_sentence(convo.sentences[0]))
+    suite.bench("handle_data.serialize_conversation", lambda: handle_data.serialize_conversation(convo))
+    suite.bench("handle_data.serialize_conversation_summary",
+                lambda: handle_data.serialize_conversation_summary(convo))
+    suite.bench("handle_data.fast_conversation+encode_json",
+                lambda: handle_data.encode_json(handle_data.fast_conversation(raw)))
+
+
+def bench_routes(suite: Suite, args, app, person: str, conv_id: str, names: list):
+    client = app.test_client()
+    covered = set()
+
+    def route(rule: str, name: str, method: str, url: str, number: int = None, **kwargs):
+        covered.add(rule)
+        call = getattr(client, method.lower())
+
+        def run():
+            response = call(url, **kwargs)
+            if response.status_code >= 400:
+                raise RuntimeError(f"{method} {url} -> {response.status_code}: {response.get_data(as_text=True)[:200]}")
+            response.close()
+        suite.bench(f"route {method} {name}", run, number=number)
+
+    route("/people", "/people", "GET", "/people")
+    route("/people", "/people?limit=100", "GET", "/people?limit=100")
+    route("/people", "/people?format=ndjson", "GET", "/people?format=ndjson")
+    route("/conversations", "/conversations", "GET", "/conversations")
+    route("/conversations", "/conversations?view=summary", "GET", "/conversations?view=summary")
+    route("/conversations", "/conversations?limit=100&view=summary", "GET", "/conversations?limit=100&view=summary")
+    route("/conversations", "/conversations?format=ndjson", "GET", "/conversations?format=ndjson")
+    route("/person/<person_name>", "/person/<name>", "GET", f"/person/{person}")
+    route("/person/<person_name>/overview", "/person/<name>/overview", "GET", f"/person/{person}/overview")
+    route("/conversation/<conv_id>", "/conversation/<id>", "GET", f"/conversation/{conv_id}")
+    route("/conversation/<conv_id>", "/conversation/<id>?view=summary", "GET", f"/conversation/{conv_id}?view=summary")
+    route("/conversation/<conv_id>/sentences", "/conversation/<id>/sentences", "GET",
+          f"/conversation/{conv_id}/sentences?limit=50")
+    route("/conversations/<person_name>", "/conversations/<name>", "GET", f"/conversations/{person}")
+    route("/conversations/<person_name>", "/conversations/<name>?view=summary", "GET",
+          f"/conversations/{person}?view=summary")
+    route("/flags/<person_name>", "/flags/<name>", "GET", f"/flags/{person}")
+    route("/flags", "/flags?names=", "GET", "/flags?names=" + ",".join(names))
+    route("/stats", "/stats", "GET", "/stats")
+    if not args.mock:  # mongomock has no $text
+        route("/search", "/search?q=", "GET", "/search?q=medicine")
+        route("/search", "/search?q=&person=&max_compound=", "GET",
+              f"/search?q=help+please&person={person}&max_compound=-0.3")
+
+    # SSE: time opening a stream and reading the first frame
+    covered.add("/events")
+
+    def open_events():
+        response = client.get("/events")
+        next(response.response)
+        response.close()
+    suite.bench("route GET /events (connect)", open_events)
+
+    # Live ingestion: each close needs its own open conversation
+    n = args.write_number
+    segment = {"speaker": "Speaker 0", "text": "Please bring me some water", "start": 0.0, "end": 2.0}
+    live_id = client.post("/live/conversations").get_json()["_id"]
+    route("/live/conversations", "/live/conversations", "POST", "/live/conversations", number=n)
+    route("/live/conversations/<conv_id>/segments", "/live/conversations/<id>/segments", "POST",
+          f"/live/conversations/{live_id}/segments", number=n, json=[segment] * 5)
+    covered.add("/live/conversations/<conv_id>/close")
+    open_ids = suite.supply(lambda: client.post("/live/conversations").get_json()["_id"], n)
+    suite.bench("route POST /live/conversations/<id>/close",
+                lambda: client.post(f"/live/conversations/{next(open_ids)}/close").close(), number=n)
+
+    # Uploads are processed by background workers; this times the submission
+    srt = synthetic.make_srt(args.seed, args.sentences)
+    job_id = client.post("/new-audio", data=srt).get_json()["id"]
+    route("/jobs/<job_id>", "/jobs/<id>", "GET", f"/jobs/{job_id}")
+    route("/new-audio", "/new-audio", "POST", "/new-audio", number=n, data=srt)
+    while server.ingest_queue.pending():
+        time.sleep(0.05)
+
+    missing = sorted(r.rule for r in app.url_map.iter_rules() if r.endpoint != "static" and r.rule not in covered)
+    if missing and not suite.only:
+        print(f"warning: routes without a benchmark: {', '.join(missing)}")
+
+
+def compare(results: dict, baseline: dict, threshold: float) -> list:
+    """Print each benchmark's change against the baseline and return the regressed names."""
+    regressions = []
+    print(f"\n{'benchmark':<58} {'baseline':>10} {'current':>10} {'change':>8}")
+    for name, result in results.items():
+        base = baseline.get(name)
+        if not base:
+            print(f"{name:<58} {'-':>10} {result['median_ms']:10.4f}      new")
+            continue
+        change = result["median_ms"] / base["median_ms"] - 1
+        mark = "  REGRESSION" if change > threshold else ""
+        print(f"{name:<58} {base['median_ms']:10.4f} {result['median_ms']:10.4f} {change:+8.1%}{mark}")
+        if mark:
+            regressions.append(name)
+    return regressions
+
+
+def git_revision() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=APP_DIR,
+                              capture_output=True, text=True).stdout.strip() or None
+    except OSError:
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--uri", default="mongodb://localhost:27017")
+    parser.add_argument("--db", default="ElderDataBench")
+    parser.add_argument("--mock", action="store_true", help="use mongomock instead of a real server")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--people", type=int, default=20, help="N people")
+    parser.add_argument("--conversations", type=int, default=200, help="M conversations")
+    parser.add_argument("--sentences", type=int, default=50, help="K sentences per conversation")
+    parser.add_argument("--rounds", type=int, default=5, help="timed rounds per benchmark")
+    parser.add_argument("--min-time", type=float, default=0.5, help="target seconds per benchmark")
+    parser.add_argument("--write-number", type=int, default=20, help="calls per round for benchmarks that write")
+    parser.add_argument("--only", help="comma-separated glob patterns of benchmark names to run")
+    parser.add_argument("--response-cache", action="store_true", help="keep the route response cache enabled")
+    parser.add_argument("--output", help="write results to this JSON file")
+    parser.add_argument("--baseline", help="JSON results of a previous run to compare against")
+    parser.add_argument("--threshold", type=float, default=0.2, help="allowed slowdown, e.g. 0.2 = 20%%")
+    args = parser.parse_args()
+
+    if args.mock:
+        database = synthetic.mock_database(args.db)
+    else:
+        from pymongo import MongoClient
+        database = MongoClient(args.uri)[args.db]
+    db.use_database(database)
+
+    people, convos = synthetic.populate(database, args.seed, args.people, args.conversations, args.sentences)
+    handle_data.ensure_indexes()
+    speaker_registry.invalidate()
+    if not args.response_cache:
+        response_cache.max_bytes = 0
+
+    app = server.create_app()
+    server.warm_up(app)
+    person = people[0].name
+    conv_id = str(convos[0]._id)
+    names = [p.name for p in people]
+
+    suite = Suite(args.rounds, args.min_time, args.only)
+    print(f"{args.people} people, {args.conversations} conversations, {args.sentences} sentences each "
+          f"({'mongomock' if args.mock else args.uri})\n")
+    bench_sentiment(suite, args)
+    bench_serialize(suite, people, convos)
+    bench_fetch(suite, args, person, conv_id, names)
+    bench_routes(suite, args, app, person, conv_id, names)
+    bench_ingestion(suite, args)
+
+    report = {
+        "meta": {
+            "timestamp": datetime.now().isoformat(timespec="seconds"),
+            "git": git_revision(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "backend": "mongomock" if args.mock else "mongod",
+            "params": {k: getattr(args, k) for k in ("seed", "people", "conversations", "sentences",
+                                                     "rounds", "min_time", "write_number", "response_cache")},
+        },
+        "results": suite.results,
+    }
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"\nResults written to {args.output}")
+
+    if not args.mock:
+        for name in ("People", "Conversations", "Speakers"):
+            database[name].drop()
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        if baseline.get("meta", {}).get("params") != report["meta"]["params"]:
+            print("warning: baseline was run with different parameters")
+        regressions = compare(suite.results, baseline.get("results", {}), args.threshold)
+        if regressions:
+            print(f"\n{len(regressions)} benchmark(s) slower than the baseline by more than {args.threshold:.0%}")
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,150 @@
+"""
+synthetic.py
+------------
+Seeded synthetic data for the benchmarks: N people, M conversations of K
+sentences each, and SRT transcripts in the format the parser expects.
+
+The same seed always produces the same documents, so timings from two runs
+(or two branches) are measured on identical data. mock_database() gives a
+mongomock database to put them in when no MongoDB server is at hand.
+"""
+import random
+from datetime import datetime, timedelta
+from typing import List
+
+from bson import ObjectId
+
+from models import Conversation, Person, Sentence
+from flag_rules import get_engine as get_flag_rules
+from speakers import DEFAULT_SPEAKER_NAMES
+
+WORDS = [
+    "I", "you", "me", "need", "help", "please", "stop", "fine", "today", "medicine",
+    "doctor", "water", "cold", "hurts", "thank", "love", "hate", "never", "always", "again",
+    "good", "bad", "scared", "happy", "tired", "alone", "family", "call", "now", "later",
+]
+ROLES = ["Elder", "Caregiver"]
+
+
+def make_text(rng: random.Random) -> str:
+    return " ".join(rng.choice(WORDS) for _ in range(rng.randint(3, 15)))
+
+
+def make_people(rng: random.Random, n: int) -> List[Person]:
+    """Ryan and Brad (the default speakers) followed by n - 2 other people."""
+    names = list(DEFAULT_SPEAKER_NAMES.values())
+    names += [f"Person {i}" for i in range(len(names), n)]
+    return [Person(name=name, role=ROLES[i % len(ROLES)]) for i, name in enumerate(names[:max(n, 2)])]
+
+
+def make_conversation(rng: random.Random, participants: List[ObjectId], sentence_count: int,
+                      roles: dict = None) -> Conversation:
+    """A scored conversation flagged by the configured flag rules."""
+    start = datetime(2025, 1, 1) + timedelta(minutes=rng.randint(0, 500_000))
+    sentences = []
+    offset = 0.0
+    for _ in range(sentence_count):
+        length = round(rng.uniform(0.5, 6.0), 3)
+        compound = round(rng.uniform(-1, 1), 4)
+        neg = round(max(-compound, 0) * 0.6, 3)
+        pos = round(max(compound, 0) * 0.6, 3)
+        sentences.append(Sentence(
+            speaker=rng.choice(participants),
+            text=make_text(rng),
+            sentiment={"neg": neg, "neu": round(1 - neg - pos, 3), "pos": pos, "compound": compound},
+            start_time=start + timedelta(seconds=offset),
+            total_time=length,
+        ))
+        offset += length + round(rng.uniform(0.1, 2.0), 3)
+    weights = [max(len(s.text.split()), 1) for s in sentences]
+    sentiment = sum(s.sentiment["compound"] * w for s, w in zip(sentences, weights)) / max(sum(weights), 1)
+    return Conversation(
+        participants=list(participants),
+        start_time=start,
+        total_time=offset,
+        sentences=sentences,
+        flags=get_flag_rules().evaluate(sentences, roles),
+        sentiment=sentiment,
+    )
+
+
+def make_dataset(seed: int, people: int, conversations: int, sentences: int):
+    """
+    Return (people, conversations): Person and Conversation objects with
+    conversation links and flag counters filled in consistently.
+    """
+    rng = random.Random(seed)
+    persons = make_people(rng, people)
+    roles = {p._id: p.role for p in persons}
+    convos = []
+    for _ in range(conversations):
+        participants = [p._id for p in rng.sample(persons, 2)]
+        convos.append(make_conversation(rng, participants, sentences, roles))
+
+    by_id = {p._id: p for p in persons}
+    for convo in convos:
+        for pid in convo.participants:
+            by_id[pid].conversations.append(convo._id)
+            by_id[pid].flag_count += len(convo.flags)
+    return persons, convos
+
+
+def populate(database, seed: int = 42, people: int = 20, conversations: int = 200, sentences: int = 50):
+    """
+    Replace the People/Conversations/Speakers collections of database with a synthetic dataset.
+
+    Returns:
+        tuple: (people, conversations) as generated by make_dataset.
+    """
+    persons, convos = make_dataset(seed, people, conversations, sentences)
+    for name in ("People", "Conversations", "Speakers"):
+        database[name].drop()
+    database["People"].insert_many([p.to_dict() for p in persons])
+    for i in range(0, len(convos), 500):
+        database["Conversations"].insert_many([c.to_dict() for c in convos[i:i + 500]])
+    return persons, convos
+
+
+def _mock_bulk_write(self, requests, ordered=True, **kwargs):
+    # mongomock's bulk_write cannot build pymongo 4 UpdateOne/UpdateMany ops
+    # (they pass a sort argument it does not know), so apply them one at a time
+    from pymongo import InsertOne, UpdateMany, UpdateOne
+    for op in requests:
+        if isinstance(op, UpdateOne):
+            self.update_one(op._filter, op._doc, upsert=op._upsert)
+        elif isinstance(op, UpdateMany):
+            self.update_many(op._filter, op._doc, upsert=op._upsert)
+        elif isinstance(op, InsertOne):
+            self.insert_one(op._doc)
+        else:
+            raise NotImplementedError(f"bulk_write of {type(op).__name__} under mongomock")
+
+
+def mock_database(name: str = "ElderDataBench"):
+    """
+    A fresh mongomock database for db.use_database, with bulk_write patched
+    so the app's batched UpdateOne writes (rollups, flag counters, sentence
+    buckets) run on it. Requires the mongomock package.
+    """
+    import mongomock
+    import mongomock.collection
+    mongomock.collection.Collection.bulk_write = _mock_bulk_write
+    return mongomock.MongoClient()[name]
+
+
+def make_srt(seed: int, cues: int, speakers: int = 2) -> str:
+    """An SRT transcript of diarized cues ("Speaker N: text")."""
+    rng = random.Random(seed)
+    blocks = []
+    t = 0.0
+    for i in range(1, cues + 1):
+        start, end = t, t + rng.uniform(0.5, 6.0)
+        blocks.append(f"{i}\n{_srt_time(start)} --> {_srt_time(end)}\n"
+                      f"Speaker {rng.randrange(speakers)}: {make_text(rng)}")
+        t = end + rng.uniform(0.1, 2.0)
+    return "\n\n".join(blocks) + "\n"
+
+
+def _srt_time(seconds: float) -> str:
+    ms = int(round(seconds * 1000))
+    return f"{ms // 3_600_000:02d}:{ms // 60_000 % 60:02d}:{ms // 1000 % 60:02d},{ms % 1000:03d}"
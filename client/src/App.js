@@ -21,26 +21,23 @@ function App() {
     fetch("http://127.0.0.1:5000/people")
       .then((res) => res.json())
       .then(async (data) => {
-        // For each caretaker, fetch their flag count in parallel
-        const caretakersParsed = await Promise.all(
-          data.map(async (p) => {
-            const flagsRes = await fetch(`http://127.0.0.1:5000/flags/${p.name}`);
-            const flagsJson = await flagsRes.json();
-            const flags = flagsJson.total_flags || 0;
+        // Fetch every caretaker's flag count in one request
+        const names = data.map((p) => encodeURIComponent(p.name)).join(",");
+        const flagsRes = await fetch(`http://127.0.0.1:5000/flags?names=${names}`);
+        const flagsJson = await flagsRes.json();
 
-            return {
-              name: p.name,
-              conversations: p.conversations.length,
-              role: p.role,
-              alerts: flags,
-            };
-          })
-        );
+        const caretakersParsed = data.map((p) => ({
+          id: p._id,
+          name: p.name,
+          conversations: p.conversations.length,
+          role: p.role,
+          alerts: flagsJson.total_flags[p.name] || 0,
+        }));
         setCaretakers(caretakersParsed);
       });
 
     // --- Fetch all conversations ---
-    fetch("http://127.0.0.1:5000/conversations")
+    fetch("http://127.0.0.1:5000/conversations?view=summary")
       .then((res) => res.json())
       .then((data) => {
         setConversations(data);
@@ -68,6 +65,24 @@ function App() {
       });
   }, []);
 
+  useEffect(() => {
+    // --- Live flag alerts (Server-Sent Events) instead of re-fetching ---
+    const source = new EventSource("http://127.0.0.1:5000/events");
+    source.addEventListener("flag", (e) => {
+      const flag = JSON.parse(e.data);
+      setCaretakers((prev) =>
+        prev.map((c) => (flag.participants.includes(c.id) ? { ...c, alerts: c.alerts + 1 } : c))
+      );
+      setConversations((prev) =>
+        prev.map((conv) =>
+          conv._id === flag.conversation ? { ...conv, flags: [...(conv.flags || []), flag.sentence] } : conv
+        )
+      );
+      setSummary((prev) => ({ ...prev, flags: prev.flags + 1 }));
+    });
+    return () => source.close();
+  }, []);
+
   const navigate = useNavigate();
 
   // Handle card clicks → navigate to detail pages
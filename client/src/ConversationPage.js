@@ -8,21 +8,46 @@ function sentimentLabel(score) {
   if (score < 0.6) return "Good";
   return "Excellent";
 }
+// Number of transcript lines fetched per "Load more" click
+const SENTENCE_PAGE_SIZE = 50;
+
 function ConversationPage() {
   const { convId } = useParams();
   const [conversation, setConversation] = useState(null);
+  const [sentences, setSentences] = useState([]);
+  const [totalSentences, setTotalSentences] = useState(0);
+  const [flaggedSentences, setFlaggedSentences] = useState([]);
+
+  // Fetch the next slice of the transcript and append it
+  async function loadSentences(offset) {
+    const res = await fetch(
+      `http://127.0.0.1:5000/conversation/${convId}/sentences?offset=${offset}&limit=${SENTENCE_PAGE_SIZE}`
+    );
+    const page = await res.json();
+    setSentences((prev) => (offset === 0 ? page.sentences : [...prev, ...page.sentences]));
+    setTotalSentences(page.total);
+  }
+
+  // Fetch every flagged sentence, not just those in the pages loaded so far
+  async function loadFlagged() {
+    const res = await fetch(`http://127.0.0.1:5000/conversation/${convId}/flagged`);
+    const flagged = await res.json();
+    setFlaggedSentences(flagged.sentences || []);
+  }
 
   useEffect(() => {
     async function fetchConversation() {
       try {
-        const res = await fetch(`http://127.0.0.1:5000/conversation/${convId}`);
+        const res = await fetch(`http://127.0.0.1:5000/conversation/${convId}?view=summary`);
         const data = await res.json();
         setConversation(data);
+        if (!data.error) await Promise.all([loadSentences(0), loadFlagged()]);
       } catch {
         setConversation({ error: "Failed to fetch conversation" });
       }
     }
     if (convId) fetchConversation();
+    // eslint-disable-next-line react-hooks/exhaustive-deps
   }, [convId]);
 
   const pageStyle = {
@@ -66,14 +91,6 @@ function ConversationPage() {
 
   const hasFlags = conversation.flags && conversation.flags.length > 0;
 
-  // Extract flagged sentences
-  let flaggedSentences = [];
-  if (hasFlags && conversation.sentences) {
-    flaggedSentences = conversation.flags
-      .map((f) => conversation.sentences[parseInt(f, 10)])
-      .filter(Boolean);
-  }
-
   return (
     <div style={pageStyle}>
       <div style={containerStyle}>
@@ -160,10 +177,47 @@ function ConversationPage() {
                 }}
               >
                 {s.text || "(no text available)"}
+                {s.flag_rules && s.flag_rules.length > 0 && (
+                  <div style={{ fontSize: "0.9rem", color: "#a16207" }}>{s.flag_rules.join(", ")}</div>
+                )}
+                {s.audio_ref && (
+                  <audio
+                    controls
+                    preload="none"
+                    src={`http://127.0.0.1:5000/conversation/${convId}/audio/${s._id}`}
+                  />
+                )}
               </div>
             ))}
           </div>
         )}
+
+        {/* Transcript, paged in on demand */}
+        <h2 style={sectionTitle}>Transcript</h2>
+        <div style={{ ...baseCardStyle, padding: "14px 20px" }}>
+          {sentences.map((s, i) => (
+            <div key={s._id || i} style={{ fontSize: "1.1rem", color: "#3f2e1f", marginBottom: "8px" }}>
+              {s.text || "(no text available)"}
+            </div>
+          ))}
+          {sentences.length < totalSentences && (
+            <button
+              onClick={() => loadSentences(sentences.length)}
+              style={{
+                marginTop: "8px",
+                padding: "8px 16px",
+                border: "1px solid #a16207",
+                borderRadius: "8px",
+                backgroundColor: "#faf8f5",
+                color: "#a16207",
+                fontWeight: "600",
+                cursor: "pointer",
+              }}
+            >
+              Load more ({totalSentences - sentences.length} remaining)
+            </button>
+          )}
+        </div>
       </div>
     </div>
   );
@@ -18,27 +18,22 @@ function PersonPage() {
   useEffect(() => {
     async function fetchPerson() {
       try {
-        const res = await fetch(`http://127.0.0.1:5000/person/${personName}`);
+        // Person, flag total and conversation summaries in one request
+        const res = await fetch(`http://127.0.0.1:5000/person/${personName}/overview`);
         const data = await res.json();
         if (data.error) {
           setPersonData({ error: data.error });
           return;
         }
 
-        const person = data.person || data;
-        const flagsRes = await fetch(`http://127.0.0.1:5000/flags/${person.name}`);
-        const flagsJson = await flagsRes.json();
-
+        const person = data.person;
         setPersonData({
           name: person.name,
           conversations: person.conversations ? person.conversations.length : 0,
           role: person.role || "Unknown",
-          alerts: flagsJson.total_flags || 0,
+          alerts: data.total_flags || 0,
         });
-
-        const convRes = await fetch(`http://127.0.0.1:5000/conversations/${person.name}`);
-        const convData = await convRes.json();
-        setConversations(convData);
+        setConversations(data.conversations);
       } catch {
         setPersonData({ error: "Failed to fetch caretaker details" });
       }
@@ -46,6 +41,18 @@ function PersonPage() {
     if (personName) fetchPerson();
   }, [personName]);
 
+  useEffect(() => {
+    // --- Live flag alerts for this person (Server-Sent Events) ---
+    if (!personName) return undefined;
+    const source = new EventSource(
+      `http://127.0.0.1:5000/events?person=${encodeURIComponent(personName)}`
+    );
+    source.addEventListener("flag", () => {
+      setPersonData((prev) => (prev && !prev.error ? { ...prev, alerts: prev.alerts + 1 } : prev));
+    });
+    return () => source.close();
+  }, [personName]);
+
   const pageStyle = {
     padding: "20px",
     background: "linear-gradient(to right, #f4ede4, #e5d4b3)",
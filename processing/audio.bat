@@ -1 +1,18 @@
-python C:\Users\nateo\Desktop\SteelhacksXII\whisper-diarization\diarize_parallel.py -a "../files/audio/Recording.mp3"
\ No newline at end of file
+@echo off
+rem Transcribe and ingest a recording with the diarize backend (see app/audio.py).
+rem Usage: audio.bat [path\to\diarize_parallel.py] [recording]
+rem The diarization script is the first argument or DIARIZE_SCRIPT; an AUDIO_DIARIZE_COMMAND
+rem set by the caller is used as is. The recording defaults to files\audio\Recording.mp3.
+setlocal
+set "RECORDING=%~f2"
+if "%~2"=="" set "RECORDING=%~dp0..\files\audio\Recording.mp3"
+if defined AUDIO_DIARIZE_COMMAND goto ingest
+if not "%~1"=="" set "DIARIZE_SCRIPT=%~f1"
+if not defined DIARIZE_SCRIPT (
+    echo Pass the path of diarize_parallel.py, or set DIARIZE_SCRIPT or AUDIO_DIARIZE_COMMAND 1>&2
+    exit /b 1
+)
+set AUDIO_DIARIZE_COMMAND=python "%DIARIZE_SCRIPT%" -a {audio}
+
+:ingest
+cd /d "%~dp0..\app" && python manage.py ingest-audio "%RECORDING%" --backend diarize
@@ -0,0 +1,82 @@
+"""
+conftest.py
+-----------
+Fixtures shared by the tests. Every test runs against a fresh mongomock
+database (synthetic.mock_database, the one bench_suite.py --mock uses), with
+Ryan (Elder) and Brad (Caregiver) stored and a deterministic stand-in for
+VADER, so no MongoDB server or NLTK lexicon is needed:
+
+    python -m pytest -q
+"""
+import os
+import sys
+import time
+
+import pytest
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path[:0] = [os.path.join(ROOT, "app"), os.path.join(ROOT, "benchmarks")]
+
+import cache  # noqa: E402
+import db  # noqa: E402
+import handle_data  # noqa: E402
+import sentiment  # noqa: E402
+import server  # noqa: E402
+from models import Person  # noqa: E402
+from speakers import registry as speaker_registry  # noqa: E402
+from synthetic import mock_database  # noqa: E402
+
+
+class FakeAnalyzer:
+    """polarity_scores() stand-in: texts containing a NEGATIVE word score -0.6, the rest 0.2."""
+
+    NEGATIVE = ("not", "never", "shut", "burden", "hate")
+
+    def polarity_scores(self, text: str) -> dict:
+        words = text.lower().replace(".", " ").replace(",", " ").split()
+        compound = -0.6 if any(w in words for w in self.NEGATIVE) else 0.2
+        return {"neg": 0.0, "neu": 1.0, "pos": 0.0, "compound": compound}
+
+
+@pytest.fixture(autouse=True)
+def database(monkeypatch):
+    """A fresh mongomock database holding Ryan (Elder) and Brad (Caregiver)."""
+    database = mock_database("ElderDataTest")
+    db.use_database(database)
+    handle_data.ensure_indexes()
+    database["People"].insert_many([Person("Ryan", "Elder").to_dict(), Person("Brad", "Caregiver").to_dict()])
+    speaker_registry.invalidate()
+
+    monkeypatch.setattr(sentiment, "_sia", FakeAnalyzer())
+    sentiment._cached_scores.cache_clear()
+    monkeypatch.setattr(cache, "response_cache", cache.ResponseCache())
+    yield database
+    db.use_database(None)
+    speaker_registry.invalidate()
+    sentiment._cached_scores.cache_clear()
+
+
+@pytest.fixture
+def person_id(database):
+    """Person._id by name."""
+    return lambda name: database["People"].find_one({"name": name})["_id"]
+
+
+@pytest.fixture
+def client():
+    """Test client of the Flask app."""
+    return server.app.test_client()
+
+
+@pytest.fixture
+def wait_for_job(client):
+    """Poll /jobs/<id> until the ingestion job finishes; returns its final state."""
+    def wait(job_id: str, timeout: float = 10) -> dict:
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            job = client.get(f"/jobs/{job_id}").get_json()
+            if job["status"] in ("done", "failed"):
+                return job
+            time.sleep(0.02)
+        raise AssertionError(f"Job {job_id} did not finish in {timeout}s")
+    return wait
@@ -0,0 +1,34 @@
+import bench_suite
+import synthetic
+from handle_data import rebuild_flag_counts
+from parse import iter_srt_cues
+
+
+def texts(convos) -> list:
+    return [[s.text for s in c.sentences] for c in convos]
+
+
+def test_same_seed_same_data():
+    people_a, convos_a = synthetic.make_dataset(7, 4, 5, 6)
+    people_b, convos_b = synthetic.make_dataset(7, 4, 5, 6)
+    assert [p.name for p in people_a] == [p.name for p in people_b]
+    assert texts(convos_a) == texts(convos_b)
+    assert texts(convos_a) != texts(synthetic.make_dataset(8, 4, 5, 6)[1])
+
+
+def test_populated_counters_are_consistent(database):
+    people, convos = synthetic.populate(database, seed=3, people=4, conversations=12, sentences=8)
+    assert database["Conversations"].count_documents({}) == 12
+    assert all(len(c.sentences) == 8 for c in convos)
+    assert rebuild_flag_counts() == 0
+
+
+def test_synthetic_srt_parses():
+    assert len(list(iter_srt_cues(synthetic.make_srt(1, 25)))) == 25
+
+
+def test_compare_reports_regressions_over_the_threshold():
+    baseline = {"a": {"median_ms": 1.0}, "b": {"median_ms": 1.0}, "gone": {"median_ms": 1.0}}
+    results = {"a": {"median_ms": 1.1}, "b": {"median_ms": 1.3}, "new": {"median_ms": 5.0}}
+    assert bench_suite.compare(results, baseline, threshold=0.2) == ["b"]
+    assert bench_suite.compare(results, baseline, threshold=0.5) == []
@@ -0,0 +1,117 @@
+from flask import Flask, jsonify
+from pymongo import ReadPreference
+
+import cache
+import db
+import handle_data
+import server
+from cache import VersionCounters, cached, versions
+from parse import srt_to_conversation_rnbrad
+from server import SAMPLE_SRT
+
+
+def test_hit_etag_and_304(client):
+    first = client.get("/person/Ryan")
+    assert first.status_code == 200 and first.headers["ETag"]
+    second = client.get("/person/Ryan")
+    assert second.get_data() == first.get_data() and second.headers["ETag"] == first.headers["ETag"]
+    assert cache.response_cache.stats()["hits"] == 1
+
+    conditional = client.get("/person/Ryan", headers={"If-None-Match": first.headers["ETag"]})
+    assert conditional.status_code == 304 and conditional.get_data() == b""
+
+
+def test_writes_through_handle_data_invalidate(client):
+    before = client.get("/person/Ryan")
+    assert handle_data.update_person_role_by_name("Ryan", "Resident")
+    after = client.get("/person/Ryan", headers={"If-None-Match": before.headers["ETag"]})
+    assert after.status_code == 200
+    assert after.get_json()["role"] == "Resident"
+    assert after.headers["ETag"] != before.headers["ETag"]
+
+
+def test_other_keys_stay_cached(client):
+    client.get("/person/Brad")
+    handle_data.update_person_role_by_name("Ryan", "Resident")
+    client.get("/person/Brad")
+    assert cache.response_cache.stats()["hits"] == 1
+
+
+def test_storing_a_conversation_invalidates_lists_and_participants(client):
+    urls = ["/conversations", "/person/Ryan/overview", "/flags/Ryan", "/people"]
+    before = {url: client.get(url).get_json() for url in urls}
+    assert before["/conversations"] == []
+
+    handle_data.store_conversation(srt_to_conversation_rnbrad(SAMPLE_SRT))
+    after = {url: client.get(url).get_json() for url in urls}
+    assert len(after["/conversations"]) == 1
+    assert len(after["/person/Ryan/overview"]["conversations"]) == 1
+    assert after["/flags/Ryan"]["total_flags"] == after["/person/Ryan/overview"]["total_flags"] > 0
+    assert cache.response_cache.stats()["hits"] == 0
+
+
+def test_versions_are_shared_between_processes(client, database):
+    # Another worker process (or manage.py) has its own VersionCounters over the same collection
+    other_process = VersionCounters()
+    client.get("/person/Ryan")
+    database["People"].update_one({"name": "Ryan"}, {"$set": {"role": "Resident"}})
+    assert client.get("/person/Ryan").get_json()["role"] == "Elder"  # still the cached response
+
+    other_process.bump("person:Ryan")
+    assert versions.snapshot(["person:Ryan", "people"]) == (1, 0)
+    assert client.get("/person/Ryan").get_json()["role"] == "Resident"
+
+
+def test_bump_creates_and_increments_counters():
+    versions.bump("a", "b", "a")
+    versions.bump("a")
+    assert versions.snapshot(["a", "b", "c"]) == (2, 1, 0)
+    versions.bump()
+    assert versions.snapshot(["a"]) == (2,)
+
+
+def test_misses_read_from_the_primary():
+    people_reads = db.collection("People", read_only=True)
+    seen = []
+    app = Flask(__name__)
+
+    @app.route("/probe")
+    @cached("people")
+    def probe():
+        seen.append(people_reads.resolve().read_preference)
+        return jsonify(ok=True)
+
+    assert people_reads.resolve().read_preference == ReadPreference.SECONDARY_PREFERRED
+    app.test_client().get("/probe")
+    assert seen == [ReadPreference.PRIMARY]
+    with db.primary_reads():
+        assert people_reads.resolve().read_preference == ReadPreference.PRIMARY
+    assert people_reads.resolve().read_preference == ReadPreference.SECONDARY_PREFERRED
+
+
+def test_errors_are_not_cached(client):
+    assert client.get("/person/Nobody").status_code == 404
+    assert client.get("/person/Nobody").status_code == 404
+    assert cache.response_cache.stats() == {"hits": 0, "misses": 2, "entries": 0, "bytes": 0}
+
+
+def test_size_cap_evicts_least_recently_used():
+    responses = cache.ResponseCache(max_bytes=10, ttl=0)
+    responses.put("a", (0,), b"12345", "text/plain")
+    responses.put("b", (0,), b"12345", "text/plain")
+    assert responses.get("a", (0,))
+    responses.put("c", (0,), b"12345", "text/plain")
+    assert responses.get("b", (0,)) is None
+    assert responses.get("a", (0,)) and responses.get("c", (0,))
+    assert responses.get("a", (1,)) is None
+
+
+def test_search_is_invalidated_by_renames(client, monkeypatch, person_id):
+    # Results carry speaker names; the sentence matching itself needs MongoDB's $text
+    def names(query, **kwargs):
+        return {"results": sorted(p["name"] for p in handle_data.people.find())}
+
+    monkeypatch.setattr(server, "search_sentences", names)
+    assert client.get("/search?q=help").get_json()["results"] == ["Brad", "Ryan"]
+    handle_data.update_person_name(str(person_id("Ryan")), "Ryan S")
+    assert client.get("/search?q=help").get_json()["results"] == ["Brad", "Ryan S"]
@@ -0,0 +1,49 @@
+import asyncio
+import threading
+
+from bson import ObjectId
+
+from events import EventBus
+
+
+def test_subscribers_only_see_their_people():
+    bus, ryan, brad = EventBus(), ObjectId(), ObjectId()
+    everyone, only_ryan = bus.subscribe(), bus.subscribe([ryan])
+    bus.publish("flag", {"n": 1}, people=[brad])
+    bus.publish("flag", {"n": 2}, people=[ryan])
+    assert [e.data["n"] for e in everyone.get(0)] == [1, 2]
+    assert [e.data["n"] for e in only_ryan.get(0)] == [2]
+
+
+def test_slow_subscribers_drop_the_oldest_events():
+    bus = EventBus(subscriber_queue=2)
+    sub = bus.subscribe()
+    for n in range(3):
+        bus.publish("flag", {"n": n})
+    assert [e.data["n"] for e in sub.get(0)] == [1, 2]
+    assert sub.dropped == 1
+
+
+def test_resume_from_last_event_id():
+    bus = EventBus()
+    first = bus.publish("flag", {"n": 1})
+    bus.publish("flag", {"n": 2})
+    assert [e.data["n"] for e in bus.subscribe(last_event_id=first.id).get(0)] == [2]
+
+
+def test_get_async_is_woken_from_another_thread():
+    bus = EventBus()
+    sub = bus.subscribe()
+
+    async def wait():
+        threading.Timer(0.05, bus.publish, ("flag", {"n": 1})).start()
+        return await sub.get_async(timeout=5)
+
+    assert [e.data["n"] for e in asyncio.run(wait())] == [1]
+    assert sub._waiter is None
+
+
+def test_get_async_times_out_empty():
+    sub = EventBus().subscribe()
+    assert asyncio.run(sub.get_async(timeout=0.01)) == []
+    assert sub._waiter is None
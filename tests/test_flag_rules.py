@@ -0,0 +1,114 @@
+from datetime import datetime, timedelta
+
+import pytest
+from bson import ObjectId
+
+from flag_rules import KeywordAutomaton, RuleEngine, load_rules, normalize
+from models import Sentence
+
+ELDER, CAREGIVER = ObjectId(), ObjectId()
+ROLES = {ELDER: "Elder", CAREGIVER: "caregiver"}
+START = datetime(2026, 1, 5, 9, 0)
+
+
+def sentence(text: str, compound: float = 0.0, speaker: ObjectId = CAREGIVER, at: float = 0.0) -> Sentence:
+    return Sentence(speaker=speaker, text=text, sentiment={"compound": compound},
+                    start_time=START + timedelta(seconds=at))
+
+
+def engine(*rules) -> RuleEngine:
+    return RuleEngine.from_config({"rules": list(rules)})
+
+
+def test_compound_bounds():
+    rules = engine({"name": "negative", "type": "compound", "max": -0.5},
+                   {"name": "mixed", "type": "compound", "min": -0.2, "max": 0.2})
+    sentences = [sentence("a", -0.7), sentence("b", -0.5), sentence("c", 0.0), sentence("d", 0.5)]
+    flagged = rules.evaluate(sentences, ROLES)
+    assert [s.flag_rules for s in sentences] == [["negative"], ["negative"], ["mixed"], []]
+    assert flagged == [s._id for s in sentences[:3]]
+
+
+def test_unscored_sentences_never_match_compound_rules():
+    rules = engine({"name": "negative", "type": "compound", "max": -0.5})
+    s = Sentence(speaker=CAREGIVER, text="x", sentiment={}, start_time=START)
+    assert rules.evaluate([s]) == []
+
+
+def test_keywords_match_whole_words_case_and_apostrophe_insensitive():
+    rules = engine({"name": "abuse", "type": "keywords", "keywords": ["shut up", "I'm not covering you", "idiot"]})
+    texts = ["Just SHUT  UP.", "I’m not covering you", "idiots everywhere", "shut upstairs", "you idiot!"]
+    sentences = [sentence(t) for t in texts]
+    rules.evaluate(sentences, ROLES)
+    assert [bool(s.flag_rules) for s in sentences] == [True, True, False, False, True]
+
+
+def test_overlapping_keywords():
+    automaton = KeywordAutomaton({"he": {0}, "she": {1}, "hers": {2}, "his": {3}})
+    assert automaton.match("ushers") == set()
+    assert automaton.match("she said hers") == {1, 2}
+    assert automaton.match(normalize("HIS")) == {3}
+
+
+def test_role_condition():
+    rules = engine({"name": "distress", "type": "keywords", "role": "Elder", "keywords": ["help me"]})
+    sentences = [sentence("help me", speaker=ELDER), sentence("help me", speaker=CAREGIVER),
+                 sentence("help me", speaker=ObjectId())]
+    assert rules.evaluate(sentences, ROLES) == [sentences[0]._id]
+
+
+def test_window_rule_fires_on_every_sentence_completing_a_window():
+    rules = engine({"name": "hostility", "type": "window", "count": 3, "seconds": 60,
+                    "role": "Caregiver", "max": -0.3})
+    sentences = [
+        sentence("a", -0.5, at=0),
+        sentence("b", -0.5, at=10),
+        sentence("c", -0.5, speaker=ELDER, at=20),  # wrong role: not counted
+        sentence("d", 0.4, at=30),                  # not negative enough: not counted
+        sentence("e", -0.5, at=50),                 # third within 60s
+        sentence("f", -0.5, at=65),                 # a has left the window; b, e, f remain
+        sentence("g", -0.5, at=200),                # alone again
+    ]
+    rules.evaluate(sentences, ROLES)
+    assert [s.flag_rules for s in sentences] == [[], [], [], [], ["hostility"], ["hostility"], []]
+
+
+def test_window_rule_counts_history_but_does_not_flag_it():
+    rules = engine({"name": "hostility", "type": "window", "count": 2, "seconds": 60, "max": -0.3})
+    history = [sentence("earlier", -0.5, at=0)]
+    history[0].flag_rules = ["kept"]
+    new = [sentence("now", -0.5, at=30)]
+    assert rules.evaluate(new, ROLES, history) == [new[0]._id]
+    assert history[0].flag_rules == ["kept"]
+    assert rules.max_window == 60
+
+
+def test_window_rule_skips_sentences_without_start_time():
+    rules = engine({"name": "burst", "type": "window", "count": 1, "seconds": 5})
+    s = Sentence(speaker=CAREGIVER, text="x", sentiment={"compound": 0.0}, start_time=None)
+    assert rules.evaluate([s]) == []
+
+
+@pytest.mark.parametrize("rule", [
+    {"name": "x", "type": "regex"},
+    {"name": "x", "type": "keywords", "keywords": ["  "]},
+    {"name": "x", "type": "compound"},
+    {"name": "x", "type": "window", "count": 0, "seconds": 5},
+    {"name": "x", "type": "window", "count": 2},
+])
+def test_invalid_rules(rule):
+    with pytest.raises(ValueError):
+        engine(rule)
+
+
+def test_rule_names_must_be_unique():
+    with pytest.raises(ValueError):
+        engine({"name": "x", "max": -0.5}, {"name": "x", "min": 0.5})
+
+
+def test_default_rules_file():
+    rules = load_rules()
+    sentences = [sentence("I'm tired of this burden.", 0.1), sentence("Help me, it hurts", 0.1, speaker=ELDER)]
+    rules.evaluate(sentences, ROLES)
+    assert sentences[0].flag_rules == ["abusive_language"]
+    assert sentences[1].flag_rules == ["resident_distress"]
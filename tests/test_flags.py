@@ -0,0 +1,65 @@
+import pytest
+
+import handle_data
+import sentence_store
+from handle_data import get_flag_counts, rebuild_flag_counts, store_conversation
+from parse import srt_to_conversation_rnbrad
+from server import SAMPLE_SRT
+
+
+def test_storing_conversations_counts_flags_for_every_participant(database):
+    convos = [srt_to_conversation_rnbrad(SAMPLE_SRT.replace("blanket", f"blanket {i}")) for i in range(2)]
+    for convo in convos:
+        store_conversation(convo)
+    total = sum(len(c.flags) for c in convos)
+    assert total > 0
+    assert get_flag_counts(["Ryan", "Brad", "Nobody"]) == {"Ryan": total, "Brad": total}
+
+
+def test_flag_endpoints(client):
+    convo = srt_to_conversation_rnbrad(SAMPLE_SRT)
+    store_conversation(convo)
+    assert client.get("/flags/Ryan").get_json() == {"person": "Ryan", "total_flags": len(convo.flags)}
+    assert client.get("/flags/Nobody").status_code == 404
+    assert client.get("/flags?names=Ryan,,Nobody,Brad").get_json() == {
+        "total_flags": {"Ryan": len(convo.flags), "Brad": len(convo.flags)},
+        "not_found": ["Nobody"],
+    }
+    assert client.get("/flags").get_json() == {"total_flags": {}, "not_found": []}
+
+
+def test_rebuild_corrects_drifted_counters(database):
+    convo = srt_to_conversation_rnbrad(SAMPLE_SRT)
+    store_conversation(convo)
+    database["People"].update_one({"name": "Brad"}, {"$set": {"flag_count": 999}})
+    assert rebuild_flag_counts() == 1
+    assert get_flag_counts(["Brad"]) == {"Brad": len(convo.flags)}
+    assert rebuild_flag_counts() == 0
+
+
+def test_people_without_conversations_have_no_flags(database):
+    assert handle_data.get_flag_counts(["Ryan"]) == {"Ryan": 0}
+
+
+def test_linking_by_hand_counts_flags_once(database, person_id):
+    convo = srt_to_conversation_rnbrad(SAMPLE_SRT)
+    store_conversation(convo)
+    database["People"].insert_one({"name": "Nurse", "role": "Caregiver", "conversations": [], "flag_count": 0})
+
+    assert handle_data.update_person_conversations_by_name("Nurse", str(convo._id))
+    assert not handle_data.update_person_conversations_by_id(str(person_id("Nurse")), str(convo._id))
+    assert get_flag_counts(["Nurse"]) == {"Nurse": len(convo.flags)}
+    assert handle_data.update_person_conversations_by_id(str(person_id("Nurse")), str(handle_data.ObjectId()))
+    assert get_flag_counts(["Nurse"]) == {"Nurse": len(convo.flags)}
+
+
+@pytest.mark.parametrize("layout", [sentence_store.EMBEDDED, sentence_store.BUCKETED])
+def test_flagged_sentences_endpoint_lists_every_flag(client, monkeypatch, layout):
+    monkeypatch.setattr(sentence_store, "SENTENCE_STORAGE", layout)
+    monkeypatch.setattr(sentence_store, "SENTENCE_BUCKET_SIZE", 2)
+    convo = srt_to_conversation_rnbrad(SAMPLE_SRT)
+    store_conversation(convo)
+    body = client.get(f"/conversation/{convo._id}/flagged").get_json()
+    assert body["total"] == len(convo.flags)
+    assert [s["_id"] for s in body["sentences"]] == [str(s._id) for s in convo.sentences if s._id in convo.flags]
+    assert client.get(f"/conversation/{handle_data.ObjectId()}/flagged").status_code == 404
@@ -0,0 +1,153 @@
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+import handle_data
+import request_args
+import rollups
+import sentence_store
+import server
+from handle_data import find_duplicate_conversation, finish_conversation, store_conversation
+from parse import srt_hash, srt_to_conversation_rnbrad
+from server import SAMPLE_SRT
+
+
+def person(database, name: str) -> dict:
+    return database["People"].find_one({"name": name})
+
+
+def rollup_sentences(database) -> int:
+    return sum(d["sentences"] for d in database["Rollups"].find({"kind": "person", "period": "day"}))
+
+
+def test_same_transcript_is_stored_once(database):
+    first = srt_to_conversation_rnbrad(SAMPLE_SRT)
+    assert store_conversation(first, srt_hash(SAMPLE_SRT))
+    assert not store_conversation(srt_to_conversation_rnbrad(SAMPLE_SRT), srt_hash(SAMPLE_SRT))
+    assert find_duplicate_conversation(srt_hash(SAMPLE_SRT)) == first._id
+    assert database["Conversations"].count_documents({}) == 1
+    assert person(database, "Ryan")["conversations"] == [first._id]
+    assert person(database, "Ryan")["flag_count"] == len(first.flags)
+
+
+def test_idempotency_key_replay(client, database, wait_for_job):
+    response = client.post("/new-audio", data=SAMPLE_SRT, headers={"Idempotency-Key": "upload-1"})
+    assert response.status_code == 202
+    job = wait_for_job(response.get_json()["id"])
+    assert job["status"] == "done"
+
+    # A retry with the same key returns the stored conversation, even if the body differs
+    retry = client.post("/new-audio", data=SAMPLE_SRT.replace("blanket", "quilt"),
+                        headers={"Idempotency-Key": "upload-1"})
+    assert retry.status_code == 200
+    assert retry.get_json() == {"status": "done", "result": job["result"], "duplicate": True}
+    assert retry.headers["Location"] == f"/conversation/{job['result']}"
+
+    # So does the same transcript without a key
+    again = client.post("/new-audio", data=SAMPLE_SRT.replace("\n", "\r\n"))
+    assert again.status_code == 200 and again.get_json()["result"] == job["result"]
+    assert database["Conversations"].count_documents({}) == 1
+
+
+def test_idempotency_key_length(client):
+    response = client.post("/new-audio", data=SAMPLE_SRT,
+                           headers={"Idempotency-Key": "k" * (request_args.MAX_IDEMPOTENCY_KEY_LENGTH + 1)})
+    assert response.status_code == 400
+
+
+def test_lost_race_returns_the_winner(database):
+    winner = srt_to_conversation_rnbrad(SAMPLE_SRT)
+    store_conversation(winner, srt_hash(SAMPLE_SRT), "key")
+    loser = srt_to_conversation_rnbrad(SAMPLE_SRT)
+    assert server.persist_conversation((loser, (SAMPLE_SRT, None, srt_hash(SAMPLE_SRT), "key"))) == winner._id
+    assert database["Conversations"].count_documents({}) == 1
+
+
+@pytest.mark.parametrize("storage", [sentence_store.EMBEDDED, sentence_store.BUCKETED])
+def test_duplicate_leaves_no_orphan_buckets(database, monkeypatch, storage):
+    monkeypatch.setattr(sentence_store, "SENTENCE_STORAGE", storage)
+    first = srt_to_conversation_rnbrad(SAMPLE_SRT)
+    store_conversation(first, srt_hash(SAMPLE_SRT))
+    buckets = database["SentenceBuckets"].count_documents({})
+    assert not store_conversation(srt_to_conversation_rnbrad(SAMPLE_SRT), srt_hash(SAMPLE_SRT))
+    assert database["SentenceBuckets"].count_documents({}) == buckets
+    assert len(handle_data.get_conversation_by_id(str(first._id))["sentences"]) == len(first.sentences)
+
+
+def fail(*args, **kwargs):
+    raise RuntimeError("write failed")
+
+
+def test_retry_finishes_a_conversation_whose_rollups_failed(database, monkeypatch):
+    conversation = srt_to_conversation_rnbrad(SAMPLE_SRT)
+    monkeypatch.setattr(rollups.RollupBatch, "write", fail)
+    with pytest.raises(RuntimeError):
+        store_conversation(conversation, srt_hash(SAMPLE_SRT), "key")
+    doc = database["Conversations"].find_one({"_id": conversation._id})
+    assert doc["ingest_step"] == "rollups" and "ingest_lease" not in doc
+    assert person(database, "Ryan")["conversations"] == []
+    monkeypatch.undo()
+
+    assert find_duplicate_conversation(idempotency_key="key") == conversation._id
+    assert "ingest_step" not in database["Conversations"].find_one({"_id": conversation._id})
+    for name in ("Ryan", "Brad"):
+        assert person(database, name)["conversations"] == [conversation._id]
+        assert person(database, name)["flag_count"] == len(conversation.flags)
+    assert rollup_sentences(database) == 2 * len(conversation.sentences)  # one bucket series per participant
+
+    # Finishing again changes nothing
+    assert find_duplicate_conversation(srt_hash(SAMPLE_SRT)) == conversation._id
+    assert person(database, "Ryan")["flag_count"] == len(conversation.flags)
+    assert rollup_sentences(database) == 2 * len(conversation.sentences)
+
+
+def test_retry_after_the_people_step_failed_does_not_count_rollups_twice(database, monkeypatch, client):
+    conversation = srt_to_conversation_rnbrad(SAMPLE_SRT)
+    monkeypatch.setattr(handle_data, "_link_participants_ops", fail)
+    with pytest.raises(RuntimeError):
+        store_conversation(conversation, srt_hash(SAMPLE_SRT))
+    assert database["Conversations"].find_one({"_id": conversation._id})["ingest_step"] == "people"
+    monkeypatch.undo()
+
+    retry = client.post("/new-audio", data=SAMPLE_SRT)
+    assert retry.status_code == 200 and retry.get_json()["duplicate"]
+    assert person(database, "Brad")["conversations"] == [conversation._id]
+    assert rollup_sentences(database) == 2 * len(conversation.sentences)
+
+    # A writer that died after linking but before clearing the marker is finished without counting twice
+    handle_data._finish_ingest(conversation, "people")
+    assert person(database, "Brad")["conversations"] == [conversation._id]
+    assert person(database, "Brad")["flag_count"] == len(conversation.flags)
+
+
+def test_a_held_lease_is_respected(database, monkeypatch):
+    conversation = srt_to_conversation_rnbrad(SAMPLE_SRT)
+    monkeypatch.setattr(rollups.RollupBatch, "write", fail)
+    with pytest.raises(RuntimeError):
+        store_conversation(conversation)
+    monkeypatch.undo()
+
+    # Another writer is still working on it
+    lease = datetime.now(timezone.utc) + timedelta(minutes=1)
+    database["Conversations"].update_one({"_id": conversation._id}, {"$set": {"ingest_lease": lease}})
+    assert finish_conversation(conversation._id) is False
+    assert person(database, "Ryan")["conversations"] == []
+
+    # ... until its lease expires
+    expired = datetime.now(timezone.utc) - timedelta(seconds=1)
+    database["Conversations"].update_one({"_id": conversation._id}, {"$set": {"ingest_lease": expired}})
+    assert finish_conversation(conversation._id) is True
+    assert person(database, "Ryan")["conversations"] == [conversation._id]
+    assert finish_conversation(conversation._id) is True
+
+
+def test_bulk_store_skips_duplicates(database):
+    srts = [SAMPLE_SRT.replace("blanket", f"blanket {i}") for i in range(3)]
+    convos = [srt_to_conversation_rnbrad(s) for s in srts]
+    hashes = {c._id: srt_hash(s) for c, s in zip(convos, srts)}
+    assert handle_data.bulk_store_conversations(convos, batch_size=2, content_hashes=hashes) == 3
+
+    again = srt_to_conversation_rnbrad(srts[0])
+    assert handle_data.bulk_store_conversations([again], content_hashes={again._id: hashes[convos[0]._id]}) == 0
+    assert database["Conversations"].count_documents({}) == 3
+    assert person(database, "Ryan")["flag_count"] == sum(len(c.flags) for c in convos)
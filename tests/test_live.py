@@ -0,0 +1,89 @@
+import pytest
+
+import handle_data
+import live
+from live import ConversationNotOpen, append_segments, close_live_conversation, open_live_conversation
+from models import Sentence
+
+
+def segment(text: str, start: float, speaker: str = "Speaker 1") -> dict:
+    return {"speaker": speaker, "text": text, "start": start, "end": start + 1}
+
+
+def stored_texts(conv_id: str) -> list:
+    return [s["text"] for s in handle_data.conversations.find_one({"_id": handle_data.ObjectId(conv_id)})["sentences"]]
+
+
+def test_append_and_close(person_id):
+    conv_id = open_live_conversation()
+    assert append_segments(conv_id, [segment("Good morning", 0, "Speaker 0")]) == \
+        {"appended": 1, "flags": 0, "sentence_count": 1}
+    result = append_segments(conv_id, srt_text="1\n00:00:02,000 --> 00:00:03,000\nSpeaker 1: Shut up.\n")
+    assert result == {"appended": 1, "flags": 1, "sentence_count": 2}
+    assert stored_texts(conv_id) == ["Good morning", "Shut up."]
+
+    doc = handle_data.conversations.find_one({"_id": handle_data.ObjectId(conv_id)})
+    assert set(doc["participants"]) == {person_id("Ryan"), person_id("Brad")}
+    assert close_live_conversation(conv_id) is not None
+    with pytest.raises(ConversationNotOpen):
+        append_segments(conv_id, [segment("late", 5)])
+
+
+def test_lost_race_is_retried_on_the_new_sentence_count(monkeypatch):
+    conv_id = open_live_conversation()
+    append = handle_data.append_sentences
+    counts = []
+
+    def racing(doc, sentences, *args):
+        counts.append(doc["sentence_count"])
+        if len(counts) == 1:
+            # Another request appends between our read and our update
+            other = [Sentence(speaker=None, text="meanwhile", sentiment={"compound": 0.0},
+                              start_time=doc["start_time"])]
+            assert append(doc, other, [], [], 0.0, 0, 1.0)
+        return append(doc, sentences, *args)
+
+    monkeypatch.setattr(handle_data, "append_sentences", racing)
+    result = append_segments(conv_id, [segment("mine", 1)])
+    assert counts == [0, 1]
+    assert result == {"appended": 1, "flags": 0, "sentence_count": 2}
+    assert stored_texts(conv_id) == ["meanwhile", "mine"]
+
+
+def test_gives_up_after_max_retries(monkeypatch):
+    conv_id = open_live_conversation()
+    calls = []
+    monkeypatch.setattr(handle_data, "append_sentences", lambda *args: calls.append(args) and False)
+    with pytest.raises(RuntimeError):
+        append_segments(conv_id, [segment("never stored", 1)])
+    assert len(calls) == live.MAX_APPEND_RETRIES
+
+
+def test_closed_during_retry(monkeypatch):
+    conv_id = open_live_conversation()
+
+    def close_first(*args):
+        close_live_conversation(conv_id)
+        return False
+
+    monkeypatch.setattr(handle_data, "append_sentences", close_first)
+    with pytest.raises(ConversationNotOpen):
+        append_segments(conv_id, [segment("too late", 1)])
+
+
+def test_window_rules_see_earlier_batches():
+    conv_id = open_live_conversation()
+    # caregiver_hostility: three negative caregiver sentences within 60 seconds
+    append_segments(conv_id, [segment("Not now.", 0), segment("Not again.", 10)])
+    append_segments(conv_id, [segment("Not ever.", 20)])
+    doc = handle_data.conversations.find_one({"_id": handle_data.ObjectId(conv_id)})
+    assert ["caregiver_hostility" in s["flag_rules"] for s in doc["sentences"]] == [False, False, True]
+
+
+def test_malformed_segments(client):
+    conv_id = open_live_conversation()
+    with pytest.raises(ValueError):
+        append_segments(conv_id, [{"speaker": "Speaker 0", "text": "no times"}])
+    response = client.post(f"/live/conversations/{conv_id}/segments", json=[{"start": "soon", "end": 1}])
+    assert response.status_code == 400
+    assert client.post("/live/conversations/nope/segments", json=[segment("x", 0)]).status_code == 409
@@ -0,0 +1,110 @@
+import base64
+import json
+from datetime import datetime
+
+import pytest
+from bson import ObjectId
+
+import handle_data
+from handle_data import decode_cursor, encode_cursor, get_conversations_page, get_people_page
+from models import Conversation, Person
+
+NOON = datetime(2026, 1, 5, 12, 0)
+
+
+@pytest.fixture
+def conversations(database):
+    """Seven conversations: two without a start time, three tied at noon, two later. Returns ids in page order."""
+    start_times = [NOON, None, datetime(2026, 1, 6), NOON, None, datetime(2026, 1, 7), NOON]
+    docs = [Conversation(participants=[], start_time=t, sentiment=0.0).to_dict() for t in start_times]
+    database["Conversations"].insert_many(docs)
+    return [d["_id"] for d in sorted(docs, key=lambda d: (d["start_time"] is not None, d["start_time"] or NOON, d["_id"]))]
+
+
+def walk(limit: int, **kwargs) -> list:
+    """Ids of every conversation, page by page."""
+    ids, after = [], None
+    while True:
+        items, after = get_conversations_page(limit, after, summary=True, **kwargs)
+        ids += [ObjectId(c["_id"]) for c in items]
+        assert len(items) <= limit
+        if after is None:
+            return ids
+
+
+@pytest.mark.parametrize("limit", [1, 2, 3, 7, 50])
+def test_pages_cover_ties_and_null_start_times_once(conversations, limit):
+    assert walk(limit) == conversations
+    assert walk(limit, fast=True) == conversations
+
+
+def test_last_full_page_has_no_cursor(conversations):
+    items, after = get_conversations_page(7, summary=True)
+    assert len(items) == 7 and after is None
+
+
+def test_cursor_round_trip():
+    oid = ObjectId()
+    assert decode_cursor(encode_cursor(NOON, oid)) == [NOON.isoformat(), str(oid)]
+    assert decode_cursor(encode_cursor(None, oid)) == [None, str(oid)]
+
+
+def test_people_pages(database):
+    database["People"].insert_many([Person(f"P{i}", "Elder").to_dict() for i in range(5)])
+    names, after = [], None
+    while True:
+        items, after = get_people_page(2, after)
+        names += [p["name"] for p in items]
+        if after is None:
+            break
+    assert sorted(names) == sorted(["Ryan", "Brad"] + [f"P{i}" for i in range(5)])
+    assert len(names) == 7
+
+
+def raw_cursor(value) -> str:
+    return base64.urlsafe_b64encode(json.dumps(value).encode()).decode().rstrip("=")
+
+
+BAD_CURSORS = [
+    "bad",
+    "!!!",
+    raw_cursor({"start": "2026-01-05"}),
+    raw_cursor(["2026-01-05T12:00:00"]),
+    raw_cursor(["2026-01-05T12:00:00", "not-an-id"]),
+    raw_cursor(["yesterday", str(ObjectId())]),
+    raw_cursor([5, str(ObjectId())]),
+    raw_cursor([["2026-01-05"], str(ObjectId())]),
+]
+BAD_CURSOR_IDS = ["garbage", "not-base64", "not-a-list", "one-value", "bad-id", "bad-date", "number-date", "list-date"]
+
+
+@pytest.mark.parametrize("cursor", BAD_CURSORS, ids=BAD_CURSOR_IDS)
+def test_bad_conversation_cursors_raise_value_error(cursor):
+    with pytest.raises(ValueError):
+        handle_data.conversations_page_query(cursor)
+
+
+@pytest.mark.parametrize("cursor", BAD_CURSORS, ids=BAD_CURSOR_IDS)
+def test_bad_cursors_are_400(client, conversations, cursor):
+    response = client.get(f"/conversations?limit=2&after={cursor}")
+    assert response.status_code == 400
+    assert "error" in response.get_json()
+
+
+@pytest.mark.parametrize("cursor", ["bad", raw_cursor([5])])
+def test_bad_people_cursors_are_400(client, cursor):
+    assert client.get(f"/people?after={cursor}").status_code == 400
+
+
+def test_route_pages(client, conversations):
+    ids, url = [], "/conversations?limit=3&view=summary"
+    while url:
+        body = client.get(url).get_json()
+        ids += [ObjectId(c["_id"]) for c in body["items"]]
+        url = f"/conversations?limit=3&view=summary&after={body['next']}" if body["next"] else None
+    assert ids == conversations
+
+
+@pytest.mark.parametrize("limit", ["x", "0", "-1"])
+def test_bad_limits_are_400(client, limit):
+    assert client.get(f"/conversations?limit={limit}").status_code == 400
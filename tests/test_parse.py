@@ -0,0 +1,63 @@
+from datetime import datetime, timedelta
+
+from parse import iter_srt_cues, parse_srt_time, srt_hash, srt_to_conversation_rnbrad
+
+TWO_BLOCKS = """1
+00:00:00,000 --> 00:00:03,000
+Speaker 0: Could you please help me get up?
+
+2
+00:00:03,200 --> 00:00:05,500
+Speaker 1: Not again.
+You're always asking.
+"""
+
+
+def test_parse_srt_time():
+    assert parse_srt_time("01:02:03,450") == timedelta(hours=1, minutes=2, seconds=3, milliseconds=450)
+    assert parse_srt_time("00:00:04.5") == timedelta(seconds=4, milliseconds=500)
+
+
+def test_cues():
+    cues = list(iter_srt_cues(TWO_BLOCKS))
+    assert [c.index for c in cues] == [1, 2]
+    assert cues[1].start == timedelta(seconds=3, milliseconds=200)
+    assert cues[1].end == timedelta(seconds=5, milliseconds=500)
+    assert cues[1].lines == ["Speaker 1: Not again.", "You're always asking."]
+
+
+def test_missing_blank_line_between_blocks():
+    srt = TWO_BLOCKS.replace("get up?\n\n2\n", "get up?\n2\n")
+    assert list(iter_srt_cues(srt)) == list(iter_srt_cues(TWO_BLOCKS))
+
+
+def test_crlf_input():
+    assert list(iter_srt_cues(TWO_BLOCKS.replace("\n", "\r\n"))) == list(iter_srt_cues(TWO_BLOCKS))
+    assert srt_hash(TWO_BLOCKS.replace("\n", "\r\n")) == srt_hash(TWO_BLOCKS)
+
+
+def test_file_like_source():
+    assert list(iter_srt_cues(iter(TWO_BLOCKS.splitlines(keepends=True)))) == list(iter_srt_cues(TWO_BLOCKS))
+
+
+def test_blocks_without_text_and_leading_garbage_are_skipped():
+    srt = "WEBVTT\n\n1\n00:00:00,000 --> 00:00:01,000\n\n" + TWO_BLOCKS.replace("1\n00:00:00", "7\n00:00:00", 1)
+    cues = list(iter_srt_cues(srt))
+    assert [c.index for c in cues] == [7, 2]
+
+
+def test_conversation(person_id):
+    start = datetime(2026, 1, 5, 9, 30)
+    convo = srt_to_conversation_rnbrad(TWO_BLOCKS, recording_start=start)
+    ryan, brad = person_id("Ryan"), person_id("Brad")
+    assert [s.speaker for s in convo.sentences] == [ryan, brad]
+    assert convo.sentences[1].text == "Not again. You're always asking."
+    assert convo.sentences[1].start_time == start + timedelta(seconds=3.2)
+    assert convo.sentences[1].total_time == 2.3
+    assert convo.start_time == start
+    assert set(convo.participants) == {ryan, brad}
+
+
+def test_hash_ignores_layout():
+    assert srt_hash(TWO_BLOCKS) == srt_hash(TWO_BLOCKS.replace("\n\n", "\n\n\n"))
+    assert srt_hash(TWO_BLOCKS) != srt_hash(TWO_BLOCKS.replace("Not again", "Fine"))
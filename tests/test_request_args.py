@@ -0,0 +1,49 @@
+from datetime import datetime
+
+import pytest
+from werkzeug.datastructures import Headers, MultiDict
+
+import request_args
+from handle_data import store_conversation
+from parse import srt_to_conversation_rnbrad
+from server import SAMPLE_SRT
+
+
+def test_page_args():
+    assert request_args.page_args(MultiDict()) is None
+    assert request_args.page_args(MultiDict({"after": "x"})) == (request_args.DEFAULT_PAGE_SIZE, "x")
+    assert request_args.page_args(MultiDict({"limit": "5000"})) == (request_args.MAX_PAGE_SIZE, None)
+    for limit in ("x", "0"):
+        with pytest.raises(ValueError):
+            request_args.page_args(MultiDict({"limit": limit}))
+
+
+def test_search_args(person_id):
+    found = {"Ryan": person_id("Ryan")}
+    args = MultiDict({"q": " pills ", "person": "Ryan", "start": "2026-01-05", "max_compound": "-0.5"})
+    assert request_args.search_query(args) == "pills"
+    assert request_args.search_names(args) == ["Ryan"]
+    assert request_args.search_args(args, found) == {
+        "person_id": person_id("Ryan"), "speaker_id": None, "start": datetime(2026, 1, 5), "end": None,
+        "min_compound": None, "max_compound": -0.5, "limit": request_args.DEFAULT_SEARCH_LIMIT, "offset": 0,
+    }
+    with pytest.raises(ValueError):
+        request_args.search_query(MultiDict({"q": " "}))
+    for bad in ({"offset": "-1"}, {"start": "soon"}, {"min_compound": "low"}):
+        with pytest.raises(ValueError):
+            request_args.search_args(MultiDict(bad), {})
+
+
+def test_headers():
+    assert request_args.idempotency_key(Headers()) is None
+    with pytest.raises(ValueError):
+        request_args.idempotency_key(Headers({"Idempotency-Key": "k" * (request_args.MAX_IDEMPOTENCY_KEY_LENGTH + 1)}))
+    assert request_args.last_event_id(Headers({"Last-Event-ID": "7"}), MultiDict({"last_event_id": "3"})) == 7
+    assert request_args.last_event_id(Headers(), MultiDict({"last_event_id": "soon"})) is None
+
+
+@pytest.mark.parametrize("query", ["offset=-1", "limit=0", "start=yesterday", "limit=x"])
+def test_bad_sentence_pages_are_400(client, query):
+    convo = srt_to_conversation_rnbrad(SAMPLE_SRT)
+    store_conversation(convo)
+    assert client.get(f"/conversation/{convo._id}/sentences?{query}").status_code == 400
@@ -0,0 +1,80 @@
+import pytest
+
+import handle_data
+import sentence_store
+from live import append_segments, close_live_conversation, open_live_conversation
+from models import Sentence
+
+
+@pytest.fixture(autouse=True)
+def bucketed(monkeypatch):
+    monkeypatch.setattr(sentence_store, "SENTENCE_STORAGE", sentence_store.BUCKETED)
+    monkeypatch.setattr(sentence_store, "SENTENCE_BUCKET_SIZE", 3)
+
+
+def segments(*texts, start: float = 0) -> list:
+    return [{"speaker": "Speaker 0", "text": t, "start": start + i, "end": start + i + 1} for i, t in enumerate(texts)]
+
+
+def lazy(conv_id: str):
+    return handle_data.conversation_from_doc(handle_data.conversations.find_one({"_id": handle_data.ObjectId(conv_id)}))
+
+
+def texts(conv_id: str) -> list:
+    return [s.text for s in lazy(conv_id).sentences]
+
+
+def test_appends_fill_buckets_in_order(database):
+    conv_id = open_live_conversation()
+    append_segments(conv_id, segments("one", "two"))
+    append_segments(conv_id, segments("three", "four", "five", "six", "seven", start=2))
+    assert texts(conv_id) == ["one", "two", "three", "four", "five", "six", "seven"]
+    buckets = list(database["SentenceBuckets"].find({}, {"_id": 0, "index": 1, "first": 1, "count": 1}).sort("index", 1))
+    assert buckets == [{"index": 0, "first": 0, "count": 3}, {"index": 1, "first": 3, "count": 3},
+                       {"index": 2, "first": 6, "count": 1}]
+
+
+def test_lost_bucket_race_writes_nothing(database):
+    conv_id = open_live_conversation()
+    append_segments(conv_id, segments("one"))
+    live = handle_data.get_open_conversation(conv_id)
+    mine = [Sentence(speaker=None, text="mine", sentiment={"compound": 0.0}, start_time=live["start_time"])]
+    # Another append already took position 1 in the bucket
+    assert sentence_store.append(live["_id"], [mine[0].to_dict()], 1, 3)
+    assert not handle_data.append_sentences(live, mine, [], [], 0.0, 0, 1.0)
+    assert database["SentenceBuckets"].find_one({"index": 0})["count"] == 2
+
+
+def test_append_to_a_closed_conversation_is_undone(database):
+    conv_id = open_live_conversation()
+    append_segments(conv_id, segments("one", "two"))
+    live = handle_data.get_open_conversation(conv_id)
+    close_live_conversation(conv_id)
+    late = [Sentence(speaker=None, text=t, sentiment={"compound": 0.0}, start_time=live["start_time"])
+            for t in ("three", "four")]
+    assert not handle_data.append_sentences(live, late, [], [], 0.0, 0, 1.0)
+    assert [b["count"] for b in database["SentenceBuckets"].find().sort("index", 1)] == [2]
+    assert texts(conv_id) == ["one", "two"]
+
+
+def test_uncounted_sentences_are_hidden(database):
+    conv_id = open_live_conversation()
+    append_segments(conv_id, segments("one", "two"))
+    live = handle_data.get_open_conversation(conv_id)
+    # Written to the buckets, but the conversation update hasn't happened yet
+    sentence_store.append(live["_id"], [{"text": t} for t in ("three", "four")], 2, 3)
+    assert texts(conv_id) == ["one", "two"]
+    assert [s["text"] for s in handle_data.get_conversations_by_ids([conv_id], fast=True)[0]["sentences"]] == \
+        ["one", "two"]
+    assert [s["text"] for s in handle_data.get_conversation_sentences(conv_id)["sentences"]] == ["one", "two"]
+    assert handle_data.get_conversation_sentences(conv_id, start=live["start_time"])["total"] == 2
+
+
+def test_iteration_follows_bucket_lengths(database):
+    conv_id = open_live_conversation()
+    append_segments(conv_id, segments("one", "two", "three", "four", "five"))
+    # A short first bucket must not shift the sentences of the next one
+    database["SentenceBuckets"].update_one({"index": 0}, {"$pop": {"sentences": 1}, "$inc": {"count": -1}})
+    sentences = lazy(conv_id).sentences
+    assert [s.text for s in sentences] == ["one", "two", "four", "five"]
+    assert [sentences[3].text, sentences[4].text] == ["four", "five"]
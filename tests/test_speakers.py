@@ -0,0 +1,54 @@
+import pytest
+
+import handle_data
+from speakers import SpeakerRegistry, registry
+
+
+def test_default_device_maps_ryan_and_brad(person_id):
+    assert registry.resolve() == {"Speaker 0": person_id("Ryan"), "Speaker 1": person_id("Brad")}
+    assert registry.roles() == {person_id("Ryan"): "Elder", person_id("Brad"): "Caregiver"}
+    assert registry.resolve("kitchen") == registry.resolve()
+
+
+def test_missing_default_people(database):
+    database["People"].delete_many({})
+    with pytest.raises(ValueError):
+        registry.resolve()
+
+
+def test_changes_reach_other_processes(person_id):
+    # A registry that is not a listener of this process's writes, like another worker's
+    other_process = SpeakerRegistry()
+    assert other_process.resolve("kitchen")["Speaker 0"] == person_id("Ryan")
+
+    assert handle_data.set_speaker("kitchen", "Speaker 0", str(person_id("Brad")))
+    assert other_process.resolve("kitchen") == {"Speaker 0": person_id("Brad")}
+    assert handle_data.update_person_role_by_name("Brad", "Nurse")
+    assert other_process.roles("kitchen") == {person_id("Brad"): "Nurse"}
+
+
+def test_lookups_are_cached(monkeypatch):
+    loads = []
+    load = registry._load
+    monkeypatch.setattr(registry, "_load", lambda device: loads.append(device) or load(device))
+    registry.resolve()
+    registry.resolve()
+    assert loads == ["default"]
+
+
+def test_load_overlapping_an_invalidation_is_not_kept(monkeypatch, person_id):
+    loads = []
+    load = registry._load
+
+    def racing(device):
+        result = load(device)
+        loads.append(device)
+        if len(loads) == 1:
+            # The mapping changes after this load read it
+            handle_data.set_speaker("default", "Speaker 0", str(person_id("Brad")))
+        return result
+
+    monkeypatch.setattr(registry, "_load", racing)
+    assert registry.resolve()["Speaker 0"] == person_id("Ryan")
+    assert registry.resolve()["Speaker 0"] == person_id("Brad")
+    assert len(loads) == 2